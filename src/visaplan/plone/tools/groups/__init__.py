@@ -2,8 +2,9 @@
 # visaplan.plone.tools; groups package: information function factories
 
 # Local imports:
-from ._group import groupinfo_factory
-from ._helpers import build_groups_set, split_group_id
+from ._events import ensure_groups_version
+from ._group import groupinfo_factory, object_groups_factory
+from ._helpers import build_groups_set, split_group_id, split_group_ids
 from ._membership import (
     get_all_members,
     is_direct_member__factory,
@@ -11,4 +12,9 @@ from ._membership import (
     is_member_of_any,
     recursive_members,
     )
+from ._search import (
+    GroupSearchIndex,
+    groupsearch_factory,
+    invalidate_group_search,
+    )
 from ._user import userinfo_factory
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*- äöü vim: ts=8 sts=4 sw=4 si et hls tw=79
+"""
+visaplan.plone.tools.groups: Event-Subscriber
+
+Die prozessweit vorgehaltenen Indexe der Gruppen und Mitgliedschaften
+(siehe ._helpers) sind an einen Versionszähler gebunden, der hier bei allen
+Änderungen erhöht wird; in den Suchindexen (siehe ._search) werden erzeugte
+und gelöschte Gruppen nach dem Commit vorgemerkt (registriert in
+configure.zcml).
+Änderungen, die an der PAS-API vorbei direkt in den Dictionarys des
+Gruppen-Plugins vorgenommen werden, bemerkt der Zähler nicht!
+Gelöschte Gruppen werden nur gemeldet, wenn sie über portal_groups
+(PlonePAS) gelöscht werden; ZODBGroupManager.removeGroup löst selbst kein
+Ereignis aus.
+
+Solange es den Zähler nicht gibt, werden die Indexe nicht verwendet;
+für bestehende Sites ist er daher mit ensure_groups_version anzulegen
+(z. B. in einem Upgrade-Schritt).
+"""
+# Python compatibility:
+from __future__ import absolute_import
+
+from six import string_types as six_string_types
+
+# Zope:
+from Acquisition import aq_base
+from BTrees.Length import Length
+from Products.CMFCore.utils import getToolByName
+from zope.component.hooks import getSite
+
+# Local imports:
+from ._helpers import VERSION_ATTRIBUTE
+from ._search import invalidate_group_search
+
+__all__ = [
+    'bump_groups_version',
+    'ensure_groups_version',
+    ]
+
+
+def bump_groups_version(plugin):
+    """
+    Erhöhe den Versionszähler des übergebenen Gruppen-Plugins
+    (normalerweise acl_users.source_groups); siehe ._helpers._groups_version.
+
+    Der Zähler ist ein eigenes persistentes Objekt (BTrees.Length.Length),
+    dessen Konfliktauflösung gleichzeitige Erhöhungen addiert; das Plugin
+    selbst wird nur beim ersten Aufruf geändert.
+    """
+    counter = getattr(aq_base(plugin), VERSION_ATTRIBUTE, None)
+    if counter is None:
+        counter = Length()
+        setattr(plugin, VERSION_ATTRIBUTE, counter)
+    counter.change(1)
+
+
+def ensure_groups_version(context, logger=None):
+    """
+    Upgrade-Schritt bzw. Setuphandler: lege den Versionszähler der Gruppen
+    (siehe bump_groups_version) an, sofern noch nicht vorhanden, damit die
+    zwischengespeicherten Indexe verwendet werden können, ohne auf die
+    erste Änderung einer Gruppe zu warten;
+    gib True zurück, wenn er angelegt wurde.
+
+    context -- ein beliebiges Objekt der Site (z. B. portal_setup)
+    """
+    acl = getToolByName(context, 'acl_users')
+    plugin = acl.source_groups
+    if getattr(aq_base(plugin), VERSION_ATTRIBUTE, None) is not None:
+        return False
+    setattr(plugin, VERSION_ATTRIBUTE, Length())
+    if logger is not None:
+        logger.info('%(plugin)r: groups version counter created', locals())
+    return True
+
+
+def _acl_users():
+    site = getSite()
+    if site is None:
+        return None
+    return getToolByName(site, 'acl_users', None)
+
+
+def _is_group(principal):
+    is_group = getattr(principal, 'isGroup', None)
+    return is_group is not None and is_group()
+
+
+def groups_changed(event):
+    """
+    Subscriber: Gruppen oder Mitgliedschaften wurden geändert
+    (Gruppe erzeugt oder gelöscht, Principal gelöscht,
+    Principal zu Gruppe hinzugefügt oder daraus entfernt)
+
+    Eine Gruppe wird über die PAS-API erzeugt und wieder gelöscht;
+    die zwischengespeicherten Gruppen des Objekts folgen jeweils nach dem
+    Commit:
+
+    >>> import transaction
+    >>> import zope.component.event
+    >>> from ZODB import DB
+    >>> from ZODB.MappingStorage import MappingStorage
+    >>> from OFS.Folder import Folder
+    >>> from zope.component import getGlobalSiteManager, provideHandler
+    >>> from zope.component.hooks import setSite
+    >>> from Products.PluggableAuthService.interfaces.events import (
+    ...     IGroupCreatedEvent, IGroupDeletedEvent)
+    >>> from Products.PluggableAuthService.plugins.ZODBGroupManager import (
+    ...     ZODBGroupManager)
+    >>> from visaplan.plone.tools.groups import object_groups_factory
+    >>> provideHandler(groups_changed, [IGroupCreatedEvent])
+    >>> provideHandler(groups_changed, [IGroupDeletedEvent])
+    >>> class Site(object):
+    ...     def getSiteManager(self):
+    ...         return getGlobalSiteManager()
+    >>> conn = DB(MappingStorage()).open()
+    >>> site = Site()
+    >>> acl = site.acl_users = conn.root()['acl_users'] = Folder('acl_users')
+    >>> acl._setObject('source_groups', ZODBGroupManager('source_groups'))
+    'source_groups'
+    >>> setSite(site)
+    >>> ensure_groups_version(site)
+    True
+    >>> transaction.commit()
+
+    >>> uid = '0123456789abcdef0123456789abcdef'
+    >>> object_groups_factory(site)(uid)
+    {}
+    >>> acl.source_groups.addGroup('group_%s_Reader' % uid)
+    >>> transaction.commit()
+    >>> object_groups_factory(site)(uid)
+    {'Reader': 'group_0123456789abcdef0123456789abcdef_Reader'}
+
+    Das Plugin selbst meldet das Löschen nicht; das Ereignis wird von
+    portal_groups.removeGroup (PlonePAS) ausgelöst:
+
+    >>> from zope.event import notify
+    >>> from Products.PluggableAuthService.events import GroupDeleted
+    >>> acl.source_groups.removeGroup('group_%s_Reader' % uid)
+    >>> notify(GroupDeleted('group_%s_Reader' % uid))
+    >>> transaction.commit()
+    >>> object_groups_factory(site)(uid)
+    {}
+
+    Aufräumen:
+
+    >>> setSite(None)
+    >>> gsm = getGlobalSiteManager()
+    >>> gsm.unregisterHandler(groups_changed, [IGroupCreatedEvent])
+    True
+    >>> gsm.unregisterHandler(groups_changed, [IGroupDeletedEvent])
+    True
+    >>> conn.close()
+    """
+    acl = _acl_users()
+    if acl is None:
+        return
+    bump_groups_version(acl.source_groups)
+
+
+def group_search_changed(event):
+    """
+    Subscriber: eine Gruppe wurde erzeugt oder gelöscht;
+    sie wird nach dem Commit in den Suchindexen der Site vorgemerkt
+    (siehe invalidate_group_search)
+
+    >>> import transaction
+    >>> from OFS.Folder import Folder
+    >>> from zope.component import getGlobalSiteManager
+    >>> from zope.component.hooks import setSite
+    >>> from Products.PluggableAuthService.events import (
+    ...     GroupCreated, GroupDeleted)
+    >>> from ._search import _INDEXES, GroupSearchIndex
+    >>> class Site(object):
+    ...     acl_users = Folder('acl_users')
+    ...     def getSiteManager(self):
+    ...         return getGlobalSiteManager()
+    >>> setSite(Site())
+    >>> index = _INDEXES[('acl_users', 'de')] = GroupSearchIndex()
+    >>> group_search_changed(GroupCreated('group_a', None))
+    >>> index.pending
+    False
+    >>> transaction.commit()
+    >>> index.pending
+    True
+
+    Bei Abbruch der Transaktion wird nichts vorgemerkt:
+
+    >>> group_search_changed(GroupDeleted('group_b'))
+    >>> transaction.abort()
+    >>> sorted(index._pending)
+    ['group_a']
+    >>> _INDEXES.clear()
+    >>> setSite(None)
+    """
+    principal = event.principal
+    if isinstance(principal, six_string_types):
+        group_id = principal
+    elif _is_group(principal):
+        group_id = principal.getId()
+    else:
+        return
+    site = getSite()
+    if site is None:
+        return
+    invalidate_group_search(site, [group_id])
@@ -16,8 +16,12 @@ from ._data import PRETTY_MASK
 from ._group_pio import _parse_init_options
 # since this function uses some quite application specific data,
 # it is a hot candidate for an initialiation option:
-from ._helpers import split_group_id
-from visaplan.plone.tools.context import make_translator, getbrain
+from ._helpers import _groups_version, _object_groups_index, split_group_id
+from visaplan.plone.tools.context import (
+    getActiveLanguage,
+    getbrain,
+    make_translator,
+    )
 
 try:
     # visaplan:
@@ -42,6 +46,7 @@ except ImportError:
 
 __all__ = [
     'groupinfo_factory',
+    'object_groups_factory',
     ]
 
 
@@ -66,6 +71,11 @@ def groupinfo_factory(context, *args, **kwargs):
                   diese nimmt keinee Gruppen-ID entgegen (wie die andernfalls
                   erzeugten Funktionen), sondern ein von diesen erzeugtes
                   Info-Dict.
+    many -- Erzeuge eine Funktion, die eine Sequenz von Gruppen-IDs (bzw.
+            mit searchtext: Info-Dicts) entgegennimmt und eine Liste der
+            Ergebnisse zurückgibt.  Dabei werden die von den Gruppen
+            referenzierten Objekte mit einer einzigen Katalogsuche ermittelt,
+            und Übersetzungen werden für den ganzen Aufruf wiederverwendet.
     """
     _parse_init_options(kwargs, args)
     pretty = kwargs['pretty']
@@ -77,11 +87,12 @@ def groupinfo_factory(context, *args, **kwargs):
     missing = kwargs['missing']
     missing_mask = kwargs.get('missing_group_mask') or None
     searchtext = kwargs['searchtext']
+    many = kwargs['many']
 
     acl = getToolByName(context, 'acl_users')
-    pg = getToolByName(context, 'portal_groups')
-    get_group = pg.getGroupById
-    translate = make_translator(context)
+    acl_path = '/'.join(acl.getPhysicalPath())
+    language = getActiveLanguage(context)
+    translate = make_translator(context, target_language=language)
     GROUPS = acl.source_groups._groups
     if missing:
         missing_mask = translate(missing_mask)
@@ -90,8 +101,6 @@ def groupinfo_factory(context, *args, **kwargs):
         """
         Return a dict with keys 'id', 'group_title', or empty.
         """
-        group = get_group(group_id)
-
         try:
             thegroup = GROUPS[group_id]
         except KeyError:
@@ -109,7 +118,7 @@ def groupinfo_factory(context, *args, **kwargs):
                 dict_['exists'] = 1
             return dict_
 
-    def basic_group_info(group_id):
+    def basic_group_info(group_id, brains=None, translate=translate):
         """
         Gib ein Dict. zurück;
         - immer vorhandene Schlüssel:
@@ -118,10 +127,9 @@ def groupinfo_factory(context, *args, **kwargs):
 
         Argumente:
         group_id -- ein String, normalerweise mit 'group_' beginnend
+        brains -- (für many=True) ein Dict UID --> Brain, schon ermittelt
+        translate -- (für many=True) die zu verwendende Übersetzungsfunktion
         """
-
-        group = get_group(group_id)
-
         try:
             thegroup = GROUPS[group_id]
         except KeyError:
@@ -149,15 +157,18 @@ def groupinfo_factory(context, *args, **kwargs):
 
         # refered object (for <group_><uid>[_role]:
         dict_['role_translation'] = translate(dic['role'])  # local role-to-be-mapped
-        dict_['brain'] = getbrain(context, dic['uid'])  # refered object
+        if brains is None:
+            dict_['brain'] = getbrain(context, dic['uid'])  # refered object
+        else:
+            dict_['brain'] = brains.get(dic['uid'])
         return dict_
 
-    def pretty_group_info(group_id):
+    def pretty_group_info(group_id, brains=None, translate=translate):
         """
         Ruft basic_group_info auf und fügt einen Schlüssel 'pretty_title'
         hinzu, der den Gruppentitel ohne das Rollensuffix enthält.
         """
-        dic = basic_group_info(group_id)
+        dic = basic_group_info(group_id, brains, translate)
         if not dic:
             assert not missing
             return dic
@@ -168,19 +179,11 @@ def groupinfo_factory(context, *args, **kwargs):
             dic['pretty_title'] = missing_mask.format(**dic)
             return dic
 
-        if 'role' not in dic:
-            dic['pretty_title'] = translate(dic['group_title'])
-            return dic
-        liz = dic['group_title'].split()
-        if liz and liz[-1] == dic['role']:
-            stem = u' '.join(liz[:-1])
-            mask = PRETTY_MASK[dic['role']]
-            dic['pretty_title'] = translate(mask).format(group=stem)
-        else:
-            dic['pretty_title'] = translate(dic['group_title'])
+        dic['pretty_title'] = pretty_title(group_id, dic['group_title'],
+                                           dic.get('role'), translate)
         return dic
 
-    def minimal2_group_info(group_id):
+    def minimal2_group_info(group_id, translate=translate):
         """
         Ruft minimal_group_info auf und modifiziert ggf. den Schlüssel
         'group_title' (entsprechend dem von pretty_group_info zurückgegebenen
@@ -197,19 +200,41 @@ def groupinfo_factory(context, *args, **kwargs):
         dic2 = split_group_id(group_id)
         if dic2['role'] is not None:
             dic.update(dic2)
-        if 'role' not in dic:
-            dic['group_title'] = translate(dic['group_title'])
-            return dic
-        liz = dic['group_title'].split()
-        if liz and liz[-1] == six_text_type(dic['role']):
-            stem = u' '.join(liz[:-1])
-            mask = PRETTY_MASK[dic['role']]
-            dic['group_title'] = translate(mask).format(group=stem)
-        else:
-            dic['group_title'] = translate(dic['group_title'])
+        dic['group_title'] = pretty_title(group_id, dic['group_title'],
+                                          dic.get('role'), translate)
         return dic
 
-    def make_searchstring(group_info):
+    def pretty_title(group_id, title, role, translate=translate):
+        """
+        Gib den Gruppentitel ohne das Rollensuffix zurück, übersetzt;
+        zwischengespeichert je Site, Gruppe und Sprache, solange sich der
+        Titel nicht ändert
+        """
+        key = (acl_path, group_id, language)
+        try:
+            cached_title, res = _PRETTY_TITLES[key]
+        except KeyError:
+            pass
+        else:
+            if cached_title == title:
+                return res
+        if role is None:
+            res = translate(title)
+        else:
+            liz = title.split()
+            if liz and liz[-1] == six_text_type(role):
+                stem = u' '.join(liz[:-1])
+                mask = PRETTY_MASK[role]
+                res = translate(mask).format(group=stem)
+            else:
+                res = translate(title)
+        # a full cache keeps its entries (see ._helpers._split_items),
+        # but changed titles are replaced:
+        if key in _PRETTY_TITLES or len(_PRETTY_TITLES) < _PRETTY_TITLES_SIZE:
+            _PRETTY_TITLES[key] = (title, res)
+        return res
+
+    def make_searchstring(group_info, translate=translate):
         """
         Arbeite direkt auf einem group_info-Dict;
         Gib kein Dict zurück, sondern einen String für Suchzwecke
@@ -242,15 +267,102 @@ def groupinfo_factory(context, *args, **kwargs):
             res.append(safe_decode(descr))
         return u' '.join(res)
 
+    def brains_by_uid(group_ids):
+        """
+        Ermittle die von den Gruppen referenzierten Objekte
+        mit einer einzigen Katalogsuche
+        """
+        uids = set()
+        for group_id in group_ids:
+            uid = split_group_id(group_id)['uid']
+            if uid is not None:
+                uids.add(uid)
+        res = {}
+        if uids:
+            pc = getToolByName(context, 'portal_catalog')._catalog
+            for brain in pc(UID=sorted(uids)):
+                res.setdefault(brain.UID, brain)
+        return res
+
     if searchtext:
-        return make_searchstring
-    if forlist:
+        func = make_searchstring
+    elif forlist:
         if pretty:
-            return minimal2_group_info
+            func = minimal2_group_info
         else:
-            return minimal_group_info
-    if pretty:
-        return pretty_group_info
+            func = minimal_group_info
+    elif pretty:
+        func = pretty_group_info
     else:
-        return basic_group_info
+        func = basic_group_info
+    if not many:
+        return func
+
+    def many_group_infos(group_ids):
+        """
+        Gib die Liste der Ergebnisse für die übergebenen Gruppen-IDs
+        (bzw. Info-Dicts) zurück
+        """
+        group_ids = list(group_ids)
+        kw = {}
+        if func is not minimal_group_info:
+            kw['translate'] = _cached(translate)
+        if func in (basic_group_info, pretty_group_info):
+            kw['brains'] = brains_by_uid(group_ids)
+        return [func(group_id, **kw)
+                for group_id in group_ids]
+
+    return many_group_infos
 # -------------------------------- ] ... groupinfo_factory ]
+
+# (Pfad von acl_users, Gruppen-ID, Sprache)
+#   --> (Titel, übersetzter "hübscher" Titel):
+_PRETTY_TITLES = {}
+_PRETTY_TITLES_SIZE = 50000
+
+
+def object_groups_factory(context):
+    """
+    Erzeuge eine Funktion, die für eine UID die an das Objekt gebundenen
+    Gruppen (group_<uid>_<suffix>) als Dict Suffix --> Gruppen-ID zurückgibt,
+    ohne alle Gruppen-IDs durchzugehen.
+
+    Der zugrundeliegende Index wird prozessweit (je acl_users) vorgehalten;
+    beim Erzeugen der Funktion wird er mit den aktuellen Gruppen-IDs
+    abgeglichen, sofern er nicht schon der Version der Gruppen im Snapshot
+    des Aufrufers entspricht (siehe ._helpers._groups_version); dabei werden
+    nur neue Gruppen-IDs zerlegt.
+    """
+    acl = getToolByName(context, 'acl_users')
+    plugin = acl.source_groups
+    index = _object_groups_index('/'.join(acl.getPhysicalPath()),
+                                 plugin._groups,
+                                 _groups_version(plugin))
+    return index.groups_of
+
+
+def _cached(func):
+    """
+    Gib eine Variante der übergebenen Funktion (mit einem Argument) zurück,
+    die sich ihre Ergebnisse merkt (z. B. für Übersetzungen)
+
+    >>> calls = []
+    >>> def upper(s):
+    ...     calls.append(s)
+    ...     return s.upper()
+    >>> cached_upper = _cached(upper)
+    >>> cached_upper('a'), cached_upper('b'), cached_upper('a')
+    ('A', 'B', 'A')
+    >>> calls
+    ['a', 'b']
+    """
+    cache = {}
+
+    def cached_func(arg):
+        try:
+            return cache[arg]
+        except KeyError:
+            res = cache[arg] = func(arg)
+            return res
+
+    return cached_func
@@ -5,8 +5,12 @@ from __future__ import absolute_import, print_function
 from six import iteritems as six_iteritems
 from six import text_type as six_text_type
 
+# Standard library:
+from threading import Lock
+
 __all__ = [
     'split_group_id',
+    'split_group_ids',
     'build_groups_set',
     ],
 
@@ -61,6 +65,7 @@ COURSE_GROUP_SUFFIXES = [LEARNER_SUFFIX, ALUMNI_SUFFIX]
 # -------------------------------- ] ... Gruppen für Kurse ]
 ALL_GROUP_SUFFIXES = STRUCTURE_GROUP_SUFFIXES + COURSE_GROUP_SUFFIXES
 UID_CHARS = frozenset('0123456789abcdef')
+HEX_DIGITS = '0123456789abcdef'  # for str.strip
 SIMPLE_GROUP_INFO = {
         'uid': None,
         # das (z B. für 'Author') von der Rolle verschiedene *Suffix*:
@@ -71,6 +76,10 @@ RESOLVED_GROUP_INFO = {
         'suffix': None,
         'role': None,  # hier die real zuzuordnende Rolle
         }
+_SIMPLE_NONE_ITEMS = (('uid', None), ('role', None))
+_RESOLVED_NONE_ITEMS = (('uid', None), ('suffix', None), ('role', None))
+# Attribut des Gruppen-Plugins für den Versionszähler (siehe _groups_version):
+VERSION_ATTRIBUTE = '_visaplan_groups_version'
 PRETTY_MASK = {}
 for role in ALL_GROUP_SUFFIXES:
     PRETTY_MASK[role] = u'%s group "{group}"' % role
@@ -174,36 +183,146 @@ def split_group_id(gid, resolve_role=False):
     >>> sgi('group_f6350ab731c3601e925eac482206bda5_alumni')
     [('role', None), ('suffix', 'alumni'), ('uid', 'f6350ab731c3601e925eac482206bda5')]
 
+    Die Ergebnisse werden (als unveränderliche Tupel) zwischengespeichert
+    (siehe _split_items); zurückgegeben wird aber jeweils ein neues Dict:
+    >>> gid = 'group_f6350ab731c3601e925eac482206bda5_Reader'
+    >>> split_group_id(gid) is split_group_id(gid)
+    False
+    >>> _SPLIT_CACHE[(gid, False, type(gid))]
+    (('uid', 'f6350ab731c3601e925eac482206bda5'), ('role', 'Reader'))
+    """
+    return dict(_split_items(gid, resolve_role))
+
+
+# (Gruppen-ID, resolve_role, Typ) --> Tupel der Items:
+_SPLIT_CACHE = {}
+# maximale Anzahl der Einträge; wird von split_group_ids ggf. erhöht:
+_SPLIT_CACHE_SIZE = [100000]
+
+
+def _split_items(gid, resolve_role):
+    """
+    Gib die Items des Ergebnisses von split_group_id als Tupel zurück,
+    nach Möglichkeit aus dem Cache.
+
+    Ist der Cache voll, werden neue Ergebnisse nicht mehr aufgenommen
+    (die vorhandenen Einträge bleiben also nutzbar, statt bei jedem
+    Durchlauf über mehr Gruppen-IDs verdrängt zu werden):
+
+    >>> _SPLIT_CACHE.clear()
+    >>> size = _SPLIT_CACHE_SIZE[0]
+    >>> _SPLIT_CACHE_SIZE[0] = 1
+    >>> _split_items('group_a', False)
+    (('uid', None), ('role', None))
+    >>> _split_items('group_b', False)
+    (('uid', None), ('role', None))
+    >>> [key[0] for key in _SPLIT_CACHE]
+    ['group_a']
+    >>> _SPLIT_CACHE_SIZE[0] = size
+    """
+    key = (gid, resolve_role, type(gid))  # (unicode == str in Python 2)
+    items = _SPLIT_CACHE.get(key)  # (a failing get is cheaper than KeyError)
+    if items is None:
+        items = _split_group_id(gid, resolve_role)
+        if len(_SPLIT_CACHE) < _SPLIT_CACHE_SIZE[0]:
+            _SPLIT_CACHE[key] = items
+    return items
+
+
+def _split_group_id(gid, resolve_role):
+    """
+    Arbeitspferd für split_group_id: gib die Items des Ergebnisses
+    als Tupel zurück
+
+    >>> _split_group_id('group_f6350ab731c3601e925eac482206bda5_Author', True)
+    (('uid', 'f6350ab731c3601e925eac482206bda5'), ('suffix', 'Author'), ('role', 'Editor'))
+    >>> _split_group_id('group_f6350ab731c3601e925eac482206bda5_Foo', False)
+    (('uid', None), ('role', None))
     """
-    liz = gid.split('_', 2)
     if resolve_role:
-        res = dict(RESOLVED_GROUP_INFO)
+        failed = _RESOLVED_NONE_ITEMS
     else:
-        res = dict(SIMPLE_GROUP_INFO)
-
+        failed = _SIMPLE_NONE_ITEMS
+    liz = gid.split('_', 2)
     if not liz[2:]:
-        return res
+        return failed
     elif liz[0] != 'group':
-        return res
-    elif liz[2] not in ALL_GROUP_SUFFIXES:
-        return res
+        return failed
+    suffix = liz[2]
+    if suffix not in ALL_GROUP_SUFFIXES:
+        return failed
     uid = liz[1]
-    if not uid:
-        return res
-    elif set(uid).difference(UID_CHARS):
-        return res
-    elif len(uid) != 32:
-        return res
-    res['uid'] = uid
+    if len(uid) != 32:
+        return failed
+    elif uid.strip(HEX_DIGITS):  # (faster than a set difference)
+        return failed
     if resolve_role:
-        res['suffix'] = suffix = liz[2]
-        res['role'] = SUFFIX2ROLE[suffix]
-    else:
-        res['role'] = liz[2]
-    return res
+        return (('uid', uid),
+                ('suffix', suffix),
+                ('role', SUFFIX2ROLE[suffix]))
+    return (('uid', uid),
+            ('role', suffix))
 
 
-def build_groups_set(dic, userid):
+def split_group_ids(gids, resolve_role=False):
+    """
+    Wie split_group_id, aber für eine ganze Sequenz von Gruppen-IDs;
+    gib eine Liste der Ergebnisse zurück.
+
+    Die Größe des Caches wird ggf. an die Anzahl der übergebenen IDs
+    angepaßt (normalerweise die Gruppen der Site), damit wiederholte
+    Aufrufe für alle Gruppen ihn nutzen können.
+
+    >>> res = split_group_ids(['group_f6350ab731c3601e925eac482206bda5_learner',
+    ...                        'group_plain'], resolve_role=True)
+    >>> [sorted(dic.items()) for dic in res]    # doctest: +NORMALIZE_WHITESPACE
+    [[('role', 'Reader'), ('suffix', 'learner'),
+      ('uid', 'f6350ab731c3601e925eac482206bda5')],
+     [('role', None), ('suffix', None), ('uid', None)]]
+    """
+    if not isinstance(gids, (list, tuple)):
+        gids = list(gids)
+    if len(gids) > _SPLIT_CACHE_SIZE[0]:
+        _SPLIT_CACHE_SIZE[0] = len(gids)
+    split = _split_items
+    return [dict(split(gid, resolve_role))
+            for gid in gids]
+
+
+def _benchmark_split(count=100000):
+    """
+    Benchmark für split_group_id (ohne und mit Cache) und split_group_ids
+    """
+    # Standard library:
+    from random import Random
+    from time import time
+
+    rnd = Random(42)
+    gids = []
+    for i in range(count):
+        uid = '%032x' % rnd.getrandbits(128)
+        if i % 3:
+            gids.append('group_%s_%s' % (uid, rnd.choice(ALL_GROUP_SUFFIXES)))
+        else:
+            gids.append('group_%d' % i)
+    _SPLIT_CACHE.clear()
+    started = time()
+    for gid in gids:
+        split_group_id(gid)
+    t_cold = time() - started
+    started = time()
+    for gid in gids:
+        split_group_id(gid)
+    t_warm = time() - started
+    started = time()
+    split_group_ids(gids)
+    t_bulk = time() - started
+    print('split_group_id, %d ids: %.1f ms (empty cache), %.1f ms (cached);'
+          ' split_group_ids: %.1f ms'
+          % (count, t_cold * 1000, t_warm * 1000, t_bulk * 1000))
+
+
+def build_groups_set(dic, userid, version=None):
     """
     Hilfsfunktion für is_member_of_factory
 
@@ -214,7 +333,17 @@ def build_groups_set(dic, userid):
     >>> groups = build_groups_set(dic, 'user_a')
     >>> sorted(groups)
     ['group_a', 'group_b', 'user_a']
+
+    Ist ein Versionsschlüssel des Dictionarys bekannt (siehe _groups_version),
+    werden die Gruppen über den (zwischengespeicherten) umgekehrten Index
+    ermittelt (siehe _membership_index); das Ergebnis ist dasselbe wie mit
+    der vollständigen Iteration über alle Gruppen (_traverse_dict):
+    >>> groups2 = build_groups_set(dic, 'user_a', ('main', 'oid', 1))
+    >>> groups2 == groups
+    True
     """
+    if version is not None:
+        return _membership_index(dic, version).groups_of(userid)
     groups = set([userid])
     _traverse_dict(dic, groups)
     return groups
@@ -256,7 +385,491 @@ def _traverse_dict(dic, groups):
     return iterations
 
 
+# ----------------------------------------- [ membership index ... [
+def _groups_version(plugin):
+    """
+    Gib den Versionsschlüssel der Gruppen-Dictionarys des übergebenen
+    PAS-Plugins zurück (normalerweise acl_users.source_groups), oder None,
+    wenn es keinen (verläßlichen) gibt.
+
+    Der Versionszähler (ein BTrees.Length.Length) wird bei allen Änderungen
+    von Gruppen und Mitgliedschaften durch einen Event-Subscriber erhöht
+    (siehe ._events.bump_groups_version) und über die ZODB-Verbindung des
+    Aufrufers gelesen; der Schlüssel gehört also zu deren Snapshot.
+    Er besteht aus dem Namen der Datenbank, der OID des Zählers und dessen
+    Wert:
+
+    >>> class DB(object):
+    ...     database_name = 'main'
+    >>> class Jar(object):
+    ...     def db(self):
+    ...         return DB()
+    >>> class Counter(object):
+    ...     _p_oid = b'\\x00\\x07'
+    ...     _p_jar = Jar()
+    ...     _p_changed = False
+    ...     def __call__(self):
+    ...         return 3
+    >>> class Plugin(object):
+    ...     pass
+    >>> plugin = Plugin()
+
+    Solange es keinen Zähler gibt, gibt es keinen Schlüssel
+    (siehe ._events.ensure_groups_version):
+    >>> _groups_version(plugin)
+
+    >>> plugin._visaplan_groups_version = counter = Counter()
+    >>> _groups_version(plugin) == ('main', b'\\x00\\x07', 3)
+    True
+
+    Ebenso nicht, wenn die laufende Transaktion den Zähler schon geändert
+    (oder gerade erst erzeugt) hat:
+    >>> counter._p_changed = True
+    >>> _groups_version(plugin)
+
+    """
+    counter = getattr(getattr(plugin, 'aq_base', plugin),
+                      VERSION_ATTRIBUTE, None)
+    if counter is None:
+        return None
+    jar = counter._p_jar
+    if jar is None or counter._p_oid is None or counter._p_changed:
+        return None
+    return (jar.db().database_name, counter._p_oid, counter())
+
+
+class _MembershipIndex(object):
+    """
+    Umgekehrter Index eines Gruppen-Dictionarys:
+    Principal-ID --> IDs der Gruppen, die ihn direkt enthalten;
+    außerdem ein Cache der (rekursiv aufgelösten) Mitglieder je Gruppe.
+
+    >>> dic = {'group_a': ['group_b', 'group_c'],
+    ...        'group_b': ['user_a', 'user_b'],
+    ...        'group_c': ['user_c'],
+    ...        'group_d': ['group_a'],
+    ...        }
+    >>> idx = _MembershipIndex(dic)
+    >>> sorted(idx.parents['group_a'])
+    ['group_d']
+
+    Die Methode groups_of liefert (per Breitensuche "aufwärts") alle Gruppen,
+    die den Principal direkt oder indirekt enthalten, und ihn selbst:
+    >>> sorted(idx.groups_of('user_c'))
+    ['group_a', 'group_c', 'group_d', 'user_c']
+    >>> sorted(idx.groups_of('user_x'))
+    ['user_x']
+
+    Die Methode members_of liefert die rekursiv aufgelösten Mitglieder einer
+    Gruppe, optional nur Gruppen (kind='groups') oder nur Benutzer
+    (kind='users'); die Ergebnisse werden zwischengespeichert:
+    >>> sorted(idx.members_of('group_a'))
+    ['group_b', 'group_c', 'user_a', 'user_b', 'user_c']
+    >>> sorted(idx.members_of('group_d', 'groups'))
+    ['group_a', 'group_b', 'group_c']
+    >>> sorted(idx.members_of('group_d', 'users'))
+    ['user_a', 'user_b', 'user_c']
+    >>> idx.members_of('group_a') is idx.members_of('group_a')
+    True
+
+    Wird ein neuer Index unter Angabe des bisherigen erzeugt, werden dessen
+    Ergebnisse übernommen, soweit sie von den Änderungen nicht betroffen sind:
+    >>> b_users = idx.members_of('group_b', 'users')
+    >>> dic2 = dict(dic)
+    >>> dic2['group_c'] = ['user_c', 'user_d']
+    >>> idx2 = _MembershipIndex(dic2, previous=idx)
+    >>> idx2.members_of('group_b', 'users') is b_users
+    True
+    >>> sorted(idx2.members_of('group_d', 'users'))
+    ['user_a', 'user_b', 'user_c', 'user_d']
+    """
+
+    def __init__(self, dic, previous=None):
+        members = self.members = {}  # Gruppen-ID --> direkte Mitglieder
+        parents = self.parents = {}
+        for gid, direct in six_iteritems(dic):
+            direct = members[gid] = tuple(direct)
+            for mid in direct:
+                try:
+                    parents[mid].add(gid)
+                except KeyError:
+                    parents[mid] = set([gid])
+        # (Gruppen-ID, kind) --> frozenset der rekursiven Mitglieder:
+        self._closures = {}
+        if previous is not None:
+            self._take_closures(previous)
+
+    def _take_closures(self, previous):
+        """
+        Übernimm die Ergebnisse des bisherigen Index für alle Gruppen,
+        die von den Änderungen nicht betroffen sind
+        """
+        old = previous.members
+        new = self.members
+        changed = set([gid
+                       for gid, direct in six_iteritems(new)
+                       if old.get(gid) != direct])
+        changed.update([gid
+                        for gid in old
+                        if gid not in new])
+        affected = set()
+        for gid in changed:
+            affected.update(previous.groups_of(gid))
+            affected.update(self.groups_of(gid))
+        closures = self._closures
+        for key, val in list(previous._closures.items()):
+            if key[0] not in affected:
+                closures[key] = val
+
+    def groups_of(self, principal):
+        parents = self.parents
+        res = set([principal])
+        current = [principal]
+        while current:
+            found = []
+            for pid in current:
+                for gid in parents.get(pid, ()):
+                    if gid not in res:
+                        res.add(gid)
+                        found.append(gid)
+            current = found
+        return res
+
+    def in_any(self, principal, group_ids):
+        """
+        Ist der Principal (direkt oder indirekt) Mitglied einer der
+        übergebenen Gruppen?  Die Breitensuche "aufwärts" wird beim ersten
+        Treffer abgebrochen.
+
+        >>> dic = {'group_a': ['group_b'],
+        ...        'group_b': ['user_a'],
+        ...        'group_c': ['user_c'],
+        ...        }
+        >>> idx = _MembershipIndex(dic)
+        >>> idx.in_any('user_a', ['group_c', 'group_a'])
+        True
+        >>> idx.in_any('user_a', ['group_c'])
+        False
+
+        Wie bei der Prüfung über die (rekursiv aufgelösten) Mitglieder der
+        Gruppen ist eine Gruppe nicht ihr eigenes Mitglied:
+        >>> idx.in_any('group_a', ['group_a'])
+        False
+        """
+        targets = set(group_ids)
+        if not targets:
+            return False
+        parents = self.parents
+        seen = set([principal])
+        current = [principal]
+        while current:
+            found = []
+            for pid in current:
+                for gid in parents.get(pid, ()):
+                    if gid in targets:
+                        return True
+                    if gid not in seen:
+                        seen.add(gid)
+                        found.append(gid)
+            current = found
+        return False
+
+    def members_of(self, gid, kind=None):
+        """
+        Gib die rekursiv aufgelösten Mitglieder der Gruppe <gid> zurück
+        (ein frozenset), mit kind='groups' nur Gruppen, mit kind='users'
+        nur Nicht-Gruppen
+        """
+        key = (gid, kind)
+        try:
+            return self._closures[key]
+        except KeyError:
+            pass
+        members = self.members
+        if kind is None:
+            closures = self._closures
+            res = set()
+            current = list(members.get(gid, ()))
+            while current:
+                found = []
+                for mid in current:
+                    if mid in res:
+                        continue
+                    res.add(mid)
+                    known = closures.get((mid, None))
+                    if known is not None:
+                        res.update(known)
+                    else:
+                        found.extend(members.get(mid, ()))
+                current = found
+            res = frozenset(res)
+        elif kind == 'groups':
+            res = frozenset([mid
+                             for mid in self.members_of(gid)
+                             if mid in members])
+        elif kind == 'users':
+            res = frozenset([mid
+                             for mid in self.members_of(gid)
+                             if mid not in members])
+        else:
+            raise ValueError('kind=%(kind)r: None, "groups" or "users"'
+                             ' expected' % locals())
+        self._closures[key] = res
+        return res
+
+
+# Schlüssel des Versionszählers (Datenbank, OID) --> (Wert, _MembershipIndex);
+# da der Wert eine bestimmte Version des Inhalts bezeichnet, können die
+# Indexe von mehreren ZODB-Verbindungen (Threads) gemeinsam verwendet werden.
+# Bei Änderungen wird der neue Index aus dem bisherigen abgeleitet
+# (siehe _MembershipIndex._take_closures):
+_INDEXES = {}
+
+
+def _membership_index(dic, version):
+    """
+    Gib den (ggf. neu erzeugten) umgekehrten Index für das übergebene
+    Gruppen-Dictionary zurück; <version> ist dessen Versionsschlüssel
+    (siehe _groups_version).  Ohne Versionsschlüssel gibt es keinen Index;
+    die Aufrufer verwenden dann die nicht zwischengespeicherten Varianten.
+
+    Für ein unverändertes Dictionary kostet das nur einen Dictionary-Zugriff;
+    jeder Versionszähler (also jede Site) hat seinen eigenen Eintrag:
+
+    >>> dic = {'group_a': ['user_a']}
+    >>> idx = _membership_index(dic, ('main', 'oid1', 1))
+    >>> idx is _membership_index({}, ('main', 'oid1', 1))
+    True
+    >>> idx is _membership_index(dic, ('main', 'oid2', 1))
+    False
+    >>> dic['group_b'] = ['group_a']
+    >>> sorted(_membership_index(dic, ('main', 'oid1', 2)).groups_of('user_a'))
+    ['group_a', 'group_b', 'user_a']
+
+    Der Index einer Verbindung mit älterem Snapshot verdrängt den neueren
+    nicht:
+    >>> old = _membership_index({'group_a': ['user_a']}, ('main', 'oid1', 1))
+    >>> sorted(old.groups_of('user_a'))
+    ['group_a', 'user_a']
+    >>> _INDEXES[('main', 'oid1')][0]
+    2
+    """
+    key = version[:2]
+    value = version[2]
+    entry = _INDEXES.get(key)
+    if entry is None:
+        previous = None
+    else:
+        if entry[0] == value:
+            return entry[1]
+        previous = entry[1]
+    idx = _MembershipIndex(dic, previous=previous)
+    if entry is None or entry[0] < value:
+        _INDEXES[key] = (value, idx)
+    return idx
+
+
+class _ObjectGroupsIndex(object):
+    """
+    Index der an Objekte gebundenen Gruppen (group_<uid>_<suffix>):
+    UID --> {Suffix: Gruppen-ID}; wird inkrementell aktualisiert, d. h. nur
+    neue Gruppen-IDs werden mit split_group_id zerlegt.
+
+    >>> uid = 'f6350ab731c3601e925eac482206bda5'
+    >>> gids = ['group_%s_Reader' % uid, 'group_%s_learner' % uid,
+    ...         'group_plain', 'group_%s_Foo' % uid]
+    >>> idx = _ObjectGroupsIndex()
+    >>> idx.refresh(gids)
+    (4, 0)
+    >>> sorted(idx.groups_of(uid).items())      # doctest: +NORMALIZE_WHITESPACE
+    [('Reader',  'group_f6350ab731c3601e925eac482206bda5_Reader'),
+     ('learner', 'group_f6350ab731c3601e925eac482206bda5_learner')]
+    >>> idx.groups_of('0123456789abcdef0123456789abcdef')
+    {}
+    >>> len(idx)
+    1
+
+    Entfernte Gruppen werden aus dem Index gelöscht:
+    >>> idx.refresh(gids[1:])
+    (0, 1)
+    >>> list(idx.groups_of(uid))
+    ['learner']
+    >>> idx.refresh([])
+    (0, 3)
+    >>> len(idx)
+    0
+
+    Mit Angabe eines Versionsschlüssels (siehe _groups_version) entfällt der
+    Abgleich, wenn der Index schon dieser Version entspricht; Prüfung,
+    Abgleich und Zuweisung der Version erfolgen unter derselben Sperre:
+    >>> idx.refresh(gids, ('main', 'oid', 1))
+    (4, 0)
+    >>> idx.refresh([], ('main', 'oid', 1))
+    (0, 0)
+    >>> idx.refresh(gids[1:], ('main', 'oid', 0))
+    (0, 1)
+    """
+
+    def __init__(self):
+        self._known = set()  # alle bekannten Gruppen-IDs
+        self._by_uid = {}    # UID --> {Suffix: Gruppen-ID}
+        self.version = None  # siehe _groups_version
+        self._lock = Lock()  # (der Index wird von allen Threads verwendet)
+
+    def __len__(self):
+        return len(self._by_uid)
+
+    def refresh(self, group_ids, version=None):
+        """
+        Gleiche den Index mit der übergebenen Sequenz aller Gruppen-IDs ab,
+        sofern er nicht schon der angegebenen Version entspricht;
+        gib die Anzahlen der neuen und der entfernten Gruppen-IDs zurück
+        """
+        with self._lock:
+            if version is not None and version == self.version:
+                return 0, 0
+            res = self._refresh(set(group_ids))
+            self.version = version
+            return res
+
+    def _refresh(self, current):
+        added = current - self._known
+        removed = self._known - current
+        by_uid = self._by_uid
+        for gid in removed:
+            dic = split_group_id(gid)
+            uid = dic['uid']
+            if uid is None:
+                continue
+            groups = by_uid.get(uid)
+            if groups is not None:
+                groups.pop(dic['role'], None)
+                if not groups:
+                    del by_uid[uid]
+        for gid in added:
+            dic = split_group_id(gid)
+            uid = dic['uid']
+            if uid is not None:
+                by_uid.setdefault(uid, {})[dic['role']] = gid
+        self._known = current
+        return len(added), len(removed)
+
+    def groups_of(self, uid):
+        """
+        Gib ein Dict Suffix --> Gruppen-ID der an das Objekt mit der
+        übergebenen UID gebundenen Gruppen zurück (ggf. leer)
+        """
+        with self._lock:
+            return dict(self._by_uid.get(uid, ()))
+
+
+# Pfad von acl_users --> _ObjectGroupsIndex:
+_OBJECT_GROUPS = {}
+
+
+def _object_groups_index(key, groups, version=None):
+    """
+    Gib den für <key> vorgehaltenen Index zurück, aktualisiert anhand der
+    übergebenen Gruppen (einer Sequenz der IDs oder eines Mappings mit den
+    IDs als Schlüsseln, normalerweise source_groups._groups)
+    und ihres Versionsschlüssels (siehe _groups_version)
+
+    >>> idx = _object_groups_index('/plone/acl_users', ['group_plain'])
+    >>> idx is _object_groups_index('/plone/acl_users', [])
+    True
+
+    Für eine unveränderte Version entfällt der Abgleich:
+
+    >>> uid = 'f6350ab731c3601e925eac482206bda5'
+    >>> groups = {'group_%s_Reader' % uid: {}}
+    >>> version = ('main', b'\\x00\\x08', 1)
+    >>> idx = _object_groups_index('/other/acl_users', groups, version)
+    >>> list(idx.groups_of(uid))
+    ['Reader']
+    >>> groups.clear()  # (would be a new transaction in the ZODB)
+    >>> list(_object_groups_index('/other/acl_users', groups, version
+    ...                           ).groups_of(uid))
+    ['Reader']
+    """
+    try:
+        idx = _OBJECT_GROUPS[key]
+    except KeyError:
+        # another thread might have been quicker:
+        idx = _OBJECT_GROUPS.setdefault(key, _ObjectGroupsIndex())
+    idx.refresh(groups, version)
+    return idx
+
+
+def _benchmark_in_any(groups=2000, learners=20000, subgroups=50,
+                      rounds=100):
+    """
+    Micro-Benchmark für die Mitgliedschaftsprüfung (is_member_of_any):
+    vollständige Auflösung der Gruppenmitglieder (wie bis Version 1.4.14,
+    und weiterhin ohne Versionsschlüssel) vs.
+    _membership_index(dic, version).in_any, für ein synthetisches
+    Gruppen-Dictionary mit einer großen Kursgruppe;
+    gemessen wird jeweils der gesamte Aufruf, also einschließlich der Suche
+    des Index über den Versionsschlüssel.
+
+    Außerdem wird die einmalige Erzeugung des Index gemessen.
+    """
+    # Standard library:
+    from random import Random
+    from time import time
+
+    def resolve_members(dic, gid):
+        res = set()
+        todo = [gid]
+        while todo:
+            found = set()
+            for mid in todo:
+                found.update(dic.get(mid, ()))
+            found.difference_update(res)
+            res.update(found)
+            todo = found
+        return res
+
+    rnd = Random(42)
+    users = ['user_%d' % i for i in range(learners)]
+    dic = {}
+    for i in range(groups):
+        dic['group_%d' % i] = tuple(rnd.sample(users, 10))
+    dic['group_course'] = tuple(users[:learners // 2]
+                                + ['group_%d' % i for i in range(subgroups)])
+    dic['group_outer'] = ('group_course',)
+    version = ('benchmark', b'\\x00' * 7 + b'\\x01', 1)
+    _INDEXES.clear()
+    started = time()
+    _membership_index(dic, version)
+    print('%d groups: index built in %.2f ms'
+          % (len(dic), (time() - started) * 1000))
+    probes = rnd.sample(users, rounds)
+    checks = (['group_outer'],
+              ['group_%d' % (groups - 1)],
+              )
+    for group_ids in checks:
+        started = time()
+        full = [user_id in resolve_members(dic, group_ids[0])
+                for user_id in probes]
+        t_full = time() - started
+        started = time()
+        fast = [_membership_index(dic, version).in_any(user_id, group_ids)
+                for user_id in probes]
+        t_fast = time() - started
+        assert full == fast
+        print('%s: %d checks; resolving members: %.3f ms per check'
+              % (group_ids, rounds, t_full * 1000 / rounds))
+        print('    _membership_index(...).in_any: %.3f ms per check'
+              % (t_fast * 1000 / rounds))
+# ----------------------------------------- ] ... membership index ]
+
+
 if __name__ == '__main__':
     # Standard library:
+    import sys
     from doctest import testmod
-    testmod()
+    if sys.argv[1:] == ['benchmark']:
+        _benchmark_in_any()
+        _benchmark_split()
+    else:
+        testmod()
@@ -10,7 +10,8 @@ from Products.CMFCore.utils import getToolByName
 # visaplan:
 from visaplan.tools.lands0 import list_of_strings
 
-from ._helpers import build_groups_set
+from ._group import groupinfo_factory
+from ._helpers import _groups_version, _membership_index, build_groups_set
 
 try:
     # visaplan:
@@ -52,9 +53,10 @@ def is_member_of__factory(context, userid):
     des übergebenen Users in der jeweils zu übergebenden Gruppe überprüft.
     """
     acl = getToolByName(context, 'acl_users')
-    gpm = acl.source_groups._group_principal_map
+    plugin = acl.source_groups
+    gpm = plugin._group_principal_map
 
-    groups = build_groups_set(gpm, userid)
+    groups = build_groups_set(gpm, userid, _groups_version(plugin))
 
     def is_member_of(groupid):
         return groupid in groups
@@ -72,6 +74,11 @@ def is_member_of_any(context, group_ids, user_id=None, default=False):
       i.e. checking for the logged-in user
     - if the group_ids sequence is empty, the default is used
 
+    Rather than resolving all members of the given groups, we walk up from
+    the user through the groups containing it, stopping at the first match
+    (see ._helpers._MembershipIndex.in_any).  If there is no version key for
+    the groups (see ._helpers._groups_version), e.g. because the current
+    transaction changed them already, the members are resolved.
     """
     pm = getToolByName(context, 'portal_membership')
     if pm.isAnonymousUser():
@@ -87,7 +94,14 @@ def is_member_of_any(context, group_ids, user_id=None, default=False):
         member = pm.getAuthenticatedMember()
         user_id = member.getId()
 
-    return user_id in get_all_members(context, group_ids)
+    acl = getToolByName(context, 'acl_users')
+    plugin = acl.source_groups
+    gpm = plugin._group_principal_map
+    group_ids = list_of_strings(group_ids)
+    version = _groups_version(plugin)
+    if version is None:
+        return user_id in _resolve_members(group_ids, gpm)
+    return _membership_index(gpm, version).in_any(user_id, group_ids)
 
 
 def get_all_members(context, group_ids, **kwargs):  # --- [[
@@ -109,8 +123,9 @@ def get_all_members(context, group_ids, **kwargs):  # --- [[
       Benutzer-IDs, oder gemischt)
     """
     acl = getToolByName(context, 'acl_users')
-    gpm = acl.source_groups._group_principal_map
-    filter_args = {}
+    plugin = acl.source_groups
+    gpm = plugin._group_principal_map
+    filter_args = {'version': _groups_version(plugin)}
     for key in ('groups_only', 'users_only',
                 'containers',
                 'default_to_all'):
@@ -127,11 +142,9 @@ def get_all_members(context, group_ids, **kwargs):  # --- [[
                        'missing': 1,
                        }
         format_args.update(kwargs)
+        format_args['many'] = True
         ggibi = groupinfo_factory(context, **format_args)
-        res = []
-        for gid in members:
-            res.append(ggibi(gid))
-        return res
+        return ggibi(members)
     elif kwargs and debug_active:
         pp('ignoriere:', kwargs)
 
@@ -143,7 +156,8 @@ def recursive_members(gids, dic,
                       containers=None,
                       groups_only=False,
                       users_only=False,
-                      default_to_all=False):
+                      default_to_all=False,
+                      version=None):
     """
     Recursively find all members of the (by id) given groups.
 
@@ -153,6 +167,12 @@ def recursive_members(gids, dic,
               (which would be split by whitespace)
       dic -- a dictionary; usually acl.source_groups._group_principal_map
 
+    Optional:
+
+      version -- the version key of the dictionary
+                 (see ._helpers._groups_version); if given, the cached
+                 closures are used
+
     Ermittle die rekursiv aufgelösten Mitglieder der übergebenen
     Gruppen.
 
@@ -197,6 +217,32 @@ def recursive_members(gids, dic,
     >>> sorted(recursive_members([], dic, groups_only=True,
     ...                          default_to_all=True))
     ['group_a', 'group_b', 'group_c', 'group_d']
+
+    Mit Angabe eines Versionsschlüssels werden die rekursiv aufgelösten
+    Mitglieder je Gruppe zwischengespeichert (siehe ._helpers._MembershipIndex);
+    für einen neuen Versionsschlüssel werden nur die von den Änderungen
+    betroffenen Gruppen neu berechnet:
+
+    >>> sorted(recursive_members(['group_d'], dic, users_only=True,
+    ...                          version=('main', 'oid', 1)))
+    ['user_a', 'user_b', 'user_c']
+    >>> dic['group_c'] = ['user_c', 'user_d']
+    >>> sorted(recursive_members(['group_d'], dic, users_only=True,
+    ...                          version=('main', 'oid', 2)))
+    ['user_a', 'user_b', 'user_c', 'user_d']
+
+    Ohne Versionsschlüssel werden Änderungen des Dictionarys
+    (auch an Ort und Stelle) immer berücksichtigt:
+
+    >>> dic['group_b'].remove('user_b')
+    >>> dic['group_b'].append('user_e')
+    >>> sorted(recursive_members(['group_d'], dic, users_only=True))
+    ['user_a', 'user_c', 'user_d', 'user_e']
+
+    Nicht-Gruppen werden nur mit containers=True berücksichtigt:
+
+    >>> sorted(recursive_members(['user_x', 'group_c'], dic, containers=True))
+    ['group_c', 'user_c', 'user_d', 'user_x']
     """
     if users_only and groups_only:
         raise ValueError('recursive_members(%(gids)r): '
@@ -210,7 +256,46 @@ def recursive_members(gids, dic,
         else:
             # ohne default_to_all: keine Gruppen, keine Mitglieder
             return set()
-    filtered = users_only or groups_only
+    if version is None:
+        return _resolve_members(gids, dic, containers,
+                                groups_only, users_only)
+    idx = _membership_index(dic, version)
+    if groups_only:
+        kind = 'groups'
+    elif users_only:
+        kind = 'users'
+    else:
+        kind = None
+    res = set()
+    for gid in gids:
+        if gid in idx.members:
+            res.update(idx.members_of(gid, kind))
+            if containers and not users_only:
+                res.add(gid)
+        elif containers and not groups_only:  # keine Gruppe, oder?!
+            res.add(gid)
+    if containers is not None and not containers:
+        res.difference_update(gids)
+    return res
+
+
+def _resolve_members(gids, dic,
+                     containers=None,
+                     groups_only=False,
+                     users_only=False):
+    """
+    Arbeitspferd für recursive_members ohne Versionsschlüssel:
+    löse die Mitglieder der übergebenen Gruppen direkt aus dem Dictionary
+    auf, ohne Index
+
+    >>> dic = {'group_a': ['group_b'],
+    ...        'group_b': ['user_a'],
+    ...        }
+    >>> sorted(_resolve_members(['group_a'], dic))
+    ['group_b', 'user_a']
+    >>> sorted(_resolve_members(['group_a'], dic, users_only=True))
+    ['user_a']
+    """
     res = set()
     exclude = set()
     if containers is None:
@@ -243,4 +328,3 @@ def recursive_members(gids, dic,
                 newly_found = this_iteration
     res.difference_update(exclude)
     return res
-
@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*- äöü vim: ts=8 sts=4 sw=4 si et hls tw=79
+# Python compatibility:
+from __future__ import absolute_import, print_function
+
+from six import iteritems as six_iteritems
+
+# Standard library:
+import re
+from bisect import bisect_left, insort
+from threading import Lock
+from time import time
+
+# Zope:
+import transaction
+from Products.CMFCore.utils import getToolByName
+
+# Local imports:
+from ._group import groupinfo_factory
+from visaplan.plone.tools.context import getActiveLanguage_unchecked
+
+__all__ = [
+    'groupsearch_factory',
+    'invalidate_group_search',
+    'GroupSearchIndex',
+    ]
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _tokens(text):
+    """
+    Gib die (kleingeschriebenen) Wörter des übergebenen Texts als Menge zurück
+
+    >>> print(u' '.join(sorted(_tokens(u'Group "Kurs 12" (Reader)'))))
+    12 group kurs reader
+    >>> len(_tokens(u''))
+    0
+    """
+    return frozenset(TOKEN_RE.findall(text.lower()))
+
+
+class GroupSearchIndex(object):
+    """
+    Token-Index für die Gruppensuche: Token --> Gruppen-IDs;
+    die Suchtexte werden von der jeweils an refresh übergebenen Funktion
+    erzeugt (normalerweise groupinfo_factory(context, searchtext=True)),
+    die ein Gruppen-Dict (mit den Schlüsseln id, title, description)
+    entgegennimmt.  Da diese Funktion an den Request gebunden ist, wird sie
+    nur während des Aufrufs verwendet und nicht im Index gespeichert.
+
+    >>> groups = {
+    ...     'group_a': {'id': 'group_a', 'title': u'Kursleiter Nord',
+    ...                 'description': u''},
+    ...     'group_b': {'id': 'group_b', 'title': u'Kursteilnehmer',
+    ...                 'description': u'Nordrhein'},
+    ...     'group_c': {'id': 'group_c', 'title': u'Redaktion',
+    ...                 'description': None},
+    ...     }
+    >>> def searchstring(info):
+    ...     return u' '.join([info['title'], info['id'],
+    ...                       info['description'] or u''])
+    >>> idx = GroupSearchIndex()
+    >>> idx.refresh(groups, searchstring)
+    3
+    >>> len(idx)
+    3
+
+    Jedes Wort der Suche wird als Präfix eines Tokens gesucht;
+    es müssen alle Wörter passen:
+    >>> idx.search(u'kurs')
+    ['group_a', 'group_b']
+    >>> idx.search(u'Kurs nord')
+    ['group_a', 'group_b']
+    >>> idx.search(u'kursl nord')
+    ['group_a']
+    >>> idx.search(u'group_c')
+    ['group_c']
+    >>> idx.search(u'kurs', limit=1)
+    ['group_a']
+    >>> idx.search(u'xyz')
+    []
+    >>> idx.search(u'')
+    []
+
+    Bei der Aktualisierung werden nur geänderte Gruppen neu indexiert;
+    gelöschte Gruppen werden entfernt:
+    >>> groups['group_c'] = {'id': 'group_c', 'title': u'Kursredaktion',
+    ...                      'description': None}
+    >>> del groups['group_a']
+    >>> idx.refresh(groups, searchstring)
+    2
+    >>> idx.search(u'kurs')
+    ['group_b', 'group_c']
+    >>> idx.search(u'leiter')
+    []
+    >>> idx.refresh(groups, searchstring)
+    0
+
+    Sind die geänderten Gruppen bekannt (z. B. aus einem Event-Handler),
+    können sie angegeben werden; dann werden nur diese geprüft:
+    >>> groups['group_d'] = {'id': 'group_d', 'title': u'Kursbetreuung',
+    ...                      'description': u''}
+    >>> idx.refresh(groups, searchstring, ['group_d', 'group_x'])
+    1
+    >>> idx.search(u'kursb')
+    ['group_d']
+
+    Gruppen können auch nur als geändert vorgemerkt werden (für die Indexe
+    anderer Sprachen, mangels passender Funktion für die Suchtexte);
+    sie werden dann bei der nächsten Aktualisierung berücksichtigt:
+    >>> groups['group_b']['title'] = u'Teilnehmer'
+    >>> idx.invalidate(['group_b'])
+    >>> idx.pending
+    True
+    >>> idx.refresh(groups, searchstring, [])
+    1
+    >>> idx.search(u'teil')
+    ['group_b']
+    >>> idx.pending
+    False
+
+    Da die Indexe prozessweit (von allen Threads) verwendet werden, sind
+    Aktualisierung und Suche durch eine Sperre gegeneinander geschützt.
+    """
+
+    def __init__(self):
+        self._sources = {}   # Gruppen-ID --> (title, description)
+        self._tokens = {}    # Gruppen-ID --> frozenset der Tokens
+        self._postings = {}  # Token --> set der Gruppen-IDs
+        self._sorted = []    # alle Tokens, sortiert (für die Präfixsuche)
+        self._pending = set()  # vorgemerkte Gruppen-IDs (siehe invalidate)
+        self._lock = Lock()
+        self.refreshed = None
+
+    def __len__(self):
+        return len(self._tokens)
+
+    @property
+    def pending(self):
+        """
+        Sind Gruppen als geändert vorgemerkt?
+        """
+        return bool(self._pending)
+
+    def invalidate(self, group_ids):
+        """
+        Merke die übergebenen Gruppen-IDs für die nächste Aktualisierung vor
+        """
+        with self._lock:
+            self._pending.update(group_ids)
+
+    def refresh(self, groups, make_searchstring, group_ids=None):
+        """
+        Aktualisiere den Index aus dem übergebenen Gruppen-Dictionary
+        (Gruppen-ID --> Dict mit id, title, description), mit der übergebenen
+        Funktion für die Suchtexte;
+        ohne Angabe von group_ids werden alle Gruppen verglichen,
+        ansonsten die angegebenen und die vorgemerkten.
+        Gib die Anzahl der geänderten Einträge zurück.
+        """
+        with self._lock:
+            return self._refresh(groups, make_searchstring, group_ids)
+
+    def _refresh(self, groups, make_searchstring, group_ids):
+        changed = 0
+        if group_ids is None:
+            self.refreshed = time()
+            self._pending = set()
+            for group_id, info in six_iteritems(groups):
+                changed += self._update(group_id, info, make_searchstring)
+            gone = [group_id
+                    for group_id in self._tokens
+                    if group_id not in groups]
+        else:
+            group_ids = self._pending.union(group_ids)
+            self._pending = set()
+            gone = []
+            for group_id in group_ids:
+                info = groups.get(group_id)
+                if info is None:
+                    if group_id in self._tokens:
+                        gone.append(group_id)
+                else:
+                    changed += self._update(group_id, info,
+                                            make_searchstring)
+        for group_id in gone:
+            self._remove(group_id)
+        return changed + len(gone)
+
+    def _update(self, group_id, info, make_searchstring):
+        source = (info['title'], info['description'])
+        if self._sources.get(group_id) == source:
+            return 0
+        tokens = _tokens(make_searchstring(info))
+        old = self._tokens.get(group_id, frozenset())
+        for token in old - tokens:
+            self._discard(token, group_id)
+        for token in tokens - old:
+            try:
+                self._postings[token].add(group_id)
+            except KeyError:
+                self._postings[token] = set([group_id])
+                insort(self._sorted, token)
+        self._sources[group_id] = source
+        self._tokens[group_id] = tokens
+        return 1
+
+    def _remove(self, group_id):
+        for token in self._tokens.pop(group_id):
+            self._discard(token, group_id)
+        del self._sources[group_id]
+
+    def _discard(self, token, group_id):
+        ids = self._postings[token]
+        ids.discard(group_id)
+        if not ids:
+            del self._postings[token]
+            del self._sorted[bisect_left(self._sorted, token)]
+
+    def _prefixed(self, prefix):
+        """
+        Gib die Menge der Gruppen-IDs zurück, die ein mit <prefix>
+        beginnendes Token haben (Aufruf nur mit gehaltener Sperre)
+        """
+        tokens = self._sorted
+        postings = self._postings
+        res = set()
+        i = bisect_left(tokens, prefix)
+        count = len(tokens)
+        while i < count:
+            token = tokens[i]
+            if not token.startswith(prefix):
+                break
+            res.update(postings[token])
+            i += 1
+        return res
+
+    def search(self, text, limit=None):
+        """
+        Gib die (sortierte) Liste der IDs der Gruppen zurück, deren Suchtext
+        für jedes Wort des übergebenen Texts ein damit beginnendes Wort enthält
+        """
+        words = sorted(_tokens(text), key=len, reverse=True)
+        if not words:
+            return []
+        res = None
+        with self._lock:
+            for word in words:  # längste (und meist seltenste) Wörter zuerst
+                found = self._prefixed(word)
+                if res is None:
+                    res = found
+                else:
+                    res &= found
+                if not res:
+                    return []
+        res = sorted(res)
+        if limit is not None:
+            return res[:limit]
+        return res
+
+
+# (Pfad von acl_users, Sprache) --> GroupSearchIndex:
+_INDEXES = {}
+
+
+def groupsearch_factory(context, **kwargs):
+    """
+    Gib einen (prozessweit je Site und Sprache vorgehaltenen) GroupSearchIndex
+    zurück; dessen Methode search(text, limit=None) ersetzt die lineare Suche
+    in den Suchtexten aller Gruppen.
+
+    Geänderte Gruppen werden nach dem Commit vorgemerkt (siehe
+    invalidate_group_search) und hier ggf. nachgetragen; der regelmäßige
+    Vergleich aller Gruppen dient nur als Rückfallebene, z. B. für Änderungen
+    ohne Events.
+
+    Benannte Argumente:
+
+    refresh -- None (Vorgabe): alle Gruppen vergleichen, wenn die letzte
+               vollständige Aktualisierung länger als <max_age> Sekunden
+               zurückliegt, ansonsten nur die vorgemerkten;
+               True: alle Gruppen vergleichen;
+               False: nicht aktualisieren;
+               oder eine Sequenz der IDs geänderter (auch gelöschter) Gruppen.
+    max_age -- siehe refresh (Vorgabe: 300)
+    """
+    pop = kwargs.pop
+    refresh = pop('refresh', None)
+    max_age = pop('max_age', 300)
+    if kwargs:
+        unsupported = sorted(kwargs)
+        raise TypeError('Unsupported keyword option(s) %(unsupported)s!'
+                        % locals())
+
+    acl = getToolByName(context, 'acl_users')
+    key = ('/'.join(acl.getPhysicalPath()),
+           getActiveLanguage_unchecked(context))
+    GROUPS = acl.source_groups._groups
+    try:
+        index = _INDEXES[key]
+    except KeyError:
+        # another thread might have been quicker:
+        index = _INDEXES.setdefault(key, GroupSearchIndex())
+        refresh = True
+    if refresh is None:
+        if index.refreshed is None or time() - index.refreshed > max_age:
+            group_ids = None  # all groups
+        elif index.pending:
+            group_ids = ()    # just the pending groups
+        else:
+            return index
+    elif refresh is True:
+        group_ids = None
+    elif not refresh:
+        return index
+    else:
+        group_ids = refresh
+    # the translations of the search strings use the current request:
+    index.refresh(GROUPS, groupinfo_factory(context, searchtext=True),
+                  group_ids)
+    return index
+
+
+def invalidate_group_search(context, group_ids):
+    """
+    Merke die übergebenen (geänderten oder gelöschten) Gruppen in allen für
+    die Site vorgehaltenen Suchindexe (aller Sprachen) vor, und zwar erst
+    nach dem erfolgreichen Commit der laufenden Transaktion: die Indexe
+    werden prozessweit verwendet und dürfen daher nicht aus einem noch nicht
+    (oder nie) gespeicherten Zustand aktualisiert werden.  Nachgetragen
+    werden die Gruppen dann bei der nächsten Verwendung des jeweiligen Index
+    (siehe groupsearch_factory).
+
+    Wird von einem Event-Subscriber für erzeugte und gelöschte Gruppen
+    aufgerufen (siehe ._events); da PAS und PlonePAS beim Ändern von Titel
+    oder Beschreibung einer Gruppe kein Event auslösen, ist die Funktion
+    auch vom Code aufzurufen, der diese Eigenschaften ändert
+    (z. B. nach portal_groups.editGroup).
+    """
+    acl = getToolByName(context, 'acl_users')
+    path = '/'.join(acl.getPhysicalPath())
+    transaction.get().addAfterCommitHook(_invalidate_indexes,
+                                         (path, list(group_ids)))
+
+
+def _invalidate_indexes(status, path, group_ids):
+    """
+    After-commit-Hook für invalidate_group_search:
+    merke die Gruppen in allen Suchindexen für acl_users unter <path> vor,
+    sofern die Transaktion erfolgreich war (status)
+
+    >>> _INDEXES.clear()
+    >>> idx = _INDEXES[('/plone/acl_users', 'de')] = GroupSearchIndex()
+    >>> other = _INDEXES[('/other/acl_users', 'de')] = GroupSearchIndex()
+    >>> _invalidate_indexes(False, '/plone/acl_users', ['group_a'])
+    >>> idx.pending
+    False
+    >>> _invalidate_indexes(True, '/plone/acl_users', ['group_a'])
+    >>> idx.pending, other.pending
+    (True, False)
+    >>> _INDEXES.clear()
+    """
+    if not status:
+        return
+    for key, index in list(_INDEXES.items()):
+        if key[0] == path:
+            index.invalidate(group_ids)
+
+
+if __name__ == '__main__':
+    # Standard library:
+    from doctest import testmod
+    testmod()
@@ -8,6 +8,7 @@ from collections import defaultdict
 
 # Zope:
 from Products.CMFCore.utils import getToolByName
+from Products.PluggableAuthService.interfaces.plugins import IPropertiesPlugin
 
 from visaplan.plone.tools.context import make_translator
 from visaplan.tools.minifuncs import gimme_None
@@ -31,6 +32,58 @@ __all__ = [
     'userinfo_factory',
     ]
 
+# for userinfo_factory(many=True):
+AUTHOR_PORTAL_TYPE = 'Author'
+AUTHOR_USERID_INDEX = 'getUserId'  # index and metadata column
+EMPTY_PROPERTIES = {
+    'fullname': '',
+    'email': '',
+    }
+
+
+class _PropertiesUser(object):
+    """
+    Stand-in for a user object, with properties read in bulk
+
+    >>> user = _PropertiesUser({'fullname': 'Jane Doe'})
+    >>> user.getProperty('fullname')
+    'Jane Doe'
+    >>> user.getProperty('email')
+    ''
+    >>> bool(user)
+    True
+    """
+    def __init__(self, properties):
+        self._properties = dict(EMPTY_PROPERTIES)
+        self._properties.update(properties)
+
+    def getProperty(self, id, default=None):
+        return self._properties.get(id, default)
+
+
+def _bulk_properties(acl):
+    """
+    Return a tuple (userid --> login, property storage, default properties)
+    if the properties of the users managed in the ZODB (source_users) can
+    be read in bulk, with the same result as acl.getUser; or None.
+
+    This is the case if mutable_properties is the only active properties
+    plugin.
+    """
+    users = getattr(acl, 'source_users', None)
+    logins = getattr(users, '_userid_to_login', None)
+    if logins is None:
+        return None
+    if list(acl.plugins.listPluginIds(IPropertiesPlugin)) != [
+            'mutable_properties']:
+        return None
+    plugin = acl.mutable_properties
+    storage = getattr(plugin, '_storage', None)
+    get_defaults = getattr(plugin, '_getDefaultValues', None)
+    if storage is None or get_defaults is None:
+        return None
+    return logins, storage, get_defaults(False)
+
 
 # --------------------------------- [ userinfo_factory ... [
 def userinfo_factory(context, *args, **kwargs):
@@ -47,6 +100,14 @@ def userinfo_factory(context, *args, **kwargs):
     title_or_id -- für Verwendung mit visaplan.tools.classes.Proxy:
                gib nur den Title oder ersatzweise die ID zurück
                (mit pretty kombinierbar)
+    many -- Erzeuge eine Funktion, die eine Sequenz von Benutzer-IDs
+            entgegennimmt und eine Liste der Ergebnisse zurückgibt.
+            Dabei werden Name und E-Mail-Adresse der in der ZODB
+            verwalteten Benutzer direkt aus dem Speicher des
+            Property-Plugins gelesen, sofern mutable_properties das einzige
+            aktive Property-Plugin ist (ansonsten, und für andere Benutzer,
+            wird acl_users.getUser verwendet), und die Autoren-Objekte
+            werden mit einer einzigen Katalogsuche ermittelt.
     """
     _parse_init_options(kwargs, args)
     pretty = kwargs['pretty']
@@ -54,9 +115,11 @@ def userinfo_factory(context, *args, **kwargs):
     missing = kwargs['missing']
     missing_mask = kwargs.get('missing_user_mask') or None
     title_or_id = kwargs['title_or_id']
+    many = kwargs['many']
 
     acl = getToolByName(context, 'acl_users')
     acl_gu = acl.getUser
+    gbbuid = gfn = None
     if pretty or not forlist:
         author = context.restrictedTraverse('@@author', None)
         gbbuid = author.getBrainByUserId
@@ -67,14 +130,14 @@ def userinfo_factory(context, *args, **kwargs):
         missing_mask = translate(missing_mask)
 
     # ---------------------------- [ forlist ... [
-    def basic_user_info(member_id):
+    def basic_user_info(member_id, get_user=acl_gu, get_brain=None):
         """
         Basisinformationen über einen Benutzer:
         id, title
 
         forlist, not: pretty
         """
-        member = acl_gu(member_id)
+        member = get_user(member_id)
         if member:
             res = {
                 'id': member_id,
@@ -90,16 +153,16 @@ def userinfo_factory(context, *args, **kwargs):
         else:
             return {}
 
-    def pretty_user_info(member_id):
+    def pretty_user_info(member_id, get_user=acl_gu, get_brain=gbbuid):
         """
         Basisinformationen über einen Benutzer:
         id, title
 
         forlist, pretty
         """
-        member = acl_gu(member_id)
+        member = get_user(member_id)
         if member:
-            brain = gbbuid(member_id)
+            brain = get_brain(member_id)
             res = {
                 'id': member_id,
                 'title': (brain and gfn(brain))
@@ -118,8 +181,8 @@ def userinfo_factory(context, *args, **kwargs):
     # ---------------------------- ] ... forlist ]
 
     # ------------------------ [ title_or_id ... [
-    def pretty_title_or_id(member_id):
-        dic = pretty_user_info(member_id)
+    def pretty_title_or_id(member_id, get_user=acl_gu, get_brain=gbbuid):
+        dic = pretty_user_info(member_id, get_user, get_brain)
         if dic or (missing and dic['exists']):
             return dic['title'] or member_id
         elif missing:
@@ -127,21 +190,21 @@ def userinfo_factory(context, *args, **kwargs):
         else:
             return None
 
-    def basic_title_or_id(member_id):
+    def basic_title_or_id(member_id, get_user=acl_gu, get_brain=None):
         try:
-            return basic_user_info(member_id)['title'] \
+            return basic_user_info(member_id, get_user)['title'] \
                    or member_id
         except:
             return None
     # ------------------------ ] ... title_or_id ]
 
-    def full_user_info(member_id):
+    def full_user_info(member_id, get_user=acl_gu, get_brain=gbbuid):
         """
         not: forlist, not: pretty
         """
-        member = acl_gu(member_id)
+        member = get_user(member_id)
         if member:
-            brain = gbbuid(member_id)
+            brain = get_brain(member_id)
             res = {
                 'id': member_id,
                 'title': member.getProperty('fullname'),
@@ -159,13 +222,13 @@ def userinfo_factory(context, *args, **kwargs):
             return {}
         return res
 
-    def full_pretty_user_info(member_id):
+    def full_pretty_user_info(member_id, get_user=acl_gu, get_brain=gbbuid):
         """
         not: forlist, pretty
         """
-        member = acl_gu(member_id)
+        member = get_user(member_id)
         if member:
-            brain = gbbuid(member_id)
+            brain = get_brain(member_id)
             res = {
                 'id': member_id,
                 'title': (brain and gfn(brain))
@@ -184,18 +247,81 @@ def userinfo_factory(context, *args, **kwargs):
             return {}
         return res
 
+    def users_by_id(member_ids):
+        """
+        Return a dict member_id --> user (or stand-in);
+        the properties of the users managed in the ZODB are read in bulk
+        (see _bulk_properties), all others are found by acl_users.getUser
+        """
+        res = {}
+        bulk = _bulk_properties(acl)
+        if bulk is not None:
+            logins, storage, defaults = bulk
+            for member_id in member_ids:
+                # acl_users.getUser looks up by login name:
+                if logins.get(member_id) == member_id:
+                    properties = dict(defaults)
+                    properties.update(storage.get(member_id) or {})
+                    res[member_id] = _PropertiesUser(properties)
+        for member_id in member_ids:
+            if member_id not in res:
+                res[member_id] = acl_gu(member_id)
+        return res
+
+    def author_brains(member_ids):
+        """
+        Return a dict member_id --> author brain, using a single catalog
+        query, or None (if not possible)
+        """
+        catalog = getToolByName(context, 'portal_catalog')
+        if AUTHOR_USERID_INDEX not in catalog.indexes():
+            return None
+        query = {
+            'portal_type': AUTHOR_PORTAL_TYPE,
+            AUTHOR_USERID_INDEX: list(member_ids),
+            }
+        res = {}
+        for brain in catalog(query):
+            member_id = getattr(brain, AUTHOR_USERID_INDEX, None)
+            if member_id is None:  # no metadata column
+                return None
+            res.setdefault(member_id, brain)
+        return res
+
     if title_or_id:
         if pretty:
-            return pretty_title_or_id
+            func = pretty_title_or_id
         else:
-            return basic_title_or_id
-    if forlist:
+            func = basic_title_or_id
+    elif forlist:
         if pretty:
-            return pretty_user_info
+            func = pretty_user_info
         else:
-            return basic_user_info
-    if pretty:
-        return full_pretty_user_info
+            func = basic_user_info
+    elif pretty:
+        func = full_pretty_user_info
     else:
-        return full_user_info
+        func = full_user_info
+    if not many:
+        return func
+
+    def many_user_infos(member_ids):
+        """
+        Gib die Liste der Ergebnisse für die übergebenen Benutzer-IDs zurück
+        """
+        member_ids = list(member_ids)
+        users = users_by_id(member_ids)
+        get_brain = None
+        if gbbuid is not None:
+            brains = author_brains([member_id
+                                    for member_id in member_ids
+                                    if users[member_id]])
+            if brains is None:
+                get_brain = gbbuid
+            else:
+                get_brain = brains.get
+        return [func(member_id, users.get, get_brain)
+                for member_id in member_ids]
+
+    return many_user_infos
 # --------------------------------- ] ... userinfo_factory ]
@@ -20,6 +20,7 @@ def _parse_init_options(kwdict, args):
     >>> _parse_init_options(kw, ar)
     >>> sorted(kw.items())                     # doctest: +NORMALIZE_WHITESPACE
     [('forlist',      0),
+     ('many',         0),
      ('missing',      0),
      ('pretty',       0),
      ('title_or_id',  0)]
@@ -31,6 +32,7 @@ def _parse_init_options(kwdict, args):
     >>> _parse_init_options(kw, (1, 2, 3))
     >>> sorted(kw.items())                     # doctest: +NORMALIZE_WHITESPACE
     [('forlist',      2),
+     ('many',         0),
      ('missing',      0),
      ('pretty',       1),
      ('title_or_id',  3)]
@@ -42,6 +44,7 @@ def _parse_init_options(kwdict, args):
     >>> _parse_init_options(kw, ar)
     >>> sorted(kw.items())                     # doctest: +NORMALIZE_WHITESPACE
     [('forlist',      0),
+     ('many',         0),
      ('missing',      1),
      ('missing_user_mask', 'Unknown or deleted user "{id}"'),
      ('pretty',       0),
@@ -57,6 +60,7 @@ def _parse_init_options(kwdict, args):
     """
     unsupported = set(kwdict) - set([
         'forlist',
+        'many',
         'missing',
         'pretty',
         'title_or_id'])
@@ -84,6 +88,7 @@ def _parse_init_options(kwdict, args):
             raise TypeError('Unsupported positional option %(args)s'
                             % locals())
     # these are new:
+    kwdict.setdefault('many', 0)
     missing_mask_default = 'Unknown or deleted user "{id}"'
     missing_user_mask = kwdict.get('missing_user_mask')
     if 'missing' not in kwdict:
@@ -18,8 +18,12 @@ __all__ = [
         'StepAborted',
         ## _get_object:
         'make_object_getter',
+        ## _localroles:
+        'export_local_roles',  # --> JSON lines
+        'import_local_roles',
         ## _make_folder:
         'make_subfolder_creator',
+        'make_folders',  # "mkdir -p" für viele Ordner
         ## _query:
         'make_query_extractor',
         'iterate_query',
@@ -34,22 +38,29 @@ __all__ = [
         ## _roles:
         'set_local_roles',
         'make_simple_localroles_function',
+        'SecurityReindexScheduler',
         ## _switch:
         'switch_menu_item',  # Menüeintrag (de)aktivieren
         'show_item',
         'hide_item',
         ## _tree:
         'make_subfolder_creator',
+        'execute_clone_plan',  # --> clone_tree(plan_file=...)
         ## _types:
         'setVersionedTypes',  # --> setVersionableContentTypes
         ## _uid:
         'make_distinct_finder',
         'make_uid_setter',
         'make_uid_collector',
+        ## _uidset:
+        'UidSet',         # kompaktes Set von UIDs
+        'DictOfUidSets',  # ... als DictOfSets
         ## _watch:
         'make_watcher_function',  # --> Signatur f(brain, string)
         ## _workflow:
         'make_transition_applicator',
+        ## _wfplan:
+        'execute_transition_plan',  # --> m._t._a.(plan_file=...)
         'load_and_cook',  # {css,js}registry.xml
         ## created by factory:
         'safe_context_id',
@@ -64,7 +75,14 @@ from visaplan.plone.tools.setup._attr import make_attribute_setter
 from visaplan.plone.tools.setup._decorator import StepAborted, step
 from visaplan.plone.tools.setup._get_object import make_object_getter
 from visaplan.plone.tools.setup._gs import load_and_cook, safe_context_id
-from visaplan.plone.tools.setup._make_folder import make_subfolder_creator
+from visaplan.plone.tools.setup._localroles import (
+    export_local_roles,
+    import_local_roles,
+    )
+from visaplan.plone.tools.setup._make_folder import (
+    make_folders,
+    make_subfolder_creator,
+    )
 from visaplan.plone.tools.setup._query import (
     getAllLanguages,
     iterate_query,
@@ -73,6 +91,7 @@ from visaplan.plone.tools.setup._query import (
 from visaplan.plone.tools.setup._reindex import make_reindexer, reindex_all
 from visaplan.plone.tools.setup._rename import ACCEPT_ANY, make_renamer
 from visaplan.plone.tools.setup._roles import (
+    SecurityReindexScheduler,
     make_simple_localroles_function,
     set_local_roles,
     )
@@ -81,13 +100,15 @@ from visaplan.plone.tools.setup._switch import (
     show_item,
     switch_menu_item,
     )
-from visaplan.plone.tools.setup._tree import clone_tree
+from visaplan.plone.tools.setup._tree import clone_tree, execute_clone_plan
 from visaplan.plone.tools.setup._types import setVersionedTypes
 from visaplan.plone.tools.setup._uid import (
     make_distinct_finder,
     make_uid_collector,
     make_uid_setter,
     )
+from visaplan.plone.tools.setup._uidset import DictOfUidSets, UidSet
 from visaplan.plone.tools.setup._watch import make_watcher_function
+from visaplan.plone.tools.setup._wfplan import execute_transition_plan
 from visaplan.plone.tools.setup._workflow import \
     make_transition_applicator  # TODO: transitions_map argument!
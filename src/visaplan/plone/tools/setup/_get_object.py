@@ -10,6 +10,8 @@ from __future__ import absolute_import
 from posixpath import normpath
 
 # Zope:
+import transaction
+from Acquisition import aq_base, aq_inner, aq_parent
 from Products.CMFCore.utils import getToolByName
 
 # Plone:
@@ -25,6 +27,11 @@ from visaplan.plone.tools.setup._args import (
     )
 from visaplan.plone.tools.setup._misc import _traversable_path
 from visaplan.plone.tools.setup._o_tools import (
+    LANGUAGE_IDXS,
+    MENU_IDXS,
+    SUBPORTAL_IDXS,
+    TITLE_IDXS,
+    UID_IDXS,
     handle_language,
     handle_layout,
     handle_menu,
@@ -48,6 +55,77 @@ __all__ = [
         ]
 
 
+def _still_there(o, name=None, path=None, top=None):
+    """
+    Helper for make_object_getter(cache=True):
+    is the given (cached) object still contained in its parent
+    (and, if a <name> is given, with that id; if a <path> is given,
+    at that path)?  The acquisition parents are checked as well, up to the
+    <top> object (normally the portal), since the cached object carries them
+    along.
+
+    >>> class Folder(dict):
+    ...     def _getOb(self, id, default=None):
+    ...         return self.get(id, default)
+    >>> class Item(object):
+    ...     def __init__(self, id, parent):
+    ...         self.id, self.__parent__ = id, parent
+    ...         parent[id] = self
+    ...     def getId(self):
+    ...         return self.id
+    >>> folder = Folder()
+    >>> item = Item('doc', folder)
+    >>> _still_there(item, 'doc')
+    True
+    >>> _still_there(item, 'other')
+    False
+    >>> del folder['doc']
+    >>> _still_there(item)
+    False
+
+    If a parent was moved away, the object is considered gone as well
+    (its acquisition chain is outdated):
+    >>> class Node(Folder):
+    ...     def __init__(self, id, parent=None):
+    ...         self.id, self.__parent__ = id, parent
+    ...         if parent is not None:
+    ...             parent[id] = self
+    ...     def getId(self):
+    ...         return self.id
+    ...     def getPhysicalPath(self):
+    ...         if self.__parent__ is None:
+    ...             return ('', self.id)
+    ...         return self.__parent__.getPhysicalPath() + (self.id,)
+    >>> root = Node('plone')
+    >>> sub = Node('sub', root)
+    >>> item = Node('doc', sub)
+    >>> _still_there(item, 'doc', '/plone/sub/doc')
+    True
+    >>> _still_there(item, 'doc', '/plone/other/doc')
+    False
+    >>> del root['sub']
+    >>> _still_there(item, 'doc')
+    False
+
+    The check stops at the <top> object:
+    >>> _still_there(sub, 'sub', top=sub)
+    True
+    """
+    if name is not None and o.getId() != name:
+        return False
+    if path is not None and '/'.join(o.getPhysicalPath()) != path:
+        return False
+    child = o
+    while top is None or aq_base(child) is not top:
+        parent = aq_parent(aq_inner(child))
+        if parent is None:  # e.g. the portal
+            break
+        if aq_base(parent._getOb(child.getId(), None)) is not aq_base(child):
+            return False
+        child = parent
+    return True
+
+
 # see also _make_folder.py: make_subfolder_creator
 def make_object_getter(context, **kwargs):
     """
@@ -82,6 +160,17 @@ def make_object_getter(context, **kwargs):
                 None:  ... if changes were made (default).
     - return_tuple - if True, return a 2-tuple (object, info);
                      by default, only the object (or None) is returned.
+    - cache - cache the found objects per specification (path, uid, or
+              parent and id), which is useful if the same objects are
+              requested several times (as by clone_tree).
+              The cache is valid for the current transaction only,
+              and cached objects are checked to be still in place
+              (see _still_there), so moved or renamed objects are looked up
+              again.  The cumulated numbers of cache hits and misses are
+              available as info['cache_hits'] and info['cache_misses'].
+    - lookup_only - only find the object (and get its UID and layout, if
+                    requested), but don't check or change anything else;
+                    used e.g. by clone_tree(plan_file=...).
 
     Unless return_tuple=True is specified,
     the returned function will simply return the object or None;
@@ -95,11 +184,41 @@ def make_object_getter(context, **kwargs):
     info dictionary, to be more precise: to the info['updates'] dictionary.
     Thus, to make use of the get_... results, an "info" dictionary must be
     provided.
+
+    The info['idxs'] value is the list of the indexes which are affected
+    by the changes (an empty list meaning "all"); this is useful when
+    reindexing is suppressed and done later.
+
+    If no reindexer was given to the factory, the reindexing is
+    change-driven: only the indexes which are affected by the changes
+    actually made (plus the explicitly given idxs) are updated, e.g. just
+    getExcludeFromNav when only the menu switch was changed.
+    The reindexers for such index combinations are created once and reused.
+    If reindexing is forced without any changes, the indexes of the set_...
+    options are used, as before.
+
+    The set_subportal option is accepted on sites without subportals as well
+    (where it only adds the get_sub_portal index):
+
+    >>> class Catalog(object):
+    ...     def reindexObject(self, o, idxs=[], update_metadata=1):
+    ...         pass
+    >>> class PortalUrl(object):
+    ...     def getPortalObject(self):
+    ...         return object()
+    >>> class Context(object):
+    ...     portal_url = PortalUrl()
+    ...     portal_catalog = Catalog()
+    ...     reference_catalog = None
+    >>> get_object = make_object_getter(Context(), set_subportal=True)
+    >>> callable(get_object)
+    True
     """
     pop = kwargs.pop
     keys = pop('keys', None) or ['path', 'id', 'uid']
     parent = pop('parent', None)
     portal = getToolByName(context, 'portal_url').getPortalObject()
+    portal_base = aq_base(portal)
     reference_catalog = getToolByName(context, 'reference_catalog')
     verbose = pop('verbose', 1)
     if 'logger' in kwargs:
@@ -122,6 +241,7 @@ def make_object_getter(context, **kwargs):
         }
     if idxs is None:  # defaults suppression;
         idxs = []     # won't be used! (see ignored_idxs below)
+    given_idxs = list(idxs)
     reindex      = pop('reindex', reindexer is not None
                                   or None)
     set_title    = pop('set_title', True)
@@ -134,29 +254,55 @@ def make_object_getter(context, **kwargs):
     set_subportal = pop('set_subportal', None)
     subportal     = pop('subportal', None)
     return_tuple  = pop('return_tuple', False)
+    lookup_only   = pop('lookup_only', False)
+    use_cache     = pop('cache', False)
+    cache = {}
+    cache_info = {
+        'txn': None,
+        'hits': 0,
+        'misses': 0,
+        }
+
+    def cached(ckey, name, resolve, path=None):
+        """
+        Return the object for the given cache key;
+        if not (validly) cached, call the <resolve> function.
+        """
+        if not use_cache:
+            return resolve()
+        txn = transaction.get()
+        if txn is not cache_info['txn']:
+            cache.clear()
+            cache_info['txn'] = txn
+        o = cache.get(ckey)
+        if o is not None and _still_there(o, name, path, portal_base):
+            cache_info['hits'] += 1
+            return o
+        cache_info['misses'] += 1
+        o = resolve()
+        if o is None:
+            cache.pop(ckey, None)
+        else:
+            cache[ckey] = o
+        return o
+
+    def traverse(path):
+        try:
+            # restrictedTraverse dislikes leading slashes, at least:
+            return portal.restrictedTraverse(_traversable_path(path))
+        except KeyError:
+            return None
 
     if set_menu is not None:
-        idxs.append('getExcludeFromNav')
+        idxs.extend(MENU_IDXS)
     if set_title:
-        idxs.extend([
-            'Title',
-            'getTitleIndex',  # ??
-            'sortable_title',
-            'SearchableText',    # contains the title
-            'getEfectiveIndex',  # contains lower-cased title after numeric time
-            ])
+        idxs.extend(TITLE_IDXS)
     if set_uid:
-        idxs.extend([
-            'UID',
-            ])
+        idxs.extend(UID_IDXS)
     if set_language:
-        idxs.extend([
-            'Language',
-            ])
+        idxs.extend(LANGUAGE_IDXS)
     if set_subportal:
-        idxs.extend([
-            'get_sub_portal',
-            ])
+        idxs.extend(SUBPORTAL_IDXS)
     if reindex is None:
         reindex = (reindexer is not None
                    or bool(idxs)
@@ -168,8 +314,22 @@ def make_object_getter(context, **kwargs):
         ):
         logger.warn('Ignoring idxs value %(idxs)r', locals())
 
+    change_driven = reindexer is None and not ignored_idxs
     if reindex and reindexer is None:
         reindexer = make_reindexer(**mrx_kw)
+    default_reindexer = reindexer
+    # change-driven reindexers, by index names tuple:
+    reindexers = {}
+
+    def changes_reindexer(changed_idxs):
+        key = tuple(sorted(set(given_idxs).union(changed_idxs)))
+        if not key:  # a metadata-only change, e.g. the layout
+            key = ('getId',)
+        rx = reindexers.get(key)
+        if rx is None:
+            rx = reindexers[key] = make_reindexer(**dict(mrx_kw,
+                                                         idxs=list(key)))
+        return rx
 
     def _err(msg, notes, logger=logger):
         notes.append(('ERROR', msg))
@@ -195,6 +355,7 @@ def make_object_getter(context, **kwargs):
             set_subportal=set_subportal,
             subportal=subportal,
             return_tuple=return_tuple,
+            lookup_only=lookup_only,
             **kwargs):
         """
         This function is designed to be called with keyword arguments only.
@@ -210,6 +371,7 @@ def make_object_getter(context, **kwargs):
             'notes':     [],
             'specs':     None,  # set to a string below
             'updates':   {},
+            'idxs':      sorted(set(idxs)),
             })
         notes = info['notes']
         # for notes from _o_tools.py:
@@ -220,6 +382,7 @@ def make_object_getter(context, **kwargs):
         o = None
         found_by = None
         changes = 0
+        changed_idxs = set()
         specs = []
         for key in keys:
             if key in tried_keys:
@@ -229,14 +392,18 @@ def make_object_getter(context, **kwargs):
                 if id is not None:
                     specs.append('id=%(id)r' % locals())
                     if parent is not None:
-                        o = getattr(parent, id, None)
+                        o = cached(('id', tuple(parent.getPhysicalPath()),
+                                    id),
+                                   id,
+                                   lambda: getattr(parent, id, None))
                         if o is None:
                             _err('%(parent)r.%(id)r not found!' % locals(),
                                  notes)
             elif key == 'uid':
                 if uid is not None:
                     specs.append('uid=%(uid)r' % locals())
-                    o = reference_catalog.lookupObject(uid)
+                    o = cached(('uid', uid), None,
+                               lambda: reference_catalog.lookupObject(uid))
                     if o is None:
                         _err('UID %(uid)r not found!' % locals(),
                              notes)
@@ -248,11 +415,12 @@ def make_object_getter(context, **kwargs):
                         _info('path=%(path)r -> using %(portal)r!' % locals(),
                               notes)
                     else:
-                        try:
-                            # restrictedTraverse dislikes leading slashes, at least:
-                            o = portal.restrictedTraverse(_traversable_path(path))
-                        except KeyError:
-                            o = None
+                        relpath = normpath(path).strip('/')
+                        o = cached(('path', relpath),
+                                   relpath.split('/')[-1],
+                                   lambda: traverse(path),
+                                   '/'.join(portal.getPhysicalPath()
+                                            + (relpath,)))
                     if o is None:
                         _err('%(portal)r[%(path)r] not found!' % locals(),
                              notes)
@@ -264,12 +432,17 @@ def make_object_getter(context, **kwargs):
                 break
 
         info['specs'] = ', '.join(specs) or 'no non-empty specifications!'
+        if use_cache:
+            info['cache_hits'] = cache_info['hits']
+            info['cache_misses'] = cache_info['misses']
         if o is None:
             return ((o, info) if return_tuple
                     else o)
 
         info['found'] = True
         info['found_by'] = found_by
+        if lookup_only:
+            set_uid = False
 
         if found_by == 'uid':
             if get_uid >= 2:
@@ -292,6 +465,7 @@ def make_object_getter(context, **kwargs):
                                   % locals(),
                                   notes)
                             changes += 1
+                            changed_idxs.update(UID_IDXS)
                             if get_uid:
                                 found_uid = uid
                         else:
@@ -304,30 +478,44 @@ def make_object_getter(context, **kwargs):
                               verbose > 1)
             if get_uid and found_uid != 'root':
                 updates['uid'] = found_uid
+        if lookup_only:
+            # (read-only:)
+            layout, do_set, do_get = extract_layout_switch(kwargs,
+                                                           do_pop=False)
+            if do_get:
+                found_layout = o.getLayout()
+                if found_layout:
+                    updates['layout'] = found_layout
+            return ((o, info) if return_tuple
+                    else o)
 
         # ---------- [set_]title:
         kwargs.update(set_title=set_title)
-        ch, notes = handle_title(o, kwargs, created=False)
+        ch, notes = handle_title(o, kwargs, created=False,
+                                 idxs=changed_idxs)
         changes += ch
         for tup in notes:
             lognotes(tup)
 
         # ---------- [set_]language, [set_]canonical:
         kwargs.update(set_language=set_language, set_canonical=set_canonical)
-        ch, notes = handle_language(o, kwargs, created=False)
+        ch, notes = handle_language(o, kwargs, created=False,
+                                    idxs=changed_idxs)
         changes += ch
         for tup in notes:
             lognotes(tup)
 
         # ---------- [{set,get}_]layout:
-        ch, notes, upd = handle_layout(o, kwargs, created=False)
+        ch, notes, upd = handle_layout(o, kwargs, created=False,
+                                       idxs=changed_idxs)
         changes += ch
         for tup in notes:
             lognotes(tup)
         updates.update(upd)  # might contain a new 'layout' key
 
         # ---------- [switch_]menu:
-        ch, notes = handle_menu(o, kwargs, created=False)
+        ch, notes = handle_menu(o, kwargs, created=False,
+                                idxs=changed_idxs)
         changes += ch
         for tup in notes:
             lognotes(tup)
@@ -335,12 +523,16 @@ def make_object_getter(context, **kwargs):
         if HAS_SUBPORTALS:
             # ---------- [set_]subportal:
             kwargs.update(subportal=subportal, set_subportal=set_subportal)
-            ch, notes = handle_subportal(o, kwargs, created=False)
+            ch, notes = handle_subportal(o, kwargs, created=False,
+                                         idxs=changed_idxs)
             changes += ch
             for tup in notes:
                 lognotes(tup)
 
         info['changes'] = changes
+        if changes and not ignored_idxs:
+            info['idxs'] = (sorted(set(given_idxs).union(changed_idxs))
+                            or ['getId'])
         if reindex is None:
             if not changes:
                 _info('%(o)r not changed and not reindexed' % locals(),
@@ -355,6 +547,9 @@ def make_object_getter(context, **kwargs):
                       notes)
             return ((o, info) if return_tuple
                     else o)
+        if (change_driven and changes
+              and reindexer is default_reindexer):
+            reindexer = changes_reindexer(changed_idxs)
         if reindexer is None:
             o.reindexObject()
         else:
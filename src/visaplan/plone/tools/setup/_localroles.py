@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*- äöü vim: sw=4 sts=4 et tw=79
+"""
+Tools für Produkt-Setup (Migrationsschritte, "upgrade steps"): _localroles
+
+Snapshots of local role assignments, e.g. to back them up before a workflow
+migration and restore them afterwards:
+
+- export_local_roles writes one JSON object per catalog hit
+  (uid, path, local roles, inherit flag);
+- import_local_roles restores them in batches, with one commit and one
+  security reindex per affected subtree for each batch.
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+from six import ensure_str
+
+# Standard library:
+import json
+from collections import Counter
+
+# Zope:
+import transaction
+from Acquisition import aq_base
+from Products.CMFCore.utils import getToolByName
+
+# Local imports:
+from visaplan.plone.tools.setup._misc import read_json_lines
+from visaplan.plone.tools.setup._query import make_query_extractor
+from visaplan.plone.tools.setup._roles import SecurityReindexScheduler
+from visaplan.plone.tools.setup._uid import make_distinct_finder
+
+# Logging / Debugging:
+import logging
+
+__all__ = [
+        'export_local_roles',
+        'import_local_roles',
+        ]
+
+
+def _local_roles_of(o):
+    """
+    Return the local roles mapping of the given object,
+    with sorted lists of roles
+
+    >>> class O(object): pass
+    >>> o = O()
+    >>> _local_roles_of(o)
+    {}
+    >>> o.__ac_local_roles__ = {'owner': ['Owner'],
+    ...                         'editors': ['Reviewer', 'Editor']}
+    >>> sorted(_local_roles_of(o).items())
+    [('editors', ['Editor', 'Reviewer']), ('owner', ['Owner'])]
+    """
+    local_roles = getattr(aq_base(o), '__ac_local_roles__', None) or {}
+    return dict([(userid, sorted(roles))
+                 for userid, roles in local_roles.items()
+                 if roles
+                 ])
+
+
+def _inherits_roles(o):
+    """
+    Does the given object acquire the local roles of its parent?
+
+    >>> class O(object): pass
+    >>> o = O()
+    >>> _inherits_roles(o)
+    True
+    >>> o.__ac_local_roles_block__ = True
+    >>> _inherits_roles(o)
+    False
+    """
+    return not getattr(aq_base(o), '__ac_local_roles_block__', False)
+
+
+def _deactivate(o):
+    """
+    Turn the given (unchanged) persistent object into a ghost, to free memory
+
+    >>> class O(object): pass
+    >>> _deactivate(O())  # (not persistent: nothing to do)
+    """
+    deactivate = getattr(aq_base(o), '_p_deactivate', None)
+    if deactivate is not None:
+        deactivate()  # (no-op for changed objects)
+
+
+def _snapshot_record(brain, o):
+    """
+    Create the snapshot record for the given object
+
+    >>> from visaplan.plone.tools.mock import MockBrain
+    >>> brain = MockBrain(UID='0123456789abcdef0123456789abcdef')
+    >>> brain.getPath = lambda: '/plone/some/doc'
+    >>> class O(object): pass
+    >>> o = O()
+    >>> o.__ac_local_roles__ = {'owner': ['Owner']}
+    >>> print(json.dumps(_snapshot_record(brain, o), sort_keys=True))
+    ...                                     # doctest: +NORMALIZE_WHITESPACE
+    {"inherit": true, "path": "/plone/some/doc",
+     "roles": {"owner": ["Owner"]}, "uid": "0123456789abcdef0123456789abcdef"}
+    """
+    return {
+        'uid': brain.UID,
+        'path': brain.getPath(),
+        'roles': _local_roles_of(o),
+        'inherit': _inherits_roles(o),
+        }
+
+
+def export_local_roles(context, filename, **kwargs):
+    """
+    Schreibe die lokalen Rollen (und die Information, ob die Rollen des
+    übergeordneten Objekts geerbt werden) aller gefundenen Objekte in die
+    Datei <filename>, ein JSON-Objekt pro Zeile, und gib einen Counter mit
+    Statistiken zurück.
+
+    Benannte Argumente:
+
+    logger - der zu verwendende Logger
+    limit - für Test/Entwicklung: max. Anzahl zu exportierender Objekte
+    period - nach je <period> Objekten wird der Fortschritt protokolliert
+             und der Objekt-Cache der ZODB-Verbindung bereinigt
+             (Vorgabe: 1000)
+
+    Sonstige benannte Argumente werden an --> make_query_extractor(context)
+    übergeben; anders als dort werden per Vorgabe auch die von der Suche
+    ausgeschlossenen Objekte exportiert.
+    """
+    pop = kwargs.pop
+    logger = pop('logger', None)
+    if logger is None:
+        logger = logging.getLogger('export_local_roles')
+    limit = pop('limit', None)
+    period = pop('period', 1000)
+    catalog = getToolByName(context, 'portal_catalog')
+    kwargs.setdefault('getExcludeFromSearch', None)
+    extract_query = make_query_extractor(context)
+    query = extract_query(kwargs)
+    if kwargs:
+        logger.error('export_local_roles: unused arguments! (%(kwargs)r)',
+                     locals())
+
+    counter = Counter()
+    with open(filename, 'w') as f:
+        for brain in catalog(query):
+            if limit is not None and counter['records'] >= limit:
+                logger.info('limit of %(limit)d records reached', locals())
+                break
+            o = brain.getObject()
+            record = _snapshot_record(brain, o)
+            # we only read; don't keep all objects in memory:
+            _deactivate(o)
+            f.write(json.dumps(record, sort_keys=True,
+                               separators=(',', ':')) + '\n')
+            counter['records'] += 1
+            if not record['inherit']:
+                counter['blocked'] += 1
+            if record['roles']:
+                counter['with_roles'] += 1
+            if period and not counter['records'] % period:
+                done = counter['records']
+                logger.info('%(done)d records exported', locals())
+                jar = getattr(aq_base(context), '_p_jar', None)
+                if jar is not None:
+                    jar.cacheGC()
+    for key, val in sorted(counter.items()):
+        logger.info('  %(key)s: %(val)d', locals())
+    return counter
+
+
+def import_local_roles(context, filename, **kwargs):
+    """
+    Stelle die durch --> export_local_roles gesicherten lokalen Rollen
+    wieder her und gib einen Counter mit Statistiken zurück.
+
+    Die lokalen Rollen der gefundenen Objekte werden genau auf den
+    gesicherten Stand gesetzt (nicht gesicherte Zuweisungen werden also
+    entfernt); geändert werden nur abweichende Objekte.
+    Die Objekte werden batchweise (mit je einer Katalogsuche) ermittelt,
+    über die UID oder, wenn diese nicht (eindeutig) gefunden wird
+    (z. B. nach einer Wiederherstellung mit neuen UIDs), über den Pfad;
+    nach jedem Batch werden die Sicherheitsindizes der obersten geänderten
+    Objekte (samt Teilbäumen) aktualisiert und die Transaktion abgeschlossen.
+
+    Benannte Argumente:
+
+    logger - der zu verwendende Logger
+    batch_size - Anzahl der Einträge je Transaktion (Vorgabe: 500)
+    limit - für Test/Entwicklung: max. Anzahl zu verarbeitender Einträge
+    """
+    pop = kwargs.pop
+    logger = pop('logger', None)
+    if logger is None:
+        logger = logging.getLogger('import_local_roles')
+    batch_size = pop('batch_size', 500)
+    limit = pop('limit', None)
+    if kwargs:
+        logger.error('import_local_roles: unused arguments! (%(kwargs)r)',
+                     locals())
+
+    catalog = getToolByName(context, 'portal_catalog')
+    find_many = make_distinct_finder(catalog=catalog, logger=logger,
+                                     many=True)
+    scheduler = SecurityReindexScheduler(logger=logger)
+    counter = Counter()
+
+    def process_batch(batch):
+        found, missing, ambiguous = find_many([record['uid']
+                                               for record in batch])
+        by_path = _brains_by_path(catalog,
+                                  [record['path']
+                                   for record in batch
+                                   if record['uid'] not in found
+                                   and record.get('path')])
+        for record in batch:
+            brain = found.get(record['uid'])
+            if brain is None:
+                brain = by_path.get(ensure_str(record.get('path') or ''))
+                if brain is None:
+                    counter['missing'] += 1
+                    continue
+                counter['found_by_path'] += 1
+            _restore_record(brain.getObject(), record, counter, scheduler)
+        counter['security_reindexed'] += scheduler.flush()
+        transaction.commit()
+        done = counter['records']
+        logger.info('%(done)d records processed', locals())
+
+    batch = []
+    try:
+        for record in read_json_lines(filename):
+            if limit is not None and counter['records'] >= limit:
+                logger.info('limit of %(limit)d records reached', locals())
+                break
+            counter['records'] += 1
+            batch.append(record)
+            if len(batch) >= batch_size:
+                process_batch(batch)
+                batch = []
+        if batch:
+            process_batch(batch)
+    finally:
+        for key, val in sorted(counter.items()):
+            logger.info('  %(key)s: %(val)d', locals())
+    return counter
+
+
+def _brains_by_path(catalog, paths):
+    """
+    Helper for import_local_roles: find the objects with the given paths
+    with a single catalog query; return a dict path --> brain
+
+    >>> from visaplan.plone.tools.mock import MockBrain
+    >>> def catalog(query):
+    ...     for path in query['path']['query']:
+    ...         if path != '/plone/gone':
+    ...             brain = MockBrain()
+    ...             brain.getPath = lambda path=path: path
+    ...             yield brain
+    >>> sorted(_brains_by_path(catalog, [u'/plone/doc', '/plone/gone']))
+    ['/plone/doc']
+    >>> _brains_by_path(catalog, [])
+    {}
+    """
+    if not paths:
+        return {}
+    query = {'path': {'query': sorted(set([ensure_str(path)
+                                           for path in paths])),
+                      'depth': 0}}
+    return dict([(brain.getPath(), brain)
+                 for brain in catalog(query)])
+
+
+def _restore_record(o, record, counter, scheduler):
+    """
+    Helper for import_local_roles: restore one snapshot record
+
+    >>> class O(object):
+    ...     def getPhysicalPath(self):
+    ...         return ('', 'plone', 'doc')
+    ...     def restrictedTraverse(self, name):
+    ...         return Sharing(self)
+    >>> class Sharing(object):
+    ...     def __init__(self, context):
+    ...         self.context = context
+    ...     def update_inherit(self, status, reindex=True):
+    ...         if _inherits_roles(self.context) == status:
+    ...             return False
+    ...         self.context.__ac_local_roles_block__ = not status
+    ...         return True
+    >>> o = O()
+    >>> o.__ac_local_roles__ = {'owner': ['Owner'], 'intruder': ['Editor']}
+    >>> counter = Counter()
+    >>> scheduler = SecurityReindexScheduler()
+    >>> record = {'roles': {u'owner': [u'Owner']}, 'inherit': False}
+    >>> _restore_record(o, record, counter, scheduler)
+    >>> o.__ac_local_roles__
+    {'owner': ['Owner']}
+    >>> _inherits_roles(o)
+    False
+    >>> sorted(counter.items())
+    [('inherit_changed', 1), ('roles_changed', 1)]
+    >>> len(scheduler)
+    1
+
+    Unchanged objects are left alone:
+    >>> _restore_record(o, record, counter, scheduler)
+    >>> counter['unchanged']
+    1
+    """
+    changed = False
+    roles = dict([(ensure_str(userid), sorted([ensure_str(role)
+                                               for role in roles]))
+                  for userid, roles in record['roles'].items()
+                  if roles
+                  ])
+    if roles != _local_roles_of(o):
+        o.__ac_local_roles__ = roles
+        counter['roles_changed'] += 1
+        changed = True
+    inherit = record.get('inherit')
+    if inherit is not None and inherit != _inherits_roles(o):
+        sharing = o.restrictedTraverse('@@sharing')
+        if sharing.update_inherit(inherit, reindex=False):
+            counter['inherit_changed'] += 1
+            changed = True
+    if changed:
+        scheduler.schedule(o)
+    else:
+        counter['unchanged'] += 1
@@ -6,11 +6,16 @@ Tools für Produkt-Setup (Migrationsschritte, "upgrade steps"): _tree
 # Python compatibility:
 from __future__ import absolute_import
 
+from six import string_types as six_string_types
+
 # Standard library:
+from collections import Counter
 from posixpath import normpath
 from string import capitalize
+from time import time
 
 # Zope:
+import transaction
 from Products.CMFCore.utils import getToolByName
 
 # Local imports:
@@ -27,13 +32,18 @@ from visaplan.plone.tools.setup._o_tools import (
     handle_title,
     make_notes_logger,
     )
-from visaplan.plone.tools.setup._reindex import make_reindexer
+from visaplan.plone.tools.setup._reindex import (
+    _ReindexQueue,
+    get_default_idxs,
+    make_reindexer,
+    )
 
 # Logging / Debugging:
 import logging
 
 __all__ = [
         'make_subfolder_creator',
+        'make_folders',  # "mkdir -p", for many folders at once
         ]
 
 
@@ -213,3 +223,196 @@ def make_subfolder_creator(**kwargs):
         return new_child
 
     return new_folder
+
+
+def _folder_specs(specs, prefix=()):
+    """
+    Flatten the given folder specifications to a list of
+    (path tuple, options dict) pairs, parents before their children.
+
+    Simple specifications are paths (relative to the starting folder):
+    >>> _folder_specs(['a/b', '/a/c/'])
+    [(('a', 'b'), {}), (('a', 'c'), {})]
+
+    Nested specifications are dicts with an 'id' (or a relative 'path'),
+    optional 'children' and other options (e.g. title, view_id, switch_menu):
+    >>> spec = [{'id': 'a', 'title': 'A',
+    ...          'children': ['b/c', {'id': 'd', 'view_id': 'x'}]}]
+    >>> for tup in _folder_specs(spec):
+    ...     print(tup)
+    (('a',), {'title': 'A'})
+    (('a', 'b', 'c'), {})
+    (('a', 'd'), {'view_id': 'x'})
+
+    >>> _folder_specs(['/'])
+    Traceback (most recent call last):
+      ...
+    ValueError: Empty folder specification! ('/')
+    """
+    res = []
+    for spec in specs:
+        if isinstance(spec, six_string_types):
+            given = spec
+            spec = {'path': spec}
+        else:
+            given = spec
+            spec = dict(spec)
+        pop = spec.pop
+        id = pop('id', None)
+        path = pop('path', None)
+        if id:
+            chunks = [id]
+        else:
+            chunks = [chunk
+                      for chunk in normpath(path or '.').split('/')
+                      if chunk and chunk != '.'
+                      ]
+        if not chunks:
+            raise ValueError('Empty folder specification! (%(given)r)'
+                             % locals())
+        children = pop('children', None)
+        here = prefix + tuple(chunks)
+        res.append((here, spec))
+        if children:
+            res.extend(_folder_specs(children, here))
+    return res
+
+
+def make_folders(context, specs, **kwargs):
+    """
+    Erzeuge ("mkdir -p") die durch <specs> angegebenen Ordner samt aller
+    fehlenden übergeordneten Ordner und gib einen Counter mit Statistiken
+    zurück.
+
+    specs - eine Liste von Pfaden (relativ zu <parent>) und/oder
+            verschachtelten Spezifikationen (siehe --> _folder_specs)
+
+    Anders als bei der durch --> make_subfolder_creator erzeugten Funktion
+    wird jeder Ordner nur einmal gesucht bzw. erzeugt (die schon bekannten
+    Elternordner werden vorgehalten), und die Reindizierung erfolgt gesammelt
+    am Ende (siehe _ReindexQueue), für jeden Ordner nur einmal.
+
+    Benannte Argumente:
+
+    logger - der zu verwendende Logger
+    parent - der Ausgangsordner (Vorgabe: das Portal)
+    title_factory - Funktion, um einen ggf. fehlenden Title zu erzeugen
+    batch_size - nach je <batch_size> erzeugten Ordnern wird die Transaktion
+                 abgeschlossen; ebenso bei der Reindizierung (Vorgabe: 100)
+    batch_seconds - ... bzw. spätestens nach <batch_seconds> Sekunden
+                    (Vorgabe: 60)
+    reindex - die erzeugten bzw. geänderten Ordner reindizieren
+              (Vorgabe: True)
+    idxs - die für erzeugte Ordner zu aktualisierenden Indexe
+           (Vorgabe: siehe --> get_default_idxs)
+
+    Vorgabewerte für die spezifizierten Ordner (in den Spezifikationen
+    überschreibbar): view_id (bzw. layout), switch_menu (bzw. menu), language.
+    Implizit benötigte Zwischenordner werden nur erzeugt (mit diesen
+    Vorgaben); bei bestehenden Ordnern wird der Titel nicht geändert.
+    """
+    pop = kwargs.pop
+    logger = pop('logger', None)
+    if logger is None:
+        logger = logging.getLogger('make_folders')
+    parent = pop('parent', None)
+    if parent is None:
+        parent = getToolByName(context, 'portal_url').getPortalObject()
+    title_factory = pop('title_factory', None) or make_title
+    batch_size = pop('batch_size', 100)
+    batch_seconds = pop('batch_seconds', 60)
+    reindex = pop('reindex', True)
+    idxs = pop('idxs', None) or get_default_idxs()
+    defaults = {}
+    for key in ('view_id', 'layout', 'switch_menu', 'menu', 'language'):
+        if key in kwargs:
+            defaults[key] = pop(key)
+    if kwargs:
+        logger.error('make_folders: unused arguments! (%(kwargs)r)',
+                     locals())
+
+    flat = _folder_specs(specs)
+    counter = Counter()
+    queue = _ReindexQueue()
+    containers = {(): parent}  # path tuple --> folder
+    in_batch = 0
+    batch_started = time()
+
+    def apply_options(o, options, created):
+        """
+        Apply the options; return the set of affected indexes, or None
+        """
+        kw = dict(defaults)
+        kw.update(options)
+        kw.pop('title', None)
+        changed_idxs = set()
+        lognotes = make_notes_logger(logger)
+        changed = False
+        ch, notes = handle_language(o, kw, created, idxs=changed_idxs)
+        changed = changed or ch
+        for tup in notes:
+            lognotes(tup)
+        ch, notes, upd = handle_layout(o, kw, created, idxs=changed_idxs)
+        changed = changed or ch
+        for tup in notes:
+            lognotes(tup)
+        ch, notes = handle_menu(o, kw, created, idxs=changed_idxs)
+        changed = changed or ch
+        for tup in notes:
+            lognotes(tup)
+        if kw:
+            logger.warn('%(o)r: unused options %(kw)r', locals())
+        if changed:
+            return changed_idxs
+        return None
+
+    for here, options in flat:
+        for i in range(1, len(here) + 1):
+            key = here[:i]
+            explicit = key == here
+            if key in containers and not explicit:
+                continue
+            container = containers[key[:-1]]
+            id = key[-1]
+            o = containers.get(key)
+            if o is None:
+                o = container._getOb(id, None)
+            created = False
+            if o is None:
+                title = None
+                if explicit:
+                    title = options.get('title')
+                if title is None:
+                    title = title_factory(id)
+                logger.info('Creating folder %(container)r/%(id)s'
+                            ' (%(title)s)...', locals())
+                container.manage_addFolder(id=id, title=title)
+                o = container._getOb(id)
+                created = True
+                counter['created'] += 1
+                in_batch += 1
+            elif explicit:
+                counter['existing'] += 1
+            containers[key] = o
+            if created or explicit:
+                changed_idxs = apply_options(o, options if explicit else {},
+                                             created)
+                if changed_idxs is not None:
+                    counter['changed'] += 1
+                if reindex and (created or changed_idxs is not None):
+                    # (metadata-only changes: idxs)
+                    queue.add(o, sorted(changed_idxs or idxs))
+            if in_batch and (in_batch >= batch_size
+                             or time() - batch_started >= batch_seconds):
+                transaction.commit()
+                done = counter['created']
+                logger.info('%(done)d folders created', locals())
+                in_batch = 0
+                batch_started = time()
+    if in_batch:
+        transaction.commit()
+    if queue:
+        counter['reindexed'] = queue.flush(logger, batch_size, batch_seconds)
+    for key, val in sorted(counter.items()):
+        logger.info('  %(key)s: %(val)d', locals())
+    return counter
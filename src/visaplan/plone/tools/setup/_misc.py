@@ -5,6 +5,7 @@ from __future__ import absolute_import
 from six.moves import map
 
 # Standard library:
+import json
 from posixpath import normpath
 from string import capitalize
 
@@ -42,6 +43,33 @@ def make_title(id):
     return res
 
 
+def read_json_lines(filename, skip=0):
+    """
+    Generate the records of the given JSON lines file (e.g. a plan file,
+    or a local roles snapshot), skipping the first <skip>; empty lines
+    are ignored.
+
+    >>> from tempfile import mkstemp
+    >>> import os
+    >>> fd, fn = mkstemp()
+    >>> with os.fdopen(fd, 'w') as f:
+    ...     f.write('{"a": 1}\\n\\n{"a": 2}\\n{"a": 3}\\n') and None
+    >>> [rec['a'] for rec in read_json_lines(fn, 1)]
+    [2, 3]
+    >>> os.remove(fn)
+    """
+    with open(filename) as f:
+        i = 0
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            i += 1
+            if i <= skip:
+                continue
+            yield json.loads(line)
+
+
 if __name__ == '__main__':
     # Standard library:
     import doctest
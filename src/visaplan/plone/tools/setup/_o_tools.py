@@ -4,6 +4,11 @@ Object tools for (_get_object).make_object_getter()
 and (_make_folder).make_subfolder_creator()
 
 All tools in this module are called in the same style.
+
+The handle_* functions accept an optional set `idxs`;
+if they change anything, they add the names of the affected catalog
+indexes (see the *_IDXS constants) to it.  Changes which don't affect any
+index (like the layout) still require the catalog metadata to be updated.
 """
 
 # Python compatibility:
@@ -43,12 +48,40 @@ __all__ = [
         'make_miniloggers',  # used here
         'make_notes_logger', # used in calling functions
         # operating on connected objects:
+        # affected indexes:
+        'TITLE_IDXS',
+        'LANGUAGE_IDXS',
+        'LAYOUT_IDXS',
+        'MENU_IDXS',
+        'UID_IDXS',
         ]
 
+TITLE_IDXS = [
+    'Title',
+    'getTitleIndex',  # ??
+    'sortable_title',
+    'SearchableText',    # contains the title
+    'getEfectiveIndex',  # contains lower-cased title after numeric time
+    ]
+LANGUAGE_IDXS = [
+    'Language',
+    ]
+LAYOUT_IDXS = []  # metadata only
+MENU_IDXS = [
+    'getExcludeFromNav',
+    ]
+UID_IDXS = [
+    'UID',
+    ]
+SUBPORTAL_IDXS = [
+    'get_sub_portal',
+    ]
+
 if HAS_SUBPORTALS:
     __all__.extend([
         'might_set_subportal',
         'handle_subportal',
+        'SUBPORTAL_IDXS',
         ])
 
 if HAS_VPSEARCH:
@@ -104,11 +137,30 @@ def make_miniloggers(notes, keys=None):
 # ----------------------------------------- ] ... minilogging system ]
 
 
-def handle_title(o, kwdict, created, do_pop=True):
+def _report_idxs(idxs, changed, names):
+    """
+    Add the affected index <names> to the given <idxs> set, if changed
+
+    >>> idxs = set()
+    >>> _report_idxs(idxs, False, MENU_IDXS)
+    >>> len(idxs)
+    0
+    >>> _report_idxs(idxs, True, MENU_IDXS)
+    >>> sorted(idxs)
+    ['getExcludeFromNav']
+    >>> _report_idxs(None, True, MENU_IDXS)
+    """
+    if changed and idxs is not None:
+        idxs.update(names)
+
+
+def handle_title(o, kwdict, created, do_pop=True, idxs=None):
     """
     title -- a given (chosen) title
     default_title -- a calculated title (computed from an id)
     set_title -- set it?
+
+    idxs -- a set to add the affected indexes to (TITLE_IDXS)
     """
     changed = False
     notes = []
@@ -168,10 +220,12 @@ def handle_title(o, kwdict, created, do_pop=True):
         if found_title:
             _DBG('%(o)r: to remove the old title %(found_title)r, '
                  "specify title='' and set_title=2", locals())
+    _report_idxs(idxs, changed, TITLE_IDXS)
     return changed, notes
 
 
-def handle_language(o, kwdict, created, do_pop=True):  # ----- [ h.l. ... [
+def handle_language(o, kwdict, created, do_pop=True,  # -- [ h.l. ... [
+                    idxs=None):
     """
     Handle the language and canonical keyword arguments for the given object
     `o`.
@@ -181,6 +235,8 @@ def handle_language(o, kwdict, created, do_pop=True):  # ----- [ h.l. ... [
     created -- a boolean to tell whether the given object has just been
                created, affecting a few defaults
 
+    idxs -- a set to add the affected indexes to (LANGUAGE_IDXS)
+
     Return a 2-Tuple (changed, notes);
     `notes` is in turn a list of ('INFO', `text`) tuples.
     """
@@ -326,6 +382,7 @@ def handle_language(o, kwdict, created, do_pop=True):  # ----- [ h.l. ... [
     # ----------------------- ] ... canonical, with language implied ]
 
     if changed or not set_language:
+        _report_idxs(idxs, changed, LANGUAGE_IDXS)
         return changed, notes
 
     if set_language:
@@ -340,12 +397,16 @@ def handle_language(o, kwdict, created, do_pop=True):  # ----- [ h.l. ... [
             o.setLanguage(language)
         else:
             changed = True
+    _report_idxs(idxs, changed, LANGUAGE_IDXS)
     return changed, notes  # ---------------------- ] ... handle_language ]
 
 
-def handle_layout(o, kwdict, created, do_pop=True):  # --- [ h.layout ... [
+def handle_layout(o, kwdict, created, do_pop=True,  # ---- [ h.layout ... [
+                  idxs=None):
     """
     handle the layout matters; return a 3-tuple (changed, notes, updates)
+
+    The layout doesn't affect any index (LAYOUT_IDXS), but the metadata.
     """
     changed = False
     notes = []
@@ -373,10 +434,12 @@ def handle_layout(o, kwdict, created, do_pop=True):  # --- [ h.layout ... [
         if found_layout:
             _NFO('Found layout to be %(found_layout)r', locals())
             updates['layout'] = found_layout
+    _report_idxs(idxs, changed, LAYOUT_IDXS)
     return (changed, notes, updates)  # ----------- ] ... handle_language ]
 
 
-def handle_menu(o, kwdict, created, do_pop=True):  # -- [ handle_menu ... [
+def handle_menu(o, kwdict, created, do_pop=True,  # -- [ handle_menu ... [
+                idxs=None):
     """
     Handle the language and canonical keyword arguments for the given object
     `o`.
@@ -385,6 +448,7 @@ def handle_menu(o, kwdict, created, do_pop=True):  # -- [ handle_menu ... [
     kwdict -- the kwargs dictionary of the calling function (will be consumed)
     created -- a boolean to tell whether the given object has just been
                created, affecting a few defaults
+    idxs -- a set to add the affected indexes to (MENU_IDXS)
 
     Return a 2-Tuple (changed, notes);
     `notes` is in turn a list of ('INFO', `text`) tuples.
@@ -414,6 +478,7 @@ def handle_menu(o, kwdict, created, do_pop=True):  # -- [ handle_menu ... [
     else:
         _DBG('switch_menu is %(switch_menu)r', locals())
 
+    _report_idxs(idxs, changed, MENU_IDXS)
     return changed, notes  # -------------------------- ] ... handle_menu ]
 
 
@@ -462,9 +527,11 @@ def might_set_subportal(kwdict):
         return True
 
 
-def handle_subportal(o, kwdict, created, do_pop=True):
+def handle_subportal(o, kwdict, created, do_pop=True, idxs=None):
     """
     Unitracc-specific functionality (visaplan.plone.subportals)
+
+    idxs -- a set to add the affected indexes to (SUBPORTAL_IDXS)
     """
     changed = False
     notes = []
@@ -501,6 +568,7 @@ def handle_subportal(o, kwdict, created, do_pop=True):
 
     if set_subportal:
         o.setSubPortals(subportals)
+        _report_idxs(idxs, True, SUBPORTAL_IDXS)
         return True, notes
     return False, notes
 # --------------------------------- ] ... depends on visaplan.plone.subportals ]
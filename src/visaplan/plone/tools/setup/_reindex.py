@@ -23,6 +23,8 @@ as well: .utils.make_metadata_updater.
 # Python compatibility:
 from __future__ import absolute_import, print_function
 
+import six
+
 # Setup tools:
 import pkg_resources
 
@@ -34,8 +36,16 @@ else:
     HAVE_METADATAVERSION = 1
 
 # Standard library:
+from time import time
 from traceback import extract_stack
 
+try:
+    # Plone:
+    from plone.app.redirector.interfaces import IRedirectionStorage
+    from zope.component import queryUtility
+except ImportError:
+    IRedirectionStorage = None
+
 try:
     # Zope:
     import transaction
@@ -406,6 +416,316 @@ def reindex_all(**kwargs):
             transaction.commit()
 
 
+class _PathOnly(object):
+    """
+    Stand-in for a moved object, for (re)indexing its path only
+
+    >>> _PathOnly('/plone/en/some/doc').getPhysicalPath()
+    ('', 'plone', 'en', 'some', 'doc')
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def getPhysicalPath(self):
+        return tuple(self.path.split('/'))
+
+
+# (for range searches in BTrees of str keys:)
+if six.PY2:
+    _MAX_CHAR = '\xff'
+else:
+    _MAX_CHAR = six.unichr(0x10ffff)
+
+
+def _subtree_keys(mapping, root):
+    """
+    Return the keys of the given mapping (normally the uids BTree of a
+    catalog, path --> record id) for the subtree <root>, root first
+
+    >>> uids = {'/plone/a': 1, '/plone/a/b': 2, '/plone/a-b': 3,
+    ...         '/plone/ab/c': 4}
+    >>> _subtree_keys(uids, '/plone/a')
+    ['/plone/a', '/plone/a/b']
+    >>> _subtree_keys(uids, '/plone/x')
+    []
+    """
+    prefix = root + '/'
+    try:
+        keys = mapping.keys(prefix, prefix + _MAX_CHAR)
+    except TypeError:  # not a BTree
+        keys = sorted(mapping.keys())
+    res = [key for key in keys if key.startswith(prefix)]
+    if root in mapping:
+        res.insert(0, root)
+    return res
+
+
+class _CatalogPaths(object):
+    """
+    Helper for _PathRelocator: relocate the records of one catalog
+
+    Some catalogs (e.g. the uid_catalog and reference_catalog of Archetypes)
+    use paths relative to the portal as keys; for these, the portal path
+    (with a trailing slash) is given as <prefix>.
+    """
+
+    def __init__(self, catalog, prefix=''):
+        zcat = self._zcat = catalog._catalog
+        self.prefix = prefix
+        self.path_idxs = sorted([
+            name
+            for name, index in zcat.indexes.items()
+            if getattr(index, 'meta_type', None) in ('PathIndex',
+                                                     'ExtendedPathIndex')
+            ])
+        self._metadata_pos = zcat.schema.get('getPhysicalPath')
+
+    def relocate(self, old_root, new_root, skip_root=False):
+        prefix = self.prefix
+        if prefix:
+            if not (old_root.startswith(prefix)
+                    and new_root.startswith(prefix)):
+                return 0
+            old_root = old_root[len(prefix):]
+            new_root = new_root[len(prefix):]
+        zcat = self._zcat
+        uids = zcat.uids
+        paths = zcat.paths
+        metadata_pos = self._metadata_pos
+        updated = 0
+        for old_path in _subtree_keys(uids, old_root):
+            new_path = new_root + old_path[len(old_root):]
+            rid = uids[old_path]
+            del uids[old_path]
+            uids[new_path] = rid
+            paths[rid] = new_path
+            if skip_root and old_path == old_root:
+                continue  # to be reindexed by the caller
+            proxy = _PathOnly(prefix + new_path)
+            for name in self.path_idxs:
+                zcat.getIndex(name).index_object(rid, proxy)
+            if metadata_pos is not None:
+                record = list(zcat.data[rid])
+                record[metadata_pos] = proxy.getPhysicalPath()
+                zcat.data[rid] = tuple(record)
+            updated += 1
+        return updated
+
+
+class _PathRelocator(object):
+    """
+    Relocate the catalog records of moved or renamed subtrees, keeping their
+    record ids: only the path indexes (and a getPhysicalPath metadata column,
+    if present) are updated, without loading the contained objects.
+    The subtree roots are expected to be reindexed by the caller.
+
+    If a <context> is given, the records of the Archetypes uid_catalog and
+    reference_catalog (if present) are relocated as well (including the
+    roots), and redirections from the old to the new paths are stored
+    (if plone.app.redirector is available), like the event handlers would do.
+
+    Relocations can be done at once (relocate) or scheduled and done later
+    in one go (schedule, flush); they are done in the order of scheduling,
+    so when renaming nested objects, the deeper ones need to come first.
+
+    >>> class Index(object):
+    ...     meta_type = 'ExtendedPathIndex'
+    ...     def index_object(self, rid, o):
+    ...         print('%d: %s' % (rid, '/'.join(o.getPhysicalPath())))
+    >>> class ZCatalog(object):
+    ...     indexes = {'path': Index()}
+    ...     schema = {}
+    ...     def getIndex(self, name):
+    ...         return self.indexes[name]
+    >>> class Catalog(object):
+    ...     _catalog = ZCatalog()
+    >>> catalog = Catalog()
+    >>> catalog._catalog.uids = {'/plone/a': 1, '/plone/a/b': 2,
+    ...                          '/plone/a/b/c': 3, '/plone/ab': 4}
+    >>> catalog._catalog.paths = {}
+    >>> relocator = _PathRelocator(catalog)
+    >>> relocator.path_idxs
+    ['path']
+    >>> relocator.schedule('/plone/a/b', '/plone/a/x')
+    >>> relocator.schedule('/plone/a', '/plone/y')
+    >>> len(relocator)
+    2
+    >>> relocator.flush()
+    3: /plone/a/x/c
+    2: /plone/y/x
+    3: /plone/y/x/c
+    3
+    >>> sorted(catalog._catalog.uids.items())
+    [('/plone/ab', 4), ('/plone/y', 1), ('/plone/y/x', 2), ('/plone/y/x/c', 3)]
+
+    With a context, the Archetypes catalogs (using paths relative to the
+    portal) and the redirection storage are updated as well:
+    >>> class UidCatalog(object):
+    ...     _catalog = ZCatalog()
+    >>> uid_catalog = UidCatalog()
+    >>> uid_catalog._catalog.indexes = {}
+    >>> uid_catalog._catalog.uids = {'y/x': 12, 'y/x/c': 13}
+    >>> uid_catalog._catalog.paths = {}
+    >>> class Portal(object):
+    ...     def getPhysicalPath(self):
+    ...         return ('', 'plone')
+    >>> class PortalUrl(object):
+    ...     def getPortalObject(self):
+    ...         return Portal()
+    >>> class Context(object):
+    ...     portal_url = PortalUrl()
+    ...     uid_catalog = uid_catalog
+    ...     reference_catalog = None
+    >>> class Redirections(object):
+    ...     def add(self, old_path, new_path):
+    ...         print('redirect %s --> %s' % (old_path, new_path))
+    >>> relocator = _PathRelocator(catalog, Context(),
+    ...                            redirections=Redirections())
+    >>> relocator.relocate('/plone/y/x', '/plone/z')
+    3: /plone/z/c
+    redirect /plone/y/x --> /plone/z
+    1
+    >>> sorted(uid_catalog._catalog.uids.items())
+    [('z', 12), ('z/c', 13)]
+    """
+
+    def __init__(self, catalog, context=None, redirections=None):
+        main = _CatalogPaths(catalog)
+        self._catalogs = [main]
+        self.path_idxs = main.path_idxs
+        if context is not None:
+            portal_prefix = None
+            for name in ('uid_catalog', 'reference_catalog'):
+                tool = getToolByName(context, name, None)
+                if tool is None:
+                    continue
+                if portal_prefix is None:
+                    portal = getToolByName(context, 'portal_url'
+                                           ).getPortalObject()
+                    portal_prefix = '/'.join(portal.getPhysicalPath()) + '/'
+                self._catalogs.append(_CatalogPaths(tool, portal_prefix))
+            if redirections is None and IRedirectionStorage is not None:
+                redirections = queryUtility(IRedirectionStorage)
+        self._redirections = redirections
+        self._pending = []
+
+    def relocate(self, old_root, new_root):
+        """
+        Relocate the records of the subtree <old_root> to <new_root>;
+        return the number of updated portal_catalog records
+        (not counting the root)
+        """
+        catalogs = iter(self._catalogs)
+        updated = next(catalogs).relocate(old_root, new_root, skip_root=True)
+        for other in catalogs:
+            other.relocate(old_root, new_root)
+        if self._redirections is not None:
+            self._redirections.add(old_root, new_root)
+        return updated
+
+    def schedule(self, old_root, new_root):
+        self._pending.append((old_root, new_root))
+
+    def __len__(self):
+        return len(self._pending)
+
+    def flush(self):
+        """
+        Do the scheduled relocations; return the number of updated records
+        """
+        updated = 0
+        for old_root, new_root in self._pending:
+            updated += self.relocate(old_root, new_root)
+        del self._pending[:]
+        return updated
+
+
+class _ReindexQueue(object):
+    """
+    Collect the objects to be reindexed at the end (e.g. of clone_tree),
+    with the indexes affected by their changes (an empty list meaning "all").
+    Each object is reindexed once only.
+
+    >>> class O(object):
+    ...     def __init__(self, path):
+    ...         self.path = path
+    ...     def getPhysicalPath(self):
+    ...         return tuple(self.path.split('/'))
+    ...     def reindexObject(self, idxs=[]):
+    ...         print('%s: %s' % (self.path, idxs or 'all'))
+    >>> a, b = O('/plone/a'), O('/plone/b')
+    >>> queue = _ReindexQueue()
+    >>> queue.add(a, ['Title'])
+    >>> queue.add(b, [])
+    >>> queue.add(a, ['Language', 'Title'])
+    >>> queue.add(O('/plone/b'), ['Title'])
+    >>> len(queue)
+    2
+    >>> from visaplan.plone.tools.mock import MockLogger
+    >>> queue.flush(MockLogger())
+    /plone/a: ['Language', 'Title']
+    /plone/b: all
+    2
+    >>> len(queue)
+    0
+    """
+
+    def __init__(self):
+        self._objects = {}  # physical path --> object
+        self._idxs = {}     # physical path --> set of indexes, or None
+        self._order = []
+
+    def add(self, o, idxs=None):
+        path = tuple(o.getPhysicalPath())
+        if path not in self._objects:
+            self._order.append(path)
+            self._objects[path] = o
+            self._idxs[path] = set(idxs) if idxs else None
+        elif self._idxs[path] is not None:
+            if idxs:
+                self._idxs[path].update(idxs)
+            else:
+                self._idxs[path] = None
+
+    def __len__(self):
+        return len(self._order)
+
+    def flush(self, logger, batch_size=100, batch_seconds=60):
+        """
+        Reindex the collected objects, and commit after <batch_size> objects
+        or <batch_seconds> seconds; return the number of reindexed objects.
+        """
+        total = len(self._order)
+        started = batch_started = time()
+        i = 0
+        in_batch = 0
+        for path in self._order:
+            o = self._objects[path]
+            idxs = self._idxs[path]
+            if idxs is None:
+                o.reindexObject()
+            else:
+                o.reindexObject(idxs=sorted(idxs))
+            i += 1
+            in_batch += 1
+            if (in_batch >= batch_size
+                or time() - batch_started >= batch_seconds
+                ):
+                transaction.commit()
+                eta = (time() - started) * (total - i) / i
+                logger.info('Reindexed %(i)d/%(total)d objects;'
+                            ' about %(eta)d seconds to go', locals())
+                in_batch = 0
+                batch_started = time()
+        if in_batch:
+            transaction.commit()
+            logger.info('Reindexed %(i)d/%(total)d objects', locals())
+        self._objects.clear()
+        self._idxs.clear()
+        del self._order[:]
+        return i
+
+
 if __name__ == '__main__':
     # Standard library:
     import doctest
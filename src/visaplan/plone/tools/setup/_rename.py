@@ -7,9 +7,21 @@ Tools für Produkt-Setup (Migrationsschritte, "upgrade steps"): _rename
 # Plone, sonstiges:
 from __future__ import absolute_import
 
+from six import string_types as six_string_types
+
+# Standard library:
+from collections import Counter, defaultdict
+
 # Zope:
+import transaction
+from Acquisition import aq_base, aq_parent
 from Products.CMFCore.utils import getToolByName
 
+# Local imports:
+from visaplan.plone.tools.setup._o_tools import TITLE_IDXS
+from visaplan.plone.tools.setup._reindex import _PathRelocator, _ReindexQueue
+from visaplan.plone.tools.setup._uid import make_distinct_finder
+
 __all__ = [
         # 'make_mover',  (not yet implemented)
         'make_renamer',
@@ -42,15 +54,25 @@ def make_renamer(**kwargs):
     """
     Erzeuge eine Funktion, die ein per UID angegebenes Objekt umbenennt;
     Voraussetzung: der Elternordner bleibt derselbe (also keine Verschiebung)
+
+    Mit many=True wird stattdessen eine Funktion rename_many erzeugt, die eine
+    ganze Zuordnung UID --> neue ID bzw. neuer Titel abarbeitet
+    (siehe _make_bulk_renamer).
     """
     if 'catalog' not in kwargs:
         context = kwargs.pop('context')
         catalog = getToolByName(context, 'portal_catalog')
     else:
+        context = kwargs.pop('context', None)
         catalog = kwargs.pop('catalog')
     logger = kwargs.pop('logger')
     verbose = kwargs.pop('verbose', False)
     get_object = kwargs.pop('get_object', False)
+    if kwargs.pop('many', False):
+        if context is None:
+            context = getToolByName(catalog, 'portal_url').getPortalObject()
+        return _make_bulk_renamer(catalog, context, logger, verbose,
+                                  **kwargs)
 
     def rename_object(uid=None, oldid=None, newid=None,
                       verbose=verbose,
@@ -203,3 +225,202 @@ def make_renamer(**kwargs):
 
     return rename_object
 
+
+def _normalized_renames(renames):
+    """
+    Normalize the renames argument of rename_many:
+    return a dict uid --> dict (newid, newtitle, oldid, oldtitles)
+
+    >>> sorted(_normalized_renames({'a1': 'new-id'})['a1'].items())
+    [('newid', 'new-id')]
+    >>> sorted(_normalized_renames([('b2', {'newtitle': 'New'})])['b2'].items())
+    [('newtitle', 'New')]
+    """
+    if hasattr(renames, 'items'):
+        renames = renames.items()
+    res = {}
+    for uid, spec in renames:
+        if isinstance(spec, six_string_types):
+            spec = {'newid': spec}
+        else:
+            spec = dict(spec)
+        res[uid] = spec
+    return res
+
+
+def _make_bulk_renamer(catalog, context, logger, verbose, **kwargs):
+    """
+    Helper for make_renamer(many=True): create a rename_many function.
+    The <context> (usually the portal) is used to find the tools
+    for the silent renamings.
+
+    Options to the factory (defaults for rename_many):
+
+      batch_size -- the number of renamings per transaction (default: 500)
+      events -- rename using manage_renameObject, which fires events and
+                thus reindexes the whole subtree of each renamed object
+                (default: True); with events=False, the objects are renamed
+                silently (see below)
+    """
+    default_batch_size = kwargs.pop('batch_size', 500)
+    default_events = kwargs.pop('events', True)
+    if kwargs:
+        logger.error('make_renamer(many=True): ignored arguments %(kwargs)r!',
+                     locals())
+    find_many = make_distinct_finder(catalog=catalog, logger=logger,
+                                     many=True)
+
+    def rename_many(renames, oldtitles=None,
+                    batch_size=default_batch_size,
+                    events=default_events,
+                    verbose=verbose):
+        """
+        Rename many objects at once; return a Counter.
+
+          renames -- a mapping (or a sequence of 2-tuples)
+                     uid --> newid, or uid --> dict with the keys
+                     newid, newtitle, oldid and oldtitles
+                     (see rename_object)
+          oldtitles -- the default value for the oldtitles of each object
+
+        All UIDs are resolved by a single catalog query.
+        The renamings are grouped by parent, and the parents are processed
+        deepest first (each one once per batch, and its objects loaded only
+        if there is something to do).
+
+        With events=False, the objects are renamed without events, like in
+        clone_tree(catalog_only_move=True): the catalog records of their
+        subtrees (in the portal_catalog and, if present, the uid_catalog and
+        reference_catalog of Archetypes) are relocated in one deferred flush
+        per batch, and redirections from the old paths are stored
+        (see _PathRelocator); the renamed objects themselves are reindexed
+        at the end (as are the objects with changed titles).
+        Other event subscribers (e.g. for link integrity or translations)
+        and the manage_renameObject hooks of the objects are *not* called,
+        so this is for trusted bulk migrations only.
+
+        Each renaming is done in a savepoint, which is rolled back on errors,
+        so a failed renaming doesn't leave a half-done change behind.
+        """
+        renames = _normalized_renames(renames)
+        counter = Counter()
+        found, missing, ambiguous = find_many(list(renames.keys()))
+        counter['missing'] += len(missing)
+        counter['ambiguous'] += len(ambiguous)
+        queue = _ReindexQueue()
+        relocator = _PathRelocator(catalog, context)
+        retitled = []  # (uid, o)
+        renamed = set()
+
+        # ---------- titles; ids grouped by parent path:
+        by_parent = defaultdict(list)
+        for uid, brain in found.items():
+            spec = renames[uid]
+            newtitle = spec.get('newtitle')
+            newid = spec.get('newid')
+            if not newid and not newtitle:
+                logger.error('UID %(uid)r: No new id, no new title;'
+                             ' nothing to do!', locals())
+                counter['errors'] += 1
+                continue
+            if newtitle:
+                title = brain.Title
+                accepted = spec.get('oldtitles', oldtitles) or []
+                if title == newtitle:
+                    counter['title_unchanged'] += 1
+                elif accepted == ACCEPT_ANY or title in accepted:
+                    o = brain.getObject()
+                    logger.info('%(o)r: setting title to %(newtitle)r '
+                                '(old: %(title)r)', locals())
+                    o.setTitle(newtitle)
+                    retitled.append((uid, o))
+                    counter['title_changed'] += 1
+                else:
+                    logger.error('UID %(uid)r: unexpected title %(title)r!',
+                                 locals())
+                    counter['unexpected_title'] += 1
+            if newid:
+                current_id = brain.getId
+                oldid = spec.get('oldid')
+                if current_id == newid:
+                    if verbose:
+                        logger.info('UID %(uid)r: renaming to %(newid)r'
+                                    ' already done.', locals())
+                    counter['id_unchanged'] += 1
+                elif oldid in (None, ACCEPT_ANY) or current_id == oldid:
+                    parent_path = brain.getPath().rsplit('/', 1)[0]
+                    by_parent[parent_path].append((uid, brain, newid))
+                else:
+                    logger.error('UID %(uid)r: unexpected ID %(current_id)r,'
+                                 ' skipping.', locals())
+                    counter['unexpected_id'] += 1
+
+        # ---------- renamings, deepest parents first:
+        in_batch = 0
+        for parent_path in sorted(by_parent,
+                                  key=lambda p: (-p.count('/'), p)):
+            parent = None
+            for uid, brain, newid in by_parent[parent_path]:
+                o = brain.getObject()
+                if parent is None:
+                    parent = aq_parent(o)
+                current_id = o.getId()
+                savepoint = transaction.savepoint()
+                try:
+                    if events:
+                        parent.manage_renameObject(current_id, newid)
+                    else:
+                        _rename_silently(parent, o, current_id, newid)
+                        renamed_o = parent._getOb(newid)
+                except Exception as e:
+                    savepoint.rollback()
+                    logger.error('%(o)r: renaming of %(current_id)r'
+                                 ' to %(newid)r failed!\n%(e)r', locals())
+                    counter['errors'] += 1
+                    continue
+                if not events:
+                    relocator.schedule(parent_path + '/' + current_id,
+                                       parent_path + '/' + newid)
+                    queue.add(renamed_o)
+                logger.info('%(parent_path)s: renamed %(current_id)r'
+                            ' to %(newid)r', locals())
+                renamed.add(uid)
+                counter['renamed'] += 1
+                in_batch += 1
+                if in_batch >= batch_size:
+                    counter['catalog_paths_updated'] += relocator.flush()
+                    transaction.commit()
+                    done = counter['renamed']
+                    logger.info('%(done)d objects renamed', locals())
+                    in_batch = 0
+        if in_batch:
+            counter['catalog_paths_updated'] += relocator.flush()
+            transaction.commit()
+        for uid, o in retitled:
+            if uid not in renamed:  # otherwise reindexed completely
+                queue.add(o, TITLE_IDXS)
+        if queue:
+            counter['reindexed'] = queue.flush(logger, batch_size)
+        for key, val in sorted(counter.items()):
+            logger.info('  %(key)s: %(val)d', locals())
+        return counter
+
+    return rename_many
+
+
+def _rename_silently(parent, o, current_id, newid):
+    """
+    Rename the object <o> in its <parent> without events
+    (and thus without any reindexing), keeping its position, if ordered.
+    """
+    parent._checkId(newid)
+    get_position = getattr(aq_base(parent), 'getObjectPosition', None)
+    position = None
+    if get_position is not None:
+        position = parent.getObjectPosition(current_id)
+    parent._delObject(current_id, suppress_events=True)
+    ob = aq_base(o)
+    ob._setId(newid)
+    parent._setObject(newid, ob, set_owner=0, suppress_events=True)
+    if position is not None:
+        parent.moveObjectToPosition(newid, position, suppress_events=True)
@@ -8,18 +8,113 @@ from __future__ import absolute_import
 
 from six import string_types as six_string_types
 
-# visaplan:
-from visaplan.tools.classes import Proxy
+# Zope:
+from Acquisition import aq_base
 
 # Local imports:
-from visaplan.plone.tools.setup._args import extract_object_and_brain
+from visaplan.plone.tools.setup._args import extract_brain_or_object
 
 __all__ = [
         'make_simple_localroles_function',
         'set_local_roles',
+        'SecurityReindexScheduler',
         ]
 
 
+class SecurityReindexScheduler(object):
+    """
+    Sammle die Objekte, deren Sicherheitseinstellungen (lokale Rollen,
+    Berechtigungs-Akquisition) geändert wurden, um sie später gemeinsam
+    zu reindizieren (--> flush).
+
+    Da o.reindexObjectSecurity() jeweils den ganzen Teilbaum unter dem Objekt
+    reindiziert, genügt es, dies für die "obersten" der vorgemerkten Objekte
+    zu tun; Objekte unterhalb eines schon vorgemerkten Objekts werden daher
+    gar nicht erst gespeichert.
+
+    >>> class O(object):
+    ...     def __init__(self, path):
+    ...         self.path = tuple(path.split('/'))
+    ...     def getPhysicalPath(self):
+    ...         return self.path
+    ...     def reindexObjectSecurity(self):
+    ...         print('reindexing %s' % '/'.join(self.path))
+    >>> sched = SecurityReindexScheduler()
+    >>> sched.schedule(O('/plone/a/b'))
+    True
+    >>> sched.schedule(O('/plone/a/b/c'))
+    False
+    >>> sched.schedule(O('/plone/a/bc'))
+    True
+    >>> sched.schedule(O('/plone/a'))
+    True
+    >>> sched.schedule(O('/plone/d'))
+    True
+    >>> len(sched)
+    4
+
+    Beim Abarbeiten werden die untergeordneten Objekte übergangen:
+    >>> sched.flush()
+    reindexing /plone/a
+    reindexing /plone/d
+    2
+    >>> len(sched)
+    0
+
+    Achtung: Zwischen dem Vormerken und dem flush dürfen die Objekte nicht
+    verschoben werden!
+    """
+
+    def __init__(self, logger=None):
+        self._objects = {}  # physical path --> object
+        self.logger = logger
+
+    def schedule(self, o):
+        """
+        Vormerken; gib True zurück, wenn das Objekt nicht schon
+        (direkt oder durch ein übergeordnetes Objekt) vorgemerkt war
+        """
+        path = tuple(o.getPhysicalPath())
+        objects = self._objects
+        for i in range(1, len(path) + 1):
+            if path[:i] in objects:
+                return False
+        objects[path] = o
+        return True
+
+    def roots(self):
+        """
+        Die sortierte Liste der Pfade der obersten vorgemerkten Objekte
+        """
+        res = []
+        last = None
+        for path in sorted(self._objects):
+            if last is not None and path[:len(last)] == last:
+                continue
+            res.append(path)
+            last = path
+        return res
+
+    def flush(self):
+        """
+        Reindiziere die obersten vorgemerkten Objekte (mit ihren Teilbäumen)
+        und gib deren Anzahl zurück
+        """
+        objects = self._objects
+        roots = self.roots()
+        logger = self.logger
+        for path in roots:
+            o = objects[path]
+            if logger is not None:
+                logger.info('reindexing security for %(o)r ...', locals())
+            o.reindexObjectSecurity()
+        objects.clear()
+        return len(roots)
+
+    def __len__(self):
+        return len(self._objects)
+
+
 def make_simple_localroles_function(**kwargs):
     """
     Erzeuge eine einfache Funktion, um (hier: ohne Differenzierung nach
@@ -61,6 +156,17 @@ def set_local_roles(**kwargs):
     thelist -- eine Liste von (userid, roles [, add])-Tupeln;
                nur benötigt (und verwendet), wenn <func> nicht angegeben
 
+    security_scheduler -- ein SecurityReindexScheduler; wenn angegeben, wird
+               das geänderte Objekt dort vorgemerkt, statt sofort (mitsamt
+               Teilbaum) reindiziert zu werden
+
+    Das Objekt wird nur geladen, wenn es überhaupt gewünschte Änderungen gibt;
+    es genügt also die Angabe des <brain>.
+
+    Die lokalen Rollen des Objekts werden einmal gelesen, die Änderungen im
+    Speicher ermittelt und das Ergebnis mit einer einzigen Zuweisung
+    zurückgeschrieben (eine persistente Änderung je Objekt).
+
     Von diesen wird zwingend benötigt:
     - logger
     - mindestens eines von o und brain
@@ -72,7 +178,7 @@ def set_local_roles(**kwargs):
       - thelist
         (derzeit ignoriert, wenn <func> übergeben wurde und nicht None ist)
     """
-    o, brain = extract_object_and_brain(kwargs)
+    brain, o = extract_brain_or_object(kwargs)
     # if 'func' in kwargs:
     func = kwargs.pop('func', None)
     if func is not None:
@@ -82,14 +188,56 @@ def set_local_roles(**kwargs):
     else:
         thelist = kwargs.pop('thelist')
     logger = kwargs.pop('logger')
+    security_scheduler = kwargs.pop('security_scheduler', None)
     if not thelist:
         return False
+    if o is None:
+        o = brain.getObject()
     uid = brain.UID
-    changes = 0
-    def set_of_roles(userid):
-        return set(o.get_local_roles_for_userid(userid=userid))
+    # read the local roles mapping once ...
+    old_local_roles = getattr(aq_base(o), '__ac_local_roles__', None) or {}
+    new_local_roles = _changed_local_roles(old_local_roles, thelist,
+                                           logger, repr(uid), o)
+    if new_local_roles is None:
+        return False
+    # ... and write it back with a single assignment:
+    o.__ac_local_roles__ = new_local_roles
+    if security_scheduler is not None:
+        security_scheduler.schedule(o)
+    else:
+        o.reindexObjectSecurity()
+    return True
+
+
+def _changed_local_roles(local_roles, thelist, logger, label, o=None):
+    """
+    Helper for set_local_roles: compute the changes to the given local roles
+    mapping (userid --> list of roles) in memory.
 
-    roles_of_user = Proxy(set_of_roles)
+    Return a new mapping, if any changes are necessary, or None;
+    the given mapping is not changed.
+
+    >>> from visaplan.plone.tools.mock import MockLogger
+    >>> logger = MockLogger()
+    >>> old = {'owner': ['Owner'], 'editor': ['Editor', 'Reader']}
+    >>> new = _changed_local_roles(old, [('editor', 'Reader', False),
+    ...                                  ('group1', ['Reader', 'Reviewer'])],
+    ...                            logger, 'doc')
+    >>> sorted(new.items())
+    [('editor', ['Editor']), ('group1', ['Reader', 'Reviewer']), ('owner', ['Owner'])]
+    >>> sorted(old.items())
+    [('editor', ['Editor', 'Reader']), ('owner', ['Owner'])]
+
+    Users without any remaining roles are removed:
+    >>> sorted(_changed_local_roles(old, [('editor', ['Editor', 'Reader'], 0)],
+    ...                             logger, 'doc'))
+    ['owner']
+
+    Nothing to do:
+    >>> _changed_local_roles(old, [('owner', 'Owner'), ('group1', 'Reader', 0)],
+    ...                      logger, 'doc')
+    """
+    roles_of_user = {}
     changed_users = set()
     for tup in thelist:
         userid, roles = tup[:2]
@@ -113,44 +261,43 @@ def set_local_roles(**kwargs):
         else:
             add = True
 
+        roles_set = roles_of_user.get(userid)
+        if roles_set is None:
+            roles_set = roles_of_user[userid] = set(local_roles.get(userid)
+                                                    or [])
         for role in roles:
-            roles_set = roles_of_user[userid]
             if role in roles_set:
                 if add:
-                    logger.info('%(uid)r local roles for %(userid)r:'
+                    logger.info('%(label)s local roles for %(userid)r:'
                                 ' %(role)r already found (%(o)r)', locals())
                 else:
-                    logger.info('%(uid)r local roles for %(userid)r:'
+                    logger.info('%(label)s local roles for %(userid)r:'
                                 ' removing %(role)r (%(o)r)', locals())
                     roles_set.discard(role)
                     changed_users.add(userid)
             else:
                 if add:
-                    logger.info('%(uid)r local roles for %(userid)r:'
+                    logger.info('%(label)s local roles for %(userid)r:'
                                 ' adding %(role)r (%(o)r)', locals())
                     changed_users.add(userid)
                     roles_set.add(role)
                 else:
-                    logger.info('%(uid)r local roles for %(userid)r:'
+                    logger.info('%(label)s local roles for %(userid)r:'
                                 ' %(role)r not found (%(o)r)', locals())
 
     if not changed_users:
-        return False
-    done_users = set()
+        return None
+    res = dict(local_roles)
     for userid in sorted(changed_users):
         roles_set = roles_of_user[userid]
         if roles_set:
             sorted_roles = sorted(roles_set)
-            logger.info('%(uid)r local roles for %(userid)r:'
+            logger.info('%(label)s local roles for %(userid)r:'
                         ' set to %(sorted_roles)s (%(o)r)', locals())
-            o.manage_setLocalRoles(userid, sorted_roles)
-            done_users.add(userid)
-    changed_users.difference_update(done_users)
-    if changed_users:
-        userids = sorted(changed_users)
-        logger.info('%(uid)r local roles for %(userids)s:'
-                    ' removing all roles (%(o)r)', locals())
-        o.manage_delLocalRoles(userids)
-    o.reindexObjectSecurity()
-    return True
+            res[userid] = sorted_roles
+        else:
+            logger.info('%(label)s local roles for %(userid)r:'
+                        ' removing all roles (%(o)r)', locals())
+            res.pop(userid, None)
+    return res
 
@@ -6,7 +6,10 @@ Tools für Produkt-Setup (Migrationsschritte, "upgrade steps"): _tree
 # Python compatibility:
 from __future__ import absolute_import
 
+from six import string_types as six_string_types
+
 # Standard library:
+import json
 import random
 from collections import Counter, defaultdict
 from copy import deepcopy
@@ -17,6 +20,7 @@ from time import time
 
 # Zope:
 import transaction
+from Acquisition import aq_base
 from Products.CMFCore.utils import getToolByName
 
 # Plone:
@@ -34,6 +38,7 @@ from visaplan.plone.tools.setup._args import (
     _extract_move_args,
     apply_move_order_options,
     extract_layout_switch,
+    extract_menu_switch,
     normalize_menu_switch,
     setdefault_move_args,
     setdefault_source_language,
@@ -44,7 +49,16 @@ from visaplan.plone.tools.setup._exc import \
     CantAddTranslationReference  # ... enhanced information
 from visaplan.plone.tools.setup._get_object import make_object_getter
 from visaplan.plone.tools.setup._make_folder import make_subfolder_creator
-from visaplan.plone.tools.setup._reindex import make_reindexer
+from visaplan.plone.tools.setup._misc import (
+    _traversable_path,
+    read_json_lines,
+    )
+from visaplan.plone.tools.setup._reindex import (
+    _PathOnly,
+    _PathRelocator,
+    _ReindexQueue,
+    make_reindexer,
+    )
 
 if HAS_SUBPORTALS:
     # Local imports:
@@ -64,11 +78,20 @@ from visaplan.tools.debug import pp
 
 __all__ = [
         'clone_tree',  # sprachverknüpfter Verzeichnisbaum
+        'execute_clone_plan',  # --> clone_tree(plan_file=...)
         # internal:
         # '_clone_tree_inner'
         # '_move_objects'
         ]
 
+# for the created folders (clone_tree and execute_clone_plan):
+_CLONE_IDXS = [
+    'getExcludeFromNav',
+    'Language',
+    # UNITRACC-spezifisch; visaplan.plone.subportals:
+    'get_sub_portal',
+    ]
+
 
 def clone_tree(context, dic, **kwargs):  # --- [ clone_tree ... [
     """
@@ -101,6 +124,25 @@ def clone_tree(context, dic, **kwargs):  # --- [ clone_tree ... [
     - skip_unknown_languages - sollen Zielsprachen, die in der Plone-Instanz
                      nicht aktiviert sind, übergangen werden?
                      (Vorgabe: True)
+    - catalog_only_move - Kindobjekte ohne Events verschieben und im Katalog
+                     nur die pfadabhängigen Daten aktualisieren, statt die
+                     verschobenen Teilbäume komplett zu de- und reindizieren
+                     (siehe _move_catalog_only); Vorgabe: False
+    - move_batch_size - Anzahl der je Transaktion verschobenen Objekte
+                     (nur mit catalog_only_move; Vorgabe: 100)
+    - reindex_batch_size, reindex_batch_seconds - für die abschließende
+                     Reindizierung der geänderten Ordner (siehe _ReindexQueue):
+                     Commit nach je <reindex_batch_size> Objekten (Vorgabe:
+                     100) bzw. spätestens nach <reindex_batch_seconds>
+                     Sekunden (Vorgabe: 60)
+    - plan_file - ein zum Schreiben geöffnetes Dateiobjekt; wenn angegeben,
+                     wird nichts geändert, sondern alle Objektangaben werden
+                     nur aufgelöst, und die nötigen Operationen (Anlegen und
+                     Ändern von Ordnern, Verschiebungen,
+                     Subportal-Korrekturen) werden
+                     mit ihren Anzahlen als JSON-Zeilen geschrieben, zur
+                     Prüfung und späteren Ausführung durch
+                     --> execute_clone_plan.
 
     Hinweise:
     - Es ist möglich und sinnvoll, die Funktion mit denselben Eingabedaten erst
@@ -180,26 +222,31 @@ def clone_tree(context, dic, **kwargs):  # --- [ clone_tree ... [
 
     normalize_menu_switch(kwargs)
 
+    plan_file = kwargs.pop('plan_file', None)
+    reindex_batch_size = kwargs.pop('reindex_batch_size', 100)
+    reindex_batch_seconds = kwargs.pop('reindex_batch_seconds', 60)
     opt = StackOfDicts(kwargs, checked=0)
     info_collector = {
-            'finally_reindex': [],
+            'finally_reindex': _ReindexQueue(),
             'counter': Counter(),
+            'plan': None,
             }
+    if plan_file is not None:
+        info_collector['plan'] = _ClonePlanWriter(plan_file, portal,
+                                                  info_collector)
     try:
         return _clone_tree_inner(context, dic, opt, info_collector, {}, 0)
     finally:
-        transaction.commit()
+        if plan_file is None:
+            transaction.commit()
         finally_reindex = info_collector['finally_reindex']
         counter = info_collector['counter']
         pp(counter=counter)
         if finally_reindex:
-            total = len(finally_reindex)
-            i = 0
-            for o in finally_reindex:
-                i += 1
-                logger.info('Reindexing %(i)d/%(total)d: %(o)r ...', locals())
-                o.reindexObject()
-                transaction.commit()
+            counter['finally_reindexed'] += finally_reindex.flush(
+                    logger,
+                    batch_size=reindex_batch_size,
+                    batch_seconds=reindex_batch_seconds)
         errors = counter.pop('errors', 0)
         for key, val in counter.items():
             logger.info('  %(key)s: %(val)d', locals())
@@ -243,6 +290,7 @@ def _clone_tree_inner(context,  # --------------- [ _clone_tree_inner ... [
 
     counter = info_collector['counter']
     finally_reindex = info_collector['finally_reindex']
+    plan = info_collector['plan']  # planning only, if not None
 
     # ----------------------------- [ _clone_tree_inner: options ... [
     create_level = opt['create_level']
@@ -263,27 +311,28 @@ def _clone_tree_inner(context,  # --------------- [ _clone_tree_inner ... [
     portal = opt['portal']
     catalog = getToolByName(portal, 'portal_catalog')
     # ----------------------------- ] ... _clone_tree_inner: options ]
-    idxs = [
-        'getExcludeFromNav',
-        'Language',
-        # UNITRACC-spezifisch; visaplan.plone.subportals:
-        'get_sub_portal',
-        ]
+    idxs = list(_CLONE_IDXS)
 
     new_folder = make_subfolder_creator(logger=opt['logger'],
                                         parent=portal,
                                         idxs=idxs)
+    # defaults for get_object (planned updates store them as well):
+    getter_options = {
+        'set_title': opt['set_title'],
+        'set_language': opt['set_language'],
+        'set_canonical': opt['set_canonical'],
+        'set_subportal': opt.get('set_subportal'),
+        'subportal': opt.get('subportal'),
+        }
     get_object = make_object_getter(portal,
                                     logger=opt['logger'],
-                                    set_title=opt['set_title'],
-                                    set_language=opt['set_language'],
-                                    set_canonical=opt['set_canonical'],
                                     get_uid=True,
                                     get_layout=opt['get_layout'],
-                                    set_subportal=opt.get('set_subportal'),
-                                    subportal=opt.get('subportal'),
                                     return_tuple=True,
-                                    verbose=2)
+                                    lookup_only=plan is not None,
+                                    cache=True,
+                                    verbose=2,
+                                    **getter_options)
 
     errors = 0
 
@@ -322,7 +371,7 @@ def _clone_tree_inner(context,  # --------------- [ _clone_tree_inner ... [
                     locals())
         # transaction.begin()  # ist das schlau bzw. nötig?!
         if info['changes'] and not info['reindexed']:
-            finally_reindex.append(src_o)
+            finally_reindex.add(src_o, info['idxs'])
 
         # ... alle verbleibenden Schlüssel sind nun Sprachkürzel!
 
@@ -330,6 +379,8 @@ def _clone_tree_inner(context,  # --------------- [ _clone_tree_inner ... [
         # verbleiben:
         same_parent = None
         canonical = None
+        # planning only: (object, spec) of the destination containers
+        planned_updates = []
 
         # --------------- [ Schleife über die *anderen* Sprachen ... [
         for la in dic.keys():
@@ -370,11 +421,14 @@ def _clone_tree_inner(context,  # --------------- [ _clone_tree_inner ... [
                 elif same_parent is None:
                     same_parent = False
                 if create_normal:
-                    dest_o = new_folder(**dest_dict)
+                    if plan is not None:
+                        dest_o = plan.create(dest_dict)
+                    else:
+                        dest_o = new_folder(**dest_dict)
                 elif debug:
                     pp(dest_dict=dest_dict)
                     retry = 1; set_trace()
-                    if retry:
+                    if retry and plan is None:
                         dest_o = new_folder(**dest_dict)
             else:
                 dest_dict.update(info['updates'])
@@ -419,9 +473,12 @@ def _clone_tree_inner(context,  # --------------- [ _clone_tree_inner ... [
                     'canonical': canonical,
                     'language': src_lang,
                     })
-                info = get_object(reindex=reindex, **src_dict)[1]
-                if info['changes']:
-                    logger.info('Source container was changed (%(src_o)r)', locals())
+                if plan is None:  # (otherwise planned after the loop)
+                    info = get_object(reindex=reindex, **src_dict)[1]
+                    if info['changes']:
+                        logger.info('Source container was changed (%(src_o)r)', locals())
+                        if not info['reindexed']:
+                            finally_reindex.add(src_o, info['idxs'])
             if same_parent:
                 dest_dict.update({
                     'language': '',
@@ -435,13 +492,23 @@ def _clone_tree_inner(context,  # --------------- [ _clone_tree_inner ... [
                     dest_dict.update({
                         'canonical': canonical,
                         })
-            o, info = get_object(**dest_dict)
-            if info['changes']:
-                logger.info('Dest. container for %(la)r was changed (%(dest_o)r)', locals())
+            if plan is None:
+                o, info = get_object(**dest_dict)
+                if info['changes']:
+                    logger.info('Dest. container for %(la)r was changed (%(dest_o)r)', locals())
+            elif dest_o is not None:
+                planned_updates.append((dest_o, dict(dest_dict)))
         # --------------- ] ... Schleife über die *anderen* Sprachen ]
 
+        if plan is not None:
+            # the changes of the existing containers, source first,
+            # and the properties of the planned ones:
+            plan.update(src_o, src_dict, getter_options)
+            for o, spec in planned_updates:
+                plan.update(o, spec, getter_options)
+
         # -------------------- [ unitracc; visaplan.plone.search ... [
-        if HAS_VPSEARCH and opt.get('united_search'):
+        if HAS_VPSEARCH and opt.get('united_search') and plan is None:
             handle_united_search(siblings_o, opt, src_lang)
         # -------------------- ] ... unitracc; visaplan.plone.search ]
 
@@ -464,7 +531,18 @@ def _clone_tree_inner(context,  # --------------- [ _clone_tree_inner ... [
                                     ' but not child_set_subportal!', dict(opt))
                         doit = False
 
-                    if doit:
+                    if doit and plan is not None:
+                        # a destination folder which is planned only
+                        # is represented by a _PathOnly stand-in:
+                        planned_o = siblings_o.get(la)
+                        if planned_o is None:
+                            logger.error('rectify_moved: no %(la)r folder'
+                                         ' to plan for!', locals())
+                            errors += 1
+                        else:
+                            plan.subportal(planned_o, la, subportal,
+                                           child_set_subportal, catalog)
+                    elif doit:
                         force_reindex = opt.get('force_reindex')
                         reindex = make_reindexer(logger=logger, catalog=catalog,
                                                  idxs=idxs,
@@ -474,68 +552,13 @@ def _clone_tree_inner(context,  # --------------- [ _clone_tree_inner ... [
                         root_path = '/'.join(tup)
                         query = dict(path=root_path, Language=la)
                         apply_move_order_options(query, opt, do_pop=0)
-                        batch_kw = {'batch_size': 100,
-                                    'thingies': 'checking subportal for objects',
-                                    }
-                        # ---------- [ TODO: vereinheitlichen ... [
-                        # (im einen Fall kommt der Wert aus der Funktion
-                        # (child_set_subportal), im anderen muß er selbst
-                        # gebaut werden. Besser eine von v.p.subportals
-                        # erzeugte Funktion verwenden, die sich um alles
-                        # kümmert und einen Wahrheitswert (geändert?)
-                        # zurückgibt.)
-                        if callable(child_set_subportal):
-                          for batch, txt in batch_tuples(catalog(**query),
-                                                         **batch_kw):
-                            changes_here = 0
-                            logger.info(txt + ' ...')
-                            for brain in batch:
-                                if brain.getPath() == root_path:  # not a child!
-                                    continue
-                                ch, val = child_set_subportal(brain=brain)
-                                if ch or force_reindex:
-                                    child_o = brain.getObject()
-                                if ch:
-                                    child_o.setSubPortals(val)
-                                    counter['subportal_fixed'] += 1
-                                    changes_here += 1
-                                else:
-                                    counter['subportal_checked'] += 1
-                                if ch or force_reindex:
-                                    if reindex(o=child_o):
-                                        counter['children_reindexed'] += 1
-                            if changes_here:
-                                logger.info('%(changes_here)d changes; '
-                                            'committing transaction ...',
-                                            locals())
-                                transaction.commit()
-                        else:
-                          for batch, txt in batch_tuples(catalog(**query),
-                                                         **batch_kw):
-                            changes_here = 0
-                            logger.info(txt + ' ...')
-                            for brain in batch:
-                                if brain.getPath() == root_path:  # not a child!
-                                    continue
-                                val = brain.getSubPortals
-                                ch = subportal not in val
-                                if ch or force_reindex:
-                                    child_o = brain.getObject()
-                                if ch:
-                                    child_o.setSubPortals(val + (subportal,))
-                                    counter['subportal_fixed'] += 1
-                                    changes_here += 1
-                                else:
-                                    counter['subportal_checked'] += 1
-                                if ch or force_reindex:
-                                    if reindex(o=child_o):
-                                        counter['children_reindexed'] += 1
-                            if changes_here:
-                                logger.info('%(changes_here)d changes; '
-                                            'committing transaction ...',
-                                            locals())
-                                transaction.commit()
-                        # ---------- ] ... TODO: vereinheitlichen ]
+                        _rectify_subportals(
+                                catalog(**query),
+                                _make_subportal_decider(subportal,
+                                                        child_set_subportal),
+                                reindex, counter, logger,
+                                skip_path=root_path,
+                                force_reindex=force_reindex)
                 # --- ] ... unitracc-spezifisch: Subportal korrigieren ]
 
                 if move_children:
@@ -561,6 +584,11 @@ def _clone_tree_inner(context,  # --------------- [ _clone_tree_inner ... [
                         'move_limit_each': move_limit_each,
                         'depth': 1,
                         }
+                    if opt.get('catalog_only_move'):
+                        child_kwargs.update({
+                            'catalog_only': True,
+                            'batch_size': opt.get('move_batch_size') or 100,
+                            })
                     subportal = opt.get('subportal')
                     set_subportal = opt.get('child_set_subportal')
                     if subportal and set_subportal:
@@ -568,20 +596,25 @@ def _clone_tree_inner(context,  # --------------- [ _clone_tree_inner ... [
                             'subportal': subportal,
                             'set_subportal': set_subportal,
                             })
+                    if plan is not None:
+                        move = plan.move
+                    else:
+                        move = _move_objects
                     move_types = opt.get('move_types') or []
                     for portal_type in move_types:
-                        _move_objects(src_child_o, dest_child_o,
-                                      portal_type, la,
-                                      logger, counter,
-                                      **child_kwargs)
+                        move(src_child_o, dest_child_o,
+                             portal_type, la,
+                             logger, counter,
+                             **child_kwargs)
 
                     take_types = opt.get('take_types') or []
                     for portal_type in take_types:
-                        _move_objects(src_o, dest_child_o,
-                                      portal_type, la,
-                                      logger, counter,
-                                      **child_kwargs)
-                    transaction.commit()
+                        move(src_o, dest_child_o,
+                             portal_type, la,
+                             logger, counter,
+                             **child_kwargs)
+                    if plan is None:
+                        transaction.commit()
             finally:
                 opt.pop()  # (a StackOfDicts)
 
@@ -604,18 +637,13 @@ def _clone_tree_inner(context,  # --------------- [ _clone_tree_inner ... [
     # ------------------------------------------- ] ... _clone_tree_inner ]
 
 
-def _move_objects(from_o, to_o,  # ------------------ [ _move_objects ... [
-                  portal_type, lang, logger, cnt,
-                  **kwargs):
+def _move_query(from_o, portal_type, lang, depth, kwargs):
     """
-    Helper for clone_tree(move_children)
+    Helper for _move_objects and _ClonePlanWriter.move:
+    return the catalog query for the objects to move,
+    consuming the move order options of the given <kwargs>
+    (see apply_move_order_options)
     """
-    kwargs = dict(kwargs)
-    pop = kwargs.pop
-    depth = pop('depth', 1)
-    assert depth == 1, (
-        'depth=%(depth)r: other depths than 1 are not yet implemented!'
-        ) % locals()
     query = {
         'portal_type': portal_type,
         'Language': lang,
@@ -630,9 +658,34 @@ def _move_objects(from_o, to_o,  # ------------------ [ _move_objects ... [
                 'depth': depth,
                 }
     apply_move_order_options(query, kwargs)
+    return query
+
+
+def _move_objects(from_o, to_o,  # ------------------ [ _move_objects ... [
+                  portal_type, lang, logger, cnt,
+                  **kwargs):
+    """
+    Helper for clone_tree(move_children)
+
+    With an <ids> option (e.g. from a clone plan, see execute_clone_plan),
+    exactly the listed objects are moved, if still found.
+    """
+    kwargs = dict(kwargs)
+    pop = kwargs.pop
+    depth = pop('depth', 1)
+    assert depth == 1, (
+        'depth=%(depth)r: other depths than 1 are not yet implemented!'
+        ) % locals()
+    ids = pop('ids', None)
+    query = _move_query(from_o, portal_type, lang, depth, kwargs)
+    query_path = '/'.join(from_o.getPhysicalPath())
 
     catalog = getToolByName(from_o, 'portal_catalog')
     brains = catalog(query)
+    if ids is not None:
+        wanted = set(ids)
+        brains = [brain for brain in brains
+                  if brain.getId in wanted]
     count_here = len(brains)
     if not count_here:
         logger.info('No %(portal_type)r objects of language %(lang)r in %(query_path)r', locals())
@@ -643,6 +696,7 @@ def _move_objects(from_o, to_o,  # ------------------ [ _move_objects ... [
     if move_limit is not None and cnt['moved_total'] >= move_limit:
         logger.info('Total move limit exceeded (%(move_limit)r)', locals())
         return 0
+    catalog_only = pop('catalog_only', False)
 
     try:
         if HAS_SUBPORTALS:
@@ -651,6 +705,20 @@ def _move_objects(from_o, to_o,  # ------------------ [ _move_objects ... [
         else:
             consider_sp = False
             one_by_one = portal_type == 'Folder'
+        if catalog_only:
+            ids = [brain.getId for brain in brains]
+            local_limits = []
+            if move_limit_each:
+                local_limits.append(move_limit_each)
+            if move_limit is not None:
+                local_limits.append(move_limit - cnt['moved_total'])
+            if local_limits:
+                del ids[min(local_limits):]
+            return _move_catalog_only(from_o, to_o, ids, catalog,
+                                      logger, cnt,
+                                      batch_size=pop('batch_size', 100),
+                                      subportal_kwargs=consider_sp and kwargs
+                                                       or None)
         if one_by_one:
             i = 0
             for brain in brains:
@@ -743,6 +811,636 @@ def _move_objects(from_o, to_o,  # ------------------ [ _move_objects ... [
         transaction.commit()
     # ----------------------------------------------- ] ... _move_objects ]
 
+
+def _move_catalog_only(from_o, to_o,  # ----------- [ _move_catalog_only ... [
+                       ids, catalog, logger, cnt,
+                       batch_size=100,
+                       subportal_kwargs=None):
+    """
+    Helper for _move_objects(catalog_only=True):
+    move the objects <ids> from <from_o> to <to_o>, in batches of <batch_size>
+    objects per transaction.
+
+    The objects are moved without events (thus, neither unindexed nor
+    reindexed as a whole); instead, the catalog records of the moved subtrees
+    are relocated (see _PathRelocator): in the portal_catalog, and in the
+    uid_catalog and reference_catalog of Archetypes, if present; and
+    redirections from the old paths are stored (plone.app.redirector).
+    The moved objects themselves are reindexed for their position in the new
+    parent; if <from_o> is ordered, the remaining children which followed
+    the moved objects are reindexed for their new positions once per batch.
+    Each move is done in a savepoint, which is rolled back on errors.
+
+    Caution: Everything else which depends on the location is *not* updated,
+    since no event subscribers are called; in particular:
+
+    - the security indexes are not updated, so this is meant for moves
+      between parents with the same local roles and permissions
+      (e.g. language folders);
+    - the last modification dates are not changed;
+    - other catalogs or utilities which track paths (e.g. of add-ons)
+      keep the old paths.
+    """
+    relocator = _PathRelocator(catalog, from_o)
+    top_idxs = ['getObjPositionInParent'] + relocator.path_idxs
+    if subportal_kwargs is not None:
+        top_idxs.append('get_sub_portal')
+    old_prefix = '/'.join(from_o.getPhysicalPath())
+    new_prefix = '/'.join(to_o.getPhysicalPath())
+    get_position = getattr(aq_base(from_o), 'getObjectPosition', None)
+    total = len(ids)
+    logger.info('Moving %(total)d objects from %(old_prefix)r'
+                ' to %(new_prefix)r (catalog only) ...', locals())
+    moved = 0
+    for batch, txt in batch_tuples(ids, batch_size,
+                                   thingies='objects to move'):
+        logger.info(txt + ' ...')
+        first_position = None  # of the moved objects in from_o
+        for id in batch:
+            savepoint = transaction.savepoint()
+            try:
+                o = from_o._getOb(id)
+                if subportal_kwargs is not None:  # unitracc-specific
+                    handle_subportal(o, subportal_kwargs,
+                                     created=False, do_pop=False)
+                if get_position is not None:
+                    position = from_o.getObjectPosition(id)
+                from_o._delObject(id, suppress_events=True)
+                to_o._setObject(id, aq_base(o), set_owner=0,
+                                suppress_events=True)
+                cnt['catalog_paths_updated'] += relocator.relocate(
+                        old_prefix + '/' + id,
+                        new_prefix + '/' + id)
+                to_o._getOb(id).reindexObject(idxs=top_idxs)
+            except Exception:
+                savepoint.rollback()
+                raise
+            if get_position is not None:
+                if first_position is None or position < first_position:
+                    first_position = position
+            moved += 1
+            cnt['moved_total'] += 1
+        if first_position is not None:
+            # the following siblings moved up:
+            for sibling_id in from_o.objectIds()[first_position:]:
+                from_o._getOb(sibling_id).reindexObject(
+                        idxs=['getObjPositionInParent'])
+                cnt['siblings_reindexed'] += 1
+        transaction.commit()
+    logger.info('Done: Moved %(moved)d objects to %(new_prefix)r', locals())
+    return moved
+    # ------------------------------------------ ] ... _move_catalog_only ]
+
+
+def _make_subportal_decider(subportal, child_set_subportal=None):
+    """
+    Helper for clone_tree(rectify_moved=True) and execute_clone_plan:
+    create a function which decides from the catalog metadata of the given
+    brain whether the object needs the <subportal> to be added.
+
+    The created function returns a 2-tuple (changed, value):
+
+    >>> from visaplan.plone.tools.mock import MockBrain
+    >>> decide = _make_subportal_decider('sub2')
+    >>> decide(MockBrain(getSubPortals=('sub1',)))
+    (True, ('sub1', 'sub2'))
+    >>> decide(MockBrain(getSubPortals=('sub1', 'sub2')))
+    (False, ('sub1', 'sub2'))
+
+    If a function is given as <child_set_subportal>, the decision is left to
+    it:
+    >>> def csp(brain):
+    ...     return False, brain.getSubPortals
+    >>> decide = _make_subportal_decider('sub2', csp)
+    >>> decide(MockBrain(getSubPortals=('sub1',)))
+    (False, ('sub1',))
+    """
+    if callable(child_set_subportal):
+        def decide(brain):
+            return child_set_subportal(brain=brain)
+    else:
+        def decide(brain):
+            val = tuple(brain.getSubPortals or ())
+            if subportal in val:
+                return False, val
+            return True, val + (subportal,)
+    return decide
+
+
+def _rectify_subportals(brains, decide, reindex, counter, logger,
+                        # ------------- [ _rectify_subportals ... [
+                        **kwargs):
+    """
+    Streaming stage for the subportal rectification of (moved) objects:
+
+    brains -- the catalog objects to check (e.g. a catalog query result,
+              which is consumed lazily)
+    decide -- a function which takes a brain and returns a 2-tuple
+              (changed, value); see _make_subportal_decider
+    reindex -- a reindexer, see --> make_reindexer
+    counter -- a Counter; the keys subportal_checked, subportal_fixed,
+               subportal_skipped and children_reindexed are incremented
+
+    Keyword-only options:
+
+    skip_path -- the path of the root object (which is not a child)
+    batch_size -- the number of brains per batch (default: 100);
+                  the changed objects of each batch are reindexed together,
+                  followed by a commit
+    force_reindex -- reindex the unchanged objects as well
+                     (which requires them to be loaded)
+
+    The decision is made from the catalog metadata;
+    only objects which need a change are loaded.
+    """
+    skip_path = kwargs.pop('skip_path', None)
+    batch_size = kwargs.pop('batch_size', 100)
+    force_reindex = kwargs.pop('force_reindex', False)
+    if kwargs:
+        logger.error('_rectify_subportals: unused arguments! (%(kwargs)r)',
+                     locals())
+    for batch, txt in batch_tuples(brains, batch_size,
+                                   thingies='checking subportal for objects'):
+        logger.info(txt + ' ...')
+        todo = []
+        for brain in batch:
+            if skip_path is not None and brain.getPath() == skip_path:
+                continue  # not a child!
+            counter['subportal_checked'] += 1
+            ch, val = decide(brain)
+            if ch:
+                todo.append((brain, val))
+            elif force_reindex:
+                todo.append((brain, None))
+            else:
+                counter['subportal_skipped'] += 1
+        changes_here = 0
+        for brain, val in todo:
+            child_o = brain.getObject()
+            if val is not None:
+                child_o.setSubPortals(val)
+                counter['subportal_fixed'] += 1
+                changes_here += 1
+            if reindex(o=child_o):
+                counter['children_reindexed'] += 1
+        if changes_here:
+            logger.info('%(changes_here)d changes; '
+                        'committing transaction ...',
+                        locals())
+            transaction.commit()
+    # ------------------------------------------ ] ... _rectify_subportals ]
+
+
+def _relative_path(o, portal_path):
+    """
+    Return the path of the given object, relative to the portal
+
+    >>> _relative_path(_PathOnly('/plone/en/some/folder'), ('', 'plone'))
+    'en/some/folder'
+    """
+    return '/'.join(o.getPhysicalPath()[len(portal_path):])
+
+
+def _pending_changes(o, spec):
+    """
+    Helper for _ClonePlanWriter.update: return the sorted list of the
+    properties of the existing object <o> which get_object would change,
+    given the keyword arguments <spec> (see make_object_getter);
+    the object itself is not changed.
+
+    >>> class Folder(object):
+    ...     portal_type = 'Folder'
+    ...     def Title(self): return 'Old'
+    ...     def Language(self): return 'de'
+    ...     def getCanonical(self): return _PathOnly('/plone/de/old')
+    ...     def getLayout(self): return 'folder_listing'
+    ...     def getExcludeFromNav(self): return False
+    >>> o = Folder()
+    >>> _pending_changes(o, {'title': 'Old', 'set_title': True,
+    ...                      'language': 'de', 'set_language': True})
+    []
+    >>> _pending_changes(o, {'title': 'New', 'set_title': True,
+    ...                      'layout': 'folder_listing', 'switch_menu': True})
+    ['title']
+
+    Without set_title, an existing title is kept:
+    >>> _pending_changes(o, {'title': 'New', 'set_title': None,
+    ...                      'layout': 'summary_view', 'switch_menu': False})
+    ['layout', 'menu']
+    >>> _pending_changes(o, {'language': 'en', 'set_language': True,
+    ...                      'canonical': _PathOnly('/plone/de/other'),
+    ...                      'set_canonical': None})
+    ['canonical', 'language']
+    """
+    get = spec.get
+    changes = set()
+    title = (get('title') or '').strip()
+    if title:
+        found = o.Title()
+        set_title = get('set_title')
+        if title != found and (set_title
+                               or (set_title is None and not found)):
+            changes.add('title')
+    if getattr(o, 'portal_type', None) != 'Plone Site':
+        if ('language' in spec
+                and get('set_language') is not False
+                and get('language') != o.Language()):
+            changes.add('language')
+        canonical = get('canonical')
+        if canonical is not None and get('set_canonical') is not False:
+            found = o.getCanonical()
+            if (found is None
+                    or found.getPhysicalPath() != canonical.getPhysicalPath()):
+                changes.add('canonical')
+    layout, set_layout, get_layout = extract_layout_switch(spec, do_pop=False)
+    if set_layout and layout and o.getLayout() != layout:
+        changes.add('layout')
+    switch_menu = extract_menu_switch(spec, False, do_pop=False)
+    if switch_menu is not None:
+        get_exclude = getattr(o, 'getExcludeFromNav', None)
+        if get_exclude is not None and get_exclude() != (not switch_menu):
+            changes.add('menu')
+    if HAS_SUBPORTALS and might_set_subportal(spec):
+        subportal = get('subportal')
+        if isinstance(subportal, six_string_types):
+            wanted = set([subportal])
+        else:
+            wanted = set(subportal)
+        if wanted.difference(o.getSubPortals()):
+            changes.add('subportal')
+    return sorted(changes)
+
+
+class _ClonePlanWriter(object):
+    """
+    Helper for clone_tree(plan_file=...): decide the operations and write
+    them to the plan file, one JSON object per line.
+
+    Objects to be created are represented by _PathOnly stand-ins, so their
+    children can be planned as well.
+    """
+
+    def __init__(self, fileobj, portal, info_collector):
+        self.fileobj = fileobj
+        self.portal_path = portal.getPhysicalPath()
+        self.counter = info_collector['counter']
+
+    def write(self, op, **kwargs):
+        kwargs['op'] = op
+        self.fileobj.write(json.dumps(kwargs, sort_keys=True) + '\n')
+
+    def storable(self, spec):
+        """
+        Split the given keyword arguments (for new_folder or get_object)
+        into a 2-tuple (kwargs, refs) of storable values, with the
+        object references (e.g. canonical) as paths relative to the portal;
+        id, parent and path are left out (see create).
+
+        >>> class Portal(object):
+        ...     def getPhysicalPath(self):
+        ...         return ('', 'plone')
+        >>> writer = _ClonePlanWriter(None, Portal(), {'counter': Counter()})
+        >>> kwargs, refs = writer.storable({
+        ...     'id': 'new', 'parent': _PathOnly('/plone/en'),
+        ...     'title': 'New', 'layout': 'folder_listing', 'set_layout': True,
+        ...     'switch_menu': False,
+        ...     'canonical': _PathOnly('/plone/de/neu')})
+        >>> sorted(kwargs.items())          # doctest: +NORMALIZE_WHITESPACE
+        [('layout', 'folder_listing'), ('set_layout', True),
+         ('switch_menu', False), ('title', 'New')]
+        >>> refs
+        {'canonical': 'de/neu'}
+
+        Functions can't be stored:
+        >>> writer.storable({'set_subportal': len})
+        ...                                  # doctest: +ELLIPSIS
+        Traceback (most recent call last):
+          ...
+        ValueError: Can't plan set_subportal=<built-in function len>; ...
+        """
+        kwargs = {}
+        refs = {}
+        for key, val in spec.items():
+            if key in ('id', 'parent', 'path'):
+                continue
+            if hasattr(val, 'getPhysicalPath'):
+                refs[key] = _relative_path(val, self.portal_path)
+            elif callable(val):
+                raise ValueError("Can't plan %(key)s=%(val)r;"
+                                 ' please use clone_tree without plan_file!'
+                                 % locals())
+            else:
+                kwargs[key] = val
+        return kwargs, refs
+
+    def create(self, dest_dict):
+        """
+        Plan the creation of the folder specified by <dest_dict>
+        (the keyword arguments for new_folder, see make_subfolder_creator),
+        and return a stand-in; the language and canonical are set by a
+        subsequent update (see below), as in a direct clone_tree run
+        """
+        path = dest_dict.get('path')
+        parent = dest_dict.get('parent')
+        if dest_dict.get('id') and parent is not None:
+            path = '/'.join((_relative_path(parent, self.portal_path),
+                             dest_dict['id']))
+        elif path:
+            path = _traversable_path(path)
+        else:
+            raise ValueError("Can't plan creation of %(dest_dict)r:"
+                             ' path or parent and id needed!'
+                             % locals())
+        kwargs, refs = self.storable(dest_dict)
+        self.write('create', path=path, kwargs=kwargs, refs=refs)
+        self.counter['plan_create'] += 1
+        return _PathOnly('/'.join(self.portal_path + (path,)))
+
+    def update(self, o, spec, defaults):
+        """
+        Plan the changes of the folder <o> which get_object would make,
+        given the keyword arguments <spec> and the <defaults> of the
+        function (see make_object_getter); for a folder which is planned to
+        be created (a _PathOnly stand-in), all given properties are set.
+        Return the number of written records.
+
+        >>> from six.moves import StringIO
+        >>> class Portal(object):
+        ...     def getPhysicalPath(self):
+        ...         return ('', 'plone')
+        >>> f = StringIO()
+        >>> writer = _ClonePlanWriter(f, Portal(), {'counter': Counter()})
+        >>> writer.update(_PathOnly('/plone/en/new'),
+        ...               {'id': 'new', 'parent': _PathOnly('/plone/en'),
+        ...                'language': 'en',
+        ...                'canonical': _PathOnly('/plone/de/neu')},
+        ...               {'set_language': True})
+        1
+        >>> print(f.getvalue().strip())     # doctest: +NORMALIZE_WHITESPACE
+        {"changes": null,
+         "kwargs": {"language": "en", "set_language": true},
+         "op": "update", "path": "en/new", "refs": {"canonical": "de/neu"}}
+        """
+        kwargs = dict(defaults)
+        kwargs.update(spec)
+        if isinstance(o, _PathOnly):
+            changes = None
+        else:
+            changes = _pending_changes(o, kwargs)
+        kwargs, refs = self.storable(kwargs)
+        if changes == []:
+            return 0
+        self.write('update', path=_relative_path(o, self.portal_path),
+                   kwargs=kwargs, refs=refs, changes=changes)
+        self.counter['plan_update'] += 1
+        return 1
+
+    def move(self, from_o, to_o, portal_type, lang, logger, cnt, **kwargs):
+        """
+        Plan a move operation (see _move_objects): decide the objects to move
+        (using the same query and order, and the local and total limits),
+        and write them with the options which are needed to repeat it
+
+        >>> from six.moves import StringIO
+        >>> from visaplan.plone.tools.mock import MockBrain
+        >>> class Catalog(object):
+        ...     def __call__(self, query):
+        ...         return [MockBrain(getId=id) for id in ('a', 'b', 'c')]
+        >>> class Folder(_PathOnly):
+        ...     portal_catalog = Catalog()
+        >>> f = StringIO()
+        >>> cnt = Counter()
+        >>> writer = _ClonePlanWriter(f, Folder('/plone'), {'counter': cnt})
+        >>> writer.move(Folder('/plone/de/x'), _PathOnly('/plone/en/x'),
+        ...             'Document', 'en', None, cnt, depth=1,
+        ...             move_limit=2, subportal='sub2', set_subportal=True)
+        2
+        >>> print(f.getvalue().strip())
+        ...                   # doctest: +NORMALIZE_WHITESPACE +ELLIPSIS
+        {"count": 2, "ids": ["a", "b"], "language": "en", "op": "move",
+         "portal_type": "Document", "set_subportal": true,
+         "sort_on": ..., "source": "de/x",
+         "subportal": "sub2", "target": "en/x"}
+
+        The total move limit is exhausted now:
+        >>> writer.move(Folder('/plone/de/y'), _PathOnly('/plone/en/y'),
+        ...             'Document', 'en', None, cnt, move_limit=2)
+        0
+        """
+        kwargs = dict(kwargs)
+        pop = kwargs.pop
+        query = _move_query(from_o, portal_type, lang, pop('depth', 1),
+                            kwargs)
+        catalog = getToolByName(from_o, 'portal_catalog')
+        ids = [brain.getId for brain in catalog(query)]
+        limits = []
+        move_limit_each = pop('move_limit_each', None)
+        if move_limit_each:
+            limits.append(move_limit_each)
+        move_limit = pop('move_limit', None)
+        if move_limit is not None:
+            limits.append(max(move_limit - cnt['plan_move'], 0))
+        if limits:
+            del ids[min(limits):]
+        subportal_kwargs, refs = self.storable({
+            'subportal': kwargs.get('subportal'),
+            'set_subportal': kwargs.get('set_subportal'),
+            })
+        if not ids:
+            return 0
+        count = len(ids)
+        self.write('move',
+                   source=_relative_path(from_o, self.portal_path),
+                   target=_relative_path(to_o, self.portal_path),
+                   portal_type=portal_type, language=lang,
+                   sort_on=query.get('sort_on'),
+                   ids=ids, count=count,
+                   **subportal_kwargs)
+        cnt['plan_move'] += count
+        return count
+
+    def subportal(self, o, la, subportal, child_set_subportal, catalog):
+        """
+        Plan the rectification of the subportal of the children of <o>,
+        counting the objects which need it; <o> may be a _PathOnly stand-in
+        for a folder which is planned to be created:
+
+        >>> from six.moves import StringIO
+        >>> from visaplan.plone.tools.mock import MockBrain
+        >>> class Portal(object):
+        ...     def getPhysicalPath(self):
+        ...         return ('', 'plone')
+        >>> def catalog(path, Language):
+        ...     brain = MockBrain(getSubPortals=('sub1',))
+        ...     brain.getPath = lambda: path + '/child'
+        ...     return [brain]
+        >>> f = StringIO()
+        >>> writer = _ClonePlanWriter(f, Portal(), {'counter': Counter()})
+        >>> writer.subportal(_PathOnly('/plone/en/new'), 'en', 'sub2', True,
+        ...                  catalog)
+        1
+        >>> print(f.getvalue().strip())     # doctest: +NORMALIZE_WHITESPACE
+        {"count": 1, "language": "en", "op": "subportal", "root": "en/new",
+         "subportal": "sub2"}
+        """
+        root_path = '/'.join(o.getPhysicalPath())
+        decide = _make_subportal_decider(subportal, child_set_subportal)
+        count = 0
+        for brain in catalog(path=root_path, Language=la):
+            if brain.getPath() == root_path:  # not a child!
+                continue
+            if decide(brain)[0]:
+                count += 1
+        if count:
+            self.write('subportal',
+                       root=_relative_path(o, self.portal_path),
+                       language=la, subportal=subportal,
+                       count=count)
+            self.counter['plan_subportal'] += count
+        return count
+
+
+def execute_clone_plan(context, filename, **kwargs):
+    """
+    Führe einen (durch clone_tree(plan_file=...) erzeugten und hoffentlich
+    geprüften) Plan aus und gib einen Counter mit Statistiken zurück.
+
+    Die Operationen werden geordnet ausgeführt:
+
+    1. das Anlegen der Ordner, übergeordnete zuerst, in Transaktionen zu je
+       <batch_size> Ordnern, mit allen für clone_tree angegebenen Optionen
+       (Titel, Layout, Menü usw.);
+       danach die Änderungen der Ordner (Titel, Sprache und
+       Sprachverknüpfung, Layout, Menü, Subportal) wie von clone_tree
+       vorgenommen, auch für die neuen Ordner;
+    2. die Verschiebungen, nach Ziel- und Quellordner gruppiert
+       (siehe _move_objects; mit catalog_only_move=True batchweise);
+       verschoben werden genau die geplanten Objekte (soweit noch
+       vorhanden), in der geplanten Reihenfolge und ggf. mit Subportal;
+
+    3. die Subportal-Korrekturen (siehe _rectify_subportals); wurde
+       für clone_tree eine Funktion als child_set_subportal übergeben,
+       ist hierfür allerdings clone_tree(rectify_moved=True) zu verwenden.
+
+    Benannte Argumente:
+
+    logger - der zu verwendende Logger
+    batch_size - Anzahl der Ordner bzw. (mit catalog_only_move)
+                 der verschobenen Objekte je Transaktion (Vorgabe: 100)
+    catalog_only_move - siehe --> clone_tree
+    dry_run - nichts ändern, sondern nur zählen
+    """
+    pop = kwargs.pop
+    logger = pop('logger', None)
+    if logger is None:
+        logger = logging.getLogger('execute_clone_plan')
+    batch_size = pop('batch_size', 100)
+    catalog_only_move = pop('catalog_only_move', False)
+    dry_run = pop('dry_run', False)
+    if kwargs:
+        logger.error('execute_clone_plan: unused arguments! (%(kwargs)r)',
+                     locals())
+
+    counter = Counter()
+    ops = defaultdict(list)
+    for record in read_json_lines(filename):
+        op = record.pop('op')
+        ops[op].append(record)
+        counter['planned_' + op] += record.get('count', 1)
+    for key, val in sorted(counter.items()):
+        logger.info('  %(key)s: %(val)d', locals())
+    if dry_run:
+        return counter
+
+    portal = getToolByName(context, 'portal_url').getPortalObject()
+
+    def resolve(path):
+        return portal.restrictedTraverse(_traversable_path(path))
+
+    def replayed(record):
+        """
+        the stored keyword arguments, with the references resolved
+        (see _ClonePlanWriter.storable)
+        """
+        spec = dict(record['kwargs'])
+        for key, path in record['refs'].items():
+            spec[key] = resolve(path)
+        return spec
+
+    # ---------- 1. Ordner anlegen, übergeordnete zuerst:
+    new_folder = make_subfolder_creator(logger=logger, parent=portal,
+                                        idxs=list(_CLONE_IDXS))
+    creates = sorted(ops['create'],
+                     key=lambda record: (record['path'].count('/'),
+                                         record['path']))
+    for batch, txt in batch_tuples(creates, batch_size,
+                                   thingies='folders to create'):
+        logger.info(txt + ' ...')
+        for record in batch:
+            new_folder(create=True, path=record['path'], **replayed(record))
+            counter['created'] += 1
+        transaction.commit()
+
+    # ---------- 1a. Ordner ändern bzw. verknüpfen, übergeordnete zuerst
+    #                (für denselben Ordner in der geplanten Reihenfolge):
+    get_object = make_object_getter(portal, logger=logger,
+                                    return_tuple=True,
+                                    verbose=2)
+    updates = sorted(ops['update'],
+                     key=lambda record: record['path'].count('/'))
+    for batch, txt in batch_tuples(updates, batch_size,
+                                   thingies='folders to update'):
+        logger.info(txt + ' ...')
+        for record in batch:
+            o, info = get_object(path=record['path'], reindex=None,
+                                 **replayed(record))
+            if o is None:
+                logger.error('%(specs)s not found!', info)
+                counter['errors'] += 1
+            elif info['changes']:
+                counter['updated'] += 1
+        transaction.commit()
+
+    # ---------- 2. Verschiebungen, nach Ziel und Quelle gruppiert:
+    moves = sorted(ops['move'],
+                   key=lambda record: (record['target'], record['source'],
+                                       record['portal_type']))
+    for record in moves:
+        from_o = resolve(record['source'])
+        to_o = resolve(record['target'])
+        options = {}
+        for key in ('sort_on', 'subportal', 'set_subportal'):
+            if record.get(key) is not None:
+                options[key] = record[key]
+        _move_objects(from_o, to_o,
+                      record['portal_type'], record['language'],
+                      logger, counter,
+                      depth=1,
+                      ids=record['ids'],
+                      catalog_only=catalog_only_move,
+                      batch_size=batch_size,
+                      **options)
+        transaction.commit()
+
+    # ---------- 3. Subportale korrigieren:
+    if ops['subportal']:
+        catalog = getToolByName(portal, 'portal_catalog')
+        reindex = make_reindexer(logger=logger, catalog=catalog,
+                                 idxs=['get_sub_portal'],
+                                 update_metadata=True)
+    for record in ops['subportal']:
+        root_path = '/'.join(resolve(record['root']).getPhysicalPath())
+        _rectify_subportals(catalog(path=root_path,
+                                    Language=record['language']),
+                            _make_subportal_decider(record['subportal']),
+                            reindex, counter, logger,
+                            skip_path=root_path,
+                            batch_size=batch_size)
+    for key, val in sorted(counter.items()):
+        logger.info('  %(key)s: %(val)d', locals())
+    return counter
+
+
 def _skip_language(la, dic):
     """
     Helper for _clone_tree_inner: Skip the given language?
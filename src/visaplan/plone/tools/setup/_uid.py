@@ -9,6 +9,9 @@ from __future__ import absolute_import
 from six import string_types as six_string_types
 from six import text_type as six_text_type
 
+# Standard library:
+from collections import defaultdict
+
 # Zope:
 from Products.CMFCore.utils import getToolByName
 
@@ -36,6 +39,37 @@ def make_distinct_finder(**kwargs):
     """
     Erzeuge eine Funktion, die ein per UID angegebenes Objekt findet;
     bei uneindeutigem Ergebnis, oder wenn nicht gefunden, tritt ein Fehler auf.
+
+    Die erzeugte Funktion hat als Attribut find_many eine Begleitfunktion,
+    die eine ganze Liste von UIDs mit einer einzigen Katalogsuche auflöst
+    und alle fehlenden und mehrdeutigen UIDs auf einmal meldet (siehe dort);
+    die weitere Option strict gibt hierfür den Vorgabewert an.
+    Mit many=True wird (als Abkürzung) direkt find_many zurückgegeben.
+
+    >>> from visaplan.plone.tools.mock import MockBrain, MockLogger
+    >>> def catalog(query):
+    ...     return [MockBrain(UID=uid)
+    ...             for uid in query['UID']
+    ...             for i in range({'a1': 1, 'b2': 1, 'c3': 2}.get(uid, 0))]
+    >>> logger = MockLogger()
+    >>> find_many = make_distinct_finder(catalog=catalog, logger=logger,
+    ...                                  many=True)
+    >>> found, missing, ambiguous = find_many(['a1', 'b2', 'c3', 'd4', 'a1'])
+    >>> sorted(found)
+    ['a1', 'b2']
+    >>> missing
+    ['d4']
+    >>> sorted(ambiguous.items())
+    [('c3', [<a brain>, <a brain>])]
+    >>> find_one = make_distinct_finder(catalog=catalog, logger=logger)
+    >>> find_one.find_many(['b2'])[0]
+    {'b2': <a brain>}
+
+    Mit strict=True werden alle Probleme auf einmal gemeldet:
+    >>> find_many(['a1', 'c3', 'd4', 'e5'], strict=True)
+    Traceback (most recent call last):
+    ...
+    ValueError: 2 of 4 UIDs not found (d4, e5); 1 UIDs ambiguous (c3)
     """
     if 'catalog' not in kwargs:
         context = kwargs.pop('context')
@@ -43,6 +77,8 @@ def make_distinct_finder(**kwargs):
     else:
         catalog = kwargs.pop('catalog')
     logger = kwargs.pop('logger')
+    many = kwargs.pop('many', False)
+    strict = kwargs.pop('strict', False)
 
     def find_one(**kwargs):
         """
@@ -66,6 +102,62 @@ def make_distinct_finder(**kwargs):
                              locals())
         return brains[0]
 
+    def find_many(uids, strict=strict):
+        """
+        Finde die Objekte zu allen übergebenen UIDs mit *einer* Katalogsuche
+        und gib ein 3-Tupel (found, missing, ambiguous) zurück:
+
+        found -- ein Dict {uid: brain} der eindeutig gefundenen Objekte
+        missing -- eine sortierte Liste der nicht gefundenen UIDs
+        ambiguous -- ein Dict {uid: [brain, ...]} der mehrfach gefundenen UIDs
+
+        uids -- eine Sequenz von UIDs, oder ein String (wird an Leerraum
+                aufgeteilt); Mehrfachnennungen sind unschädlich
+        strict -- wenn True, wird ein ValueError geworfen, sofern UIDs fehlen
+                  oder mehrdeutig sind; der Text nennt dann *alle* Probleme
+        """
+        if isinstance(uids, six_string_types):
+            uids = uids.split()
+        wanted = set(uids)
+        hits = defaultdict(list)
+        if wanted:
+            for brain in catalog({'UID': sorted(wanted)}):
+                hits[brain.UID].append(brain)
+        found = {}
+        ambiguous = {}
+        for uid, brains in hits.items():
+            if brains[1:]:
+                ambiguous[uid] = brains
+            else:
+                found[uid] = brains[0]
+        missing = sorted(wanted.difference(hits))
+
+        total = len(wanted)
+        found_count = len(found)
+        logger.info('find_many: %(found_count)d of %(total)d UIDs found',
+                    locals())
+        problems = []
+        if missing:
+            missing_count = len(missing)
+            missing_txt = ', '.join(missing)
+            logger.error('%(missing_count)d of %(total)d UIDs not found:'
+                         ' %(missing_txt)s', locals())
+            problems.append('%(missing_count)d of %(total)d UIDs not found'
+                            ' (%(missing_txt)s)' % locals())
+        if ambiguous:
+            ambiguous_count = len(ambiguous)
+            ambiguous_txt = ', '.join(sorted(ambiguous))
+            logger.error('%(ambiguous_count)d UIDs ambiguous:'
+                         ' %(ambiguous_txt)s', locals())
+            problems.append('%(ambiguous_count)d UIDs ambiguous'
+                            ' (%(ambiguous_txt)s)' % locals())
+        if problems and strict:
+            raise ValueError('; '.join(problems))
+        return found, missing, ambiguous
+
+    find_one.find_many = find_many
+    if many:
+        return find_many
     return find_one
 
 
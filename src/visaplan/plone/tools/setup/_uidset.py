@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*- äöü vim: sw=4 sts=4 et tw=79
+"""
+Tools für Produkt-Setup (Migrationsschritte, "upgrade steps"): _uidset
+
+Compact sets of UIDs, e.g. for the done_sets of make_transition_applicator
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+from six import ensure_str
+
+# Standard library:
+from binascii import hexlify, unhexlify
+from sys import getsizeof
+
+# visaplan:
+from visaplan.tools.classes import DictOfSets
+
+# Local imports:
+from visaplan.plone.tools.functions import is_uid_shaped
+
+__all__ = [
+        'UidSet',
+        'DictOfUidSets',
+        ]
+
+KEYSIZE = 16  # a UID (32 hex digits) packed to binary
+
+
+class UidSet(object):
+    """
+    A set of UIDs which stores them in a compact binary form:
+    each UID-shaped string is packed to 16 bytes and kept in a sorted buffer
+    which is searched by bisection; fresh additions are collected in a small
+    "pending" set which is merged into the buffer from time to time.
+
+    Other strings (e.g. 'root') are accepted as well; they are stored as they
+    are.
+
+    >>> uids = UidSet(['0123456789abcdef0123456789abcdef'])
+    >>> uids.add('fedcba9876543210fedcba9876543210')
+    >>> uids.add('0123456789abcdef0123456789abcdef')
+    >>> uids.add('root')
+    >>> len(uids)
+    3
+    >>> '0123456789abcdef0123456789abcdef' in uids
+    True
+    >>> 'fedcba9876543210fedcba9876543210' in uids
+    True
+    >>> 'root' in uids
+    True
+    >>> '00000000000000000000000000000000' in uids
+    False
+    >>> sorted(uids)
+    ['0123456789abcdef0123456789abcdef', 'fedcba9876543210fedcba9876543210', 'root']
+
+    Upper-case hex digits don't make a UID; thus, such strings are stored
+    as they are, and they are not considered equal to the lower-case variant:
+    >>> 'FEDCBA9876543210FEDCBA9876543210' in uids
+    False
+
+    The pending additions are merged into the sorted buffer when they exceed
+    a certain limit, or when requested explicitly:
+    >>> uids.compact()
+    >>> len(uids._pending)
+    0
+    >>> len(uids._packed) // KEYSIZE
+    2
+    >>> sorted(uids) == sorted(UidSet(uids))
+    True
+
+    The memory use (in bytes) is estimated by the memory_usage method;
+    for many UIDs, it is a fraction of that of a set of strings:
+    >>> many = ['%032x' % (i * 7919) for i in range(10000)]
+    >>> compact = UidSet(many)
+    >>> len(compact)
+    10000
+    >>> compact.memory_usage() * 5 < _set_memory_usage(set(many))
+    True
+    """
+
+    def __init__(self, iterable=None, pending_limit=1024):
+        self._packed = b''
+        self._pending = set()
+        self._other = set()
+        self._pending_limit = pending_limit
+        if iterable is not None:
+            self.update(iterable)
+
+    def _packed_index(self, key, lo=0):
+        """
+        Return the insertion index of the given packed key
+        """
+        buf = self._packed
+        hi = len(buf) // KEYSIZE
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = mid * KEYSIZE
+            if buf[start:start+KEYSIZE] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _in_packed(self, key):
+        buf = self._packed
+        start = self._packed_index(key) * KEYSIZE
+        return buf[start:start+KEYSIZE] == key
+
+    def add(self, uid):
+        if not is_uid_shaped(uid, onerror=False):
+            self._other.add(uid)
+            return
+        key = unhexlify(uid)
+        pending = self._pending
+        if key in pending or self._in_packed(key):
+            return
+        pending.add(key)
+        if len(pending) > max(self._pending_limit,
+                              len(self._packed) // (KEYSIZE * 8)):
+            self.compact()
+
+    def update(self, iterable):
+        """
+        Add many UIDs at once; they are merged into the sorted buffer
+        in a single pass.
+        """
+        pending = self._pending
+        for uid in iterable:
+            if is_uid_shaped(uid, onerror=False):
+                pending.add(unhexlify(uid))
+            else:
+                self._other.add(uid)
+        self.compact()
+
+    def compact(self):
+        """
+        Merge the pending additions into the sorted buffer
+        """
+        pending = self._pending
+        if not pending:
+            return
+        buf = self._packed
+        out = bytearray()
+        pos = 0
+        idx = 0
+        for key in sorted(pending):
+            idx = self._packed_index(key, idx)
+            start = idx * KEYSIZE
+            out.extend(buf[pos:start])
+            pos = start
+            if buf[start:start+KEYSIZE] != key:  # (from update)
+                out.extend(key)
+        out.extend(buf[pos:])
+        self._packed = bytes(out)
+        pending.clear()
+
+    def __contains__(self, uid):
+        if not is_uid_shaped(uid, onerror=False):
+            return uid in self._other
+        key = unhexlify(uid)
+        return key in self._pending or self._in_packed(key)
+
+    def __iter__(self):
+        buf = self._packed
+        for start in range(0, len(buf), KEYSIZE):
+            yield ensure_str(hexlify(buf[start:start+KEYSIZE]))
+        for key in list(self._pending):
+            yield ensure_str(hexlify(key))
+        for uid in list(self._other):
+            yield uid
+
+    def __len__(self):
+        return (len(self._packed) // KEYSIZE
+                + len(self._pending)
+                + len(self._other))
+
+    def __repr__(self):
+        return '<%s (%d UIDs)>' % (self.__class__.__name__, len(self))
+
+    def memory_usage(self):
+        """
+        Estimated memory use in bytes
+        """
+        return (getsizeof(self._packed)
+                + _set_memory_usage(self._pending)
+                + _set_memory_usage(self._other))
+
+
+def _set_memory_usage(theset):
+    """
+    Estimated memory use of a set of strings, in bytes
+    """
+    return getsizeof(theset) + sum(getsizeof(item) for item in theset)
+
+
+class DictOfUidSets(DictOfSets):
+    """
+    A DictOfSets (see visaplan.tools.classes) which contains UidSets
+
+    >>> done = DictOfUidSets(keys=['published', 'visible'])
+    >>> done.add('0123456789abcdef0123456789abcdef', 'visible')
+    >>> done.first_hit('0123456789abcdef0123456789abcdef')
+    'visible'
+    >>> done.first_hit('0123456789abcdef0123456789abcdef', 'published')
+    >>> done['restricted']
+    <UidSet (0 UIDs)>
+    >>> done.ordered_keys()
+    ['published', 'visible', 'restricted']
+    >>> len(done)
+    1
+    >>> done.memory_usage() > 0
+    True
+    """
+
+    def _add_set(self, key):
+        key = self._check_key(key)
+        tmp = UidSet()
+        dict.__setitem__(self, key, tmp)
+        thelist = self._ordered_keys
+        if key not in thelist:
+            thelist.append(key)
+        return tmp
+
+    def add_set(self, key):
+        key = self._check_key(key)
+        if not dict.__contains__(self, key):
+            dict.__setitem__(self, key, UidSet())
+        thelist = self._ordered_keys
+        if key not in thelist:
+            thelist.append(key)
+
+    def memory_usage(self):
+        """
+        Estimated memory use of all contained sets, in bytes
+        """
+        return sum(theset.memory_usage()
+                   for theset in self.values())
+
+
+if __name__ == '__main__':
+    # Standard library:
+    import doctest
+    doctest.testmod()
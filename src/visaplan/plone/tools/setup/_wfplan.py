@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*- äöü vim: sw=4 sts=4 et tw=79
+"""
+Tools für Produkt-Setup (Migrationsschritte, "upgrade steps"): _wfplan
+
+Precompiled, resumable workflow transition plans:
+
+1. make_transition_applicator(plan_file=...) decides as usual
+   but writes the planned changes to a file (one JSON object per line)
+   instead of applying them;
+2. execute_transition_plan applies such a plan in batches,
+   recording the progress, so it can be resumed after an interruption.
+"""
+
+# Python compatibility:
+from __future__ import absolute_import
+
+# Standard library:
+import json
+import os
+from collections import Counter
+from time import time
+
+# Zope:
+import transaction
+from Products.CMFCore.utils import getToolByName
+from Products.CMFCore.WorkflowCore import WorkflowException
+
+# Local imports:
+from visaplan.plone.tools.setup._roles import (
+    SecurityReindexScheduler,
+    set_local_roles,
+    )
+from visaplan.plone.tools.setup._misc import read_json_lines
+from visaplan.plone.tools.setup._uid import make_distinct_finder
+
+# Logging / Debugging:
+import logging
+
+__all__ = [
+        'make_plan_writer',  # used by make_transition_applicator
+        'execute_transition_plan',
+        ]
+
+
+def make_plan_writer(fileobj):
+    """
+    Erzeuge eine Funktion, die eine geplante Änderung als JSON-Zeile
+    in das übergebene (zum Schreiben geöffnete) Dateiobjekt schreibt.
+
+    >>> from six.moves import StringIO
+    >>> from visaplan.plone.tools.mock import MockBrain
+    >>> f = StringIO()
+    >>> write = make_plan_writer(f)
+    >>> brain = MockBrain(UID='0123456789abcdef0123456789abcdef',
+    ...                   portal_type='Document')
+    >>> brain.getPath = lambda: '/plone/some/doc'
+    >>> write(brain, 'visible', 'published', transition='make_public')
+    >>> print(f.getvalue().strip())     # doctest: +NORMALIZE_WHITESPACE
+    {"current": "visible", "path": "/plone/some/doc",
+     "portal_type": "Document", "target": "published",
+     "transition": "make_public", "uid": "0123456789abcdef0123456789abcdef"}
+    """
+    def write_planned(brain, current_state, target_state, **kwargs):
+        record = {
+            'uid': brain.UID,
+            'path': brain.getPath(),
+            'portal_type': brain.portal_type,
+            'current': current_state,
+            'target': target_state,
+            }
+        record.update(kwargs)
+        fileobj.write(json.dumps(record, sort_keys=True) + '\n')
+
+    return write_planned
+
+
+def _read_progress(progress_file):
+    """
+    Return the number of plan records which are known to be done
+    """
+    if not os.path.exists(progress_file):
+        return 0
+    with open(progress_file) as f:
+        return int(f.read().strip() or 0)
+
+
+def _write_progress(progress_file, done):
+    tmp = progress_file + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write('%d\n' % done)
+    os.rename(tmp, progress_file)
+
+
+def execute_transition_plan(context, filename, **kwargs):
+    """
+    Führe einen (durch make_transition_applicator(plan_file=...) erzeugten)
+    Transitionsplan aus und gib einen Counter mit Statistiken zurück.
+
+    Die Objekte werden batchweise (mit je einer Katalogsuche) ermittelt;
+    nach jedem Batch wird die Transaktion abgeschlossen und der Fortschritt in
+    der <progress_file> vermerkt.  Ein erneuter Aufruf setzt die Arbeit dort
+    fort; da vor jeder Änderung der aktuelle Zustand geprüft wird, schadet es
+    nicht, wenn ein Batch (nach einem Abbruch zur Unzeit) nochmals
+    verarbeitet wird.
+
+    Benannte Argumente:
+
+    logger - der zu verwendende Logger
+    batch_size - Anzahl der Planeinträge je Transaktion (Vorgabe: 100)
+    progress_file - Datei, in der die Anzahl der erledigten Planeinträge
+                    gespeichert wird (Vorgabe: <filename>.progress)
+    restart - die <progress_file> ignorieren und von vorn beginnen
+    limit - für Test/Entwicklung: max. Anzahl zu verarbeitender Planeinträge
+    dry_run - nichts ändern, sondern nur zählen (Transitionen, Umschaltungen
+              der Berechtigungs-Akquisition, lokale Rollen; noch offene
+              Einträge)
+    """
+    pop = kwargs.pop
+    logger = pop('logger', None)
+    if logger is None:
+        logger = logging.getLogger('execute_transition_plan')
+    batch_size = pop('batch_size', 100)
+    progress_file = pop('progress_file', None) or filename + '.progress'
+    restart = pop('restart', False)
+    limit = pop('limit', None)
+    dry_run = pop('dry_run', False)
+    if kwargs:
+        logger.error('execute_transition_plan: unused arguments! (%(kwargs)r)',
+                     locals())
+
+    counter = Counter()
+    skip = 0 if restart else _read_progress(progress_file)
+    for record in read_json_lines(filename):
+        counter['records'] += 1
+        if counter['records'] <= skip:
+            continue
+        counter['remaining'] += 1
+        if record.get('transition'):
+            counter['transition:' + record['transition']] += 1
+        if record.get('inherit') is not None:
+            counter['inherit'] += 1
+        if record.get('localroles'):
+            counter['localroles'] += 1
+    remaining = counter['remaining']
+    total = counter['records']
+    logger.info('%(filename)s: %(total)d records, %(skip)d done,'
+                ' %(remaining)d remaining', locals())
+    if dry_run:
+        for key, val in sorted(counter.items()):
+            logger.info('  %(key)s: %(val)d', locals())
+        return counter
+
+    find_many = make_distinct_finder(context=context, logger=logger,
+                                     many=True)
+    wft = getToolByName(context, 'portal_workflow')
+    # one security reindex per subtree and batch:
+    scheduler = SecurityReindexScheduler(logger=logger)
+    done = skip
+    started = time()
+    batch = []
+
+    def process_batch(batch):
+        found, missing, ambiguous = find_many([record['uid']
+                                               for record in batch])
+        counter['missing'] += len(missing) + len(ambiguous)
+        for record in batch:
+            brain = found.get(record['uid'])
+            if brain is not None:
+                _apply_planned(brain, record, wft, counter, logger,
+                               scheduler)
+        counter['security_reindexed'] += scheduler.flush()
+
+    try:
+        for record in read_json_lines(filename, skip):
+            if limit is not None and done - skip + len(batch) >= limit:
+                logger.info('limit of %(limit)d records reached', locals())
+                break
+            batch.append(record)
+            if len(batch) >= batch_size:
+                process_batch(batch)
+                done += len(batch)
+                batch = []
+                transaction.commit()
+                _write_progress(progress_file, done)
+                this_run = done - skip
+                eta = (time() - started) * (total - done) / this_run
+                logger.info('%(done)d/%(total)d records done;'
+                            ' about %(eta)d seconds to go', locals())
+        if batch:
+            process_batch(batch)
+            done += len(batch)
+            transaction.commit()
+            _write_progress(progress_file, done)
+    finally:
+        for key, val in sorted(counter.items()):
+            logger.info('  %(key)s: %(val)d', locals())
+    return counter
+
+
+def _apply_planned(brain, record, wft, counter, logger, scheduler):
+    """
+    Helper for execute_transition_plan: process one plan record
+    """
+    uid = record['uid']
+    current_state = brain.review_state
+    target_state = record['target']
+    transition = record.get('transition')
+    o = None
+    if transition and current_state != target_state:
+        if current_state != record['current']:
+            planned_state = record['current']
+            logger.error('%(uid)r: state is %(current_state)r,'
+                         ' but %(planned_state)r was planned;'
+                         ' skipping %(transition)r', locals())
+            counter['stale'] += 1
+        else:
+            o = brain.getObject()
+            try:
+                wft.doActionFor(o, transition)
+            except WorkflowException as e:
+                logger.error('%(uid)r %(o)r, Transition %(transition)r:'
+                             ' %(e)r', locals())
+                counter['errors'] += 1
+            else:
+                counter['transitions'] += 1
+    inherit = record.get('inherit')
+    if inherit is not None:
+        if o is None:
+            o = brain.getObject()
+        sharing = o.restrictedTraverse('@@sharing')
+        if sharing.update_inherit(inherit, reindex=False):
+            scheduler.schedule(o)
+            counter['inherit_changed'] += 1
+    thelist = record.get('localroles')
+    if thelist:
+        if set_local_roles(brain=brain, o=o, thelist=thelist,
+                           security_scheduler=scheduler,
+                           logger=logger):
+            counter['localroles_changed'] += 1
@@ -20,7 +20,9 @@ from visaplan.tools.classes import DictOfSets
 
 # Local imports:
 from visaplan.plone.tools.setup._roles import set_local_roles
+from visaplan.plone.tools.setup._uidset import DictOfUidSets
 from visaplan.plone.tools.setup._watch import make_watcher_function
+from visaplan.plone.tools.setup._wfplan import make_plan_writer
 
 # Logging / Debugging:
 import logging
@@ -51,6 +53,95 @@ for from_state, to_state, tr in (
     ('published',  'published',  None),
     ):
     TRANSITIONS_MAP[(from_state, to_state)] = tr
+
+
+def make_transitions_lookup(wft):
+    """
+    Erzeuge eine Funktion, die für einen Workflow-Status die Transitionen
+    liefert, die in *irgendeinem* Workflow des Workflow-Tools von diesem
+    Status aus definiert sind (als frozenset); ermittelt beim ersten Aufruf.
+
+    Die Workflow-Ketten der portal_types werden bewußt nicht verwendet:
+    mit platzabhängigen Workflow-Richtlinien (CMFPlacefulWorkflow) hängt die
+    Kette eines Objekts von seinem Ort ab.  Die Guards der Transitionen
+    (Berechtigungen, Bedingungen) werden ebenfalls nicht berücksichtigt;
+    das Ergebnis taugt also nur dazu, Transitionen zu verwerfen, die für
+    kein Objekt in diesem Status in Frage kommen.
+
+    >>> class Obj(object):
+    ...     def __init__(self, **kw):
+    ...         self.__dict__.update(kw)
+    >>> class Container(dict):
+    ...     def objectValues(self):
+    ...         return list(self.values())
+    >>> wf1 = Obj(states=Container(
+    ...               restricted=Obj(id='restricted',
+    ...                              transitions=('make_visible',)),
+    ...               visible=Obj(id='visible',
+    ...                           transitions=('make_restricted_again',
+    ...                                        'retract'))),
+    ...           transitions=Container(
+    ...               make_visible=Obj(new_state_id='visible'),
+    ...               make_restricted_again=Obj(new_state_id='restricted'),
+    ...               retract=Obj(new_state_id='')))
+    >>> wf2 = Obj(states=Container(
+    ...               restricted=Obj(id='restricted',
+    ...                              transitions=('make_public',))),
+    ...           transitions=Container(
+    ...               make_public=Obj(new_state_id='published')))
+    >>> WORKFLOWS = {'wf1': wf1, 'wf2': wf2}
+    >>> class MockWorkflowTool(object):
+    ...     calls = 0
+    ...     def getWorkflowIds(self):
+    ...         self.calls += 1
+    ...         return sorted(WORKFLOWS)
+    ...     def getWorkflowById(self, wf_id):
+    ...         return WORKFLOWS[wf_id]
+    >>> wft = MockWorkflowTool()
+    >>> transitions_for = make_transitions_lookup(wft)
+    >>> sorted(transitions_for('restricted'))
+    ['make_public', 'make_visible']
+    >>> sorted(transitions_for('visible'))
+    ['make_restricted_again', 'retract']
+    >>> len(transitions_for('published'))
+    0
+    >>> wft.calls
+    1
+
+    Workflows which don't provide states and transitions like DCWorkflow
+    can't be checked in advance; if there is any of them, None is returned:
+    >>> WORKFLOWS['wf3'] = Obj()
+    >>> make_transitions_lookup(wft)('visible')
+    """
+    cache = []
+
+    def all_transitions():
+        res = {}
+        for wf_id in wft.getWorkflowIds():
+            wf = wft.getWorkflowById(wf_id)
+            states = getattr(wf, 'states', None)
+            transitions = getattr(wf, 'transitions', None)
+            if states is None or transitions is None:
+                return None
+            for state in states.objectValues():
+                ids = res.setdefault(state.id, set())
+                for tr_id in state.transitions:
+                    if transitions.get(tr_id) is not None:
+                        ids.add(tr_id)
+        return dict([(state_id, frozenset(ids))
+                     for state_id, ids in res.items()])
+
+    def transitions_for(state_id):
+        if not cache:
+            cache.append(all_transitions())
+        res = cache[0]
+        if res is None:
+            return None
+        return res.get(state_id, frozenset())
+
+    return transitions_for
+
+
 def make_transition_applicator(**kwargs):  # ---- [ m._t._a. ... [ -[[
     """
     Erzeuge eine Funktion, die den Workflow-Status eines als brain übergebenes
@@ -114,9 +205,38 @@ def make_transition_applicator(**kwargs):  # ---- [ m._t._a. ... [ -[[
     - regard_current - soll eine Transition als erfolgreich betrachtet werden
                        (insbesondere incl. der <done_sets>), wenn (ungeachtet
                        etwaiger Fehler) das Ergebnis stimmt?
+    - compact_sets - die internen Sets (<target_sets>, <done_sets>) als
+                     kompakte UidSets führen (siehe DictOfUidSets), was bei
+                     Millionen von UIDs viel Speicher spart; Vorgabe: False
     - shortcircuit - Transition von vornherein nicht versuchen, wenn der
                      Zielstatus schon vorliegt. Kann viel Zeit sparen,
                      insbesondere bei Medien mit Vorschaubildern!
+                     Mit shortcircuit=2 werden für solche (und lt. den
+                     <done_sets> schon erledigte) Objekte auch die
+                     Berechtigungs-Akquisition (set_inherit) und die lokalen
+                     Rollen (localroles_function) nicht mehr geprüft;
+                     diese Objekte werden dann überhaupt nicht geladen.
+    - plan_file - ein zum Schreiben geöffnetes Dateiobjekt; wenn angegeben,
+                  wird nichts geändert, sondern es werden die geplanten
+                  Änderungen (Transition, Berechtigungs-Akquisition, lokale
+                  Rollen) als JSON-Zeilen geschrieben, zur späteren
+                  Ausführung durch --> execute_transition_plan.
+                  Die Objekte werden hierbei nicht geladen; die <done_sets>
+                  werden geführt, als wären die Transitionen erfolgt.
+    - security_scheduler - ein SecurityReindexScheduler (siehe dort); wenn
+                  angegeben, werden Objekte mit geänderten lokalen Rollen
+                  oder geänderter Berechtigungs-Akquisition dort vorgemerkt,
+                  statt sofort samt Teilbaum reindiziert zu werden.
+                  Der Aufrufer muß dann (z. B. vor jedem Commit)
+                  security_scheduler.flush() aufrufen!
+
+    - context - wenn angegeben, wird das Workflow-Tool schon hier ermittelt
+                (sonst beim ersten Objekt, über dessen brain); jedenfalls
+                werden die in den Workflows möglichen Transitionen je Status
+                nur einmal ermittelt (--> make_transitions_lookup), und
+                Transitionen, die für den (lt. Katalog) aktuellen Status in
+                keinem Workflow definiert sind, werden verworfen, ohne das
+                Objekt zu laden.  Ansonsten entscheidet doActionFor.
 
     Debugging-Optionen:
 
@@ -135,10 +255,15 @@ def make_transition_applicator(**kwargs):  # ---- [ m._t._a. ... [ -[[
     """
     # ]]------ [ make_transition_applicator: Argumente ... [
     status_set = defaultdict(set)
-    target_sets = DictOfSets()
+    compact_sets = kwargs.pop('compact_sets', False)
+    if compact_sets:
+        factory = DictOfUidSets
+    else:
+        factory = DictOfSets
+    target_sets = factory()
     status_func = {}
     # Behandlung schon erledigter ...
-    done_sets = DictOfSets()
+    done_sets = factory()
     force = kwargs.pop('force', False)
     shortcircuit = kwargs.pop('shortcircuit', True)
 
@@ -168,9 +293,12 @@ def make_transition_applicator(**kwargs):  # ---- [ m._t._a. ... [ -[[
                                  % locals())
             else:
                 theset = set()
+        elif compact_sets:
+            pass  # we don't keep a copy of the given sequence
         elif not isinstance(theset, set):
             theset = set(theset)
-        status_set[target_state] = theset
+        if not compact_sets:
+            status_set[target_state] = theset
         target_sets[target_state].update(theset)
         status_func[target_state] = func
     set_best_status = kwargs.pop('set_best_status', bool(uids_tuples))
@@ -210,6 +338,19 @@ def make_transition_applicator(**kwargs):  # ---- [ m._t._a. ... [ -[[
     localroles_function = kwargs.pop('localroles_function', None)
     # ---------------------- ] ... Lokale Rollen ]
 
+    security_scheduler = kwargs.pop('security_scheduler', None)
+    # Workflow-Tool und Transitionen je portal_type, siehe unten (wf_info):
+    wf_info = {}
+    context = kwargs.pop('context', None)
+    if context is not None:
+        wf_info['wft'] = wft = getToolByName(context, 'portal_workflow')
+        wf_info['transitions_for'] = make_transitions_lookup(wft)
+    plan_file = kwargs.pop('plan_file', None)
+    if plan_file is not None:
+        plan_writer = make_plan_writer(plan_file)
+    else:
+        plan_writer = None
+
     # ---------- [ für Debugging (set_trace) ... [
     if 'watched_uid_and_status' in kwargs:
         tup = kwargs.pop('watched_uid_and_status')
@@ -279,6 +420,9 @@ def make_transition_applicator(**kwargs):  # ---- [ m._t._a. ... [ -[[
                         has_hits = True
                         line += '; contains '+ ', '.join(contains)
                     info.append(line)
+                if compact_sets:
+                    kb = dos.memory_usage() // 1024
+                    info.append('%(kb)7d kB' % locals())
         if info:
             info.insert(0, '')
             info.append('')
@@ -335,7 +479,12 @@ def make_transition_applicator(**kwargs):  # ---- [ m._t._a. ... [ -[[
         set_best_status - Vorgabewert siehe oben
         shortcircuit - wenn der aktuelle schon dem Zielstatus entspricht,
                        die Aktion als erfolgreich durchgeführt betrachten
-                       (wenn auch ohne Änderungen)
+                       (wenn auch ohne Änderungen);
+                       2: siehe oben
+
+        Das Objekt wird erst geladen (brain.getObject()), wenn es für eine
+        Transition, die Berechtigungs-Akquisition oder die lokalen Rollen
+        wirklich benötigt wird.
         """
         # TODO: add_viewers_group, für restricted:
         # - auch, wenn Status schon 'restricted' ist (Reparatur)
@@ -344,6 +493,9 @@ def make_transition_applicator(**kwargs):  # ---- [ m._t._a. ... [ -[[
         changed = False
         target_ok = True
         done = False
+        # Zielstatus liegt schon vor bzw. lt. done_sets erledigt:
+        untouched = False
+        planned = {}  # für den <plan_file>
         o = None
         uid = brain.UID
         if target_state is None:
@@ -374,7 +526,6 @@ def make_transition_applicator(**kwargs):  # ---- [ m._t._a. ... [ -[[
                        # oder es gab zumindest einen Vorgabewert:
             and target_state is not None
             ):
-            o = brain.getObject()
             # Es werden die Statuus geordnet überprüft;
             # was schon auf 'published' gesetzt wurde, braucht für 'published',
             # 'visible' und etwaige weitere nicht mehr berücksichtigt zu
@@ -389,6 +540,7 @@ def make_transition_applicator(**kwargs):  # ---- [ m._t._a. ... [ -[[
                             locals())
                 if not force:
                     done = True  # set_inherit ist davon unabhängig
+                    untouched = True
 
             # ---- [ nicht erledigt lt. done-Sets ... [
             if not done:
@@ -402,6 +554,7 @@ def make_transition_applicator(**kwargs):  # ---- [ m._t._a. ... [ -[[
                         changed, target_ok = False, True
                         done_sets.add(uid, target_state)
                         doit = False
+                        untouched = True
                         pt = brain.portal_type
                         logger.info('%(uid)r %(pt)r (%(current_state)r): '
                                     'Keine Aktion erforderlich',
@@ -413,13 +566,13 @@ def make_transition_applicator(**kwargs):  # ---- [ m._t._a. ... [ -[[
                         transition = TRANSITIONS_MAP[(current_state, target_state)]
                     except KeyError:
                         if regard_current and (current_state == target_state):
-                            logger.info('%(o)r: keine Transition %(current_state)r --> %(target_state)r,'
+                            logger.info('%(uid)r: keine Transition %(current_state)r --> %(target_state)r,'
                                         'aber der Zielstatus stimmt schon',
                                          locals())
                             changed, target_ok = None, True
                             done_sets.add(uid, target_state)
                         else:
-                            logger.error('%(o)r: keine Transition %(current_state)r --> %(target_state)r bekannt!',
+                            logger.error('%(uid)r: keine Transition %(current_state)r --> %(target_state)r bekannt!',
                                          locals())
                             if returns == 'error':
                                 raise
@@ -436,16 +589,46 @@ def make_transition_applicator(**kwargs):  # ---- [ m._t._a. ... [ -[[
                 # --------------- [ WF-Transition ... [
                 if doit is None:
                     doit = doit_function(brain, target_state)
+                rejected = False
+                if doit and not wf_info:
+                    wf_info['wft'] = wft = getToolByName(brain,
+                                                         'portal_workflow')
+                    wf_info['transitions_for'] = make_transitions_lookup(wft)
                 if doit:
+                    pt = brain.portal_type
+                    available = wf_info['transitions_for'](current_state)
+                    if available is not None and transition not in available:
+                        # ohne das Objekt zu laden verworfen:
+                        doit = False
+                        rejected = True
+                        if regard_current and (current_state == target_state):
+                            logger.info('%(uid)r %(pt)r: Transition'
+                                        ' %(transition)r nicht verfügbar,'
+                                        ' aber der Zielstatus'
+                                        ' %(target_state)r stimmt schon',
+                                         locals())
+                            changed, target_ok = False, True
+                            done_sets.add(uid, target_state)
+                        else:
+                            logger.error('%(uid)r %(pt)r (%(current_state)r):'
+                                         ' Transition %(transition)r'
+                                         ' nicht verfügbar!',
+                                         locals())
+                            changed, target_ok = False, False
+                if doit and plan_writer is not None:
+                    # nur vormerken, siehe --> execute_transition_plan:
+                    planned['transition'] = transition
+                    done_sets.add(uid, target_state)
+                    changed, target_ok = True, True
+                elif doit:
                     if o is None:
                         o = brain.getObject()
                     if verbosity >= 2 or brain.portal_type == 'Folder':
                         logger.info('%(uid)r %(o)r (%(current_state)r):'
                                     ' %(transition)s) ...',
                                     locals())
-                    wft = getToolByName(o, 'portal_workflow')
                     try:
-                        res = wft.doActionFor(o, transition)
+                        res = wf_info['wft'].doActionFor(o, transition)
                     except WorkflowException as e:
                         if regard_current and (current_state == target_state):
                             logger.info('%(uid)r, Transition fehlgeschlagen,'
@@ -462,10 +645,13 @@ def make_transition_applicator(**kwargs):  # ---- [ m._t._a. ... [ -[[
                         if verbosity >= 1:
                             logger.info('%(uid)r %(o)r, %(transition)s: OK', locals())
                         changed, target_ok = True, True
-                else:
+                elif not rejected:
                     o = None
                     changed, target_ok = None, False
                 # --------------- ] ... WF-Transition ]
+            if untouched and shortcircuit >= 2:
+                # kein Grund, das Objekt zu laden:
+                set_inherit = localroles_function = None
             # --- [ Berechtigungs-Akquisition ... [
             if set_inherit is not None:
                 if set_inherit == 'auto':
@@ -477,7 +663,9 @@ def make_transition_applicator(**kwargs):  # ---- [ m._t._a. ... [ -[[
                         set_inherit = True
                     else:
                         set_inherit = False
-                if set_inherit is not None:
+                if set_inherit is not None and plan_writer is not None:
+                    planned['inherit'] = set_inherit
+                elif set_inherit is not None:
                     if o is None:
                         o = brain.getObject()
                     sharing = o.restrictedTraverse('@@sharing')
@@ -485,7 +673,14 @@ def make_transition_applicator(**kwargs):  # ---- [ m._t._a. ... [ -[[
                     logger.info('%(uid)r %(o)r (-> %(target_state)r): '
                                 '%(act_)s permission inheritance ...',
                                 locals())
-                    if sharing.update_inherit(set_inherit):
+                    if security_scheduler is None:
+                        inherit_changed = sharing.update_inherit(set_inherit)
+                    else:
+                        inherit_changed = sharing.update_inherit(set_inherit,
+                                                                 reindex=False)
+                        if inherit_changed:
+                            security_scheduler.schedule(o)
+                    if inherit_changed:
                         changed = True
                         logger.info('%(uid)r %(o)r (-> %(target_state)r): '
                                     'permission inheritance %(act_)sd',
@@ -495,13 +690,20 @@ def make_transition_applicator(**kwargs):  # ---- [ m._t._a. ... [ -[[
                                     'permission inheritance not changed',
                                     locals())
             # --- ] ... Berechtigungs-Akquisition ]
-            if localroles_function is not None:
+            if localroles_function is not None and plan_writer is not None:
+                thelist = localroles_function(brain, target_state)
+                if thelist:
+                    planned['localroles'] = [list(tup) for tup in thelist]
+            elif localroles_function is not None:
                 if set_local_roles(brain=brain, o=o,
                                    func=localroles_function,
                                    target_state=target_state,
+                                   security_scheduler=security_scheduler,
                                    logger=logger):
                     changed = True
             # ---- ] ... <transition> ist nun gesetzt ]
+            if planned:
+                plan_writer(brain, current_state, target_state, **planned)
         # ----------------------- ] ... Zielstatus bekannt ]
 
         if returns == 'target':